@@ -0,0 +1,231 @@
+'''
+Intra-file parallelism for the huge line based RDF files, shared by the Python miners.
+
+The miners parse every file in a single process, so a dump of tens of GB takes hours (or it is truncated).
+The line based files are split at line boundaries in chunks that can be parsed on their own:
+* N-Triples and N-Quads files: every line is a triple (common/ntriples_scanner.py)
+* Turtle files with all the prefixes in the header: the header (the @prefix, @base, PREFIX and BASE lines at
+  the beginning of the file) is added in front of every chunk and a chunk ends at the end of a statement (a
+  line ending with a dot, after its comment, followed by a line that does not start with a space). A Turtle
+  file that declares a prefix after the header, that has long (multi-line) strings or where no statement ends
+  near a split point is not split (it is mined as a whole, in streaming).
+
+The chunks are mined by a pool of processes and the results are returned in the order of the chunks, so
+the miner merges them (e.g. the files written for every chunk) in the order of the file. The triples of a
+chunk are the N-Triples strings of lightrdf (searchChunk): the blank nodes without a label get a label
+generated by the parser, that is renamed with the offset of the chunk so the chunks do not share them.
+'''
+
+import io
+import os
+import re
+import mmap
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+#the common modules are shared by all the phases
+from common.ntriples_scanner import isLineBased, nextLine, getChunks, iterTriples
+
+TURTLE_SUFFIXES = ["ttl"]
+
+#smallest file split in chunks
+MIN_CHUNKED_SIZE = 256 * 1024 ** 2
+
+#chunks for every worker, so a slow chunk does not leave the other workers without work
+CHUNKS_PER_WORKER = 4
+
+#biggest chunk, a Turtle chunk is read in memory by the parser
+MAX_CHUNK_SIZE = 256 * 1024 ** 2
+
+#maximum distance between the split point of a Turtle chunk and the end of the statement where the chunk ends
+MAX_BOUNDARY_SEARCH = 16 * 1024 ** 2
+
+#prefix of the labels generated by lightrdf for the blank nodes without a label
+GENERATED_BNODE = "_:riog"
+
+#prefix and base declarations, empty and comment lines at the beginning of a Turtle file
+HEADER_PATTERN = re.compile(rb"(?:[ \t\r]*(?:(?:@prefix|@base|(?i:prefix|base)[ \t])[^\n]*|#[^\n]*)?\n)*")
+
+#the part of a Turtle line before its comment: the # of the IRIs (e.g. rdf-schema#) and of the strings is
+#not the start of a comment
+CODE_PATTERN = re.compile(rb"""(?:<[^>\n]*>|"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*'|[^#<"'\n])*""")
+
+#a Turtle file with any of these strings after the header is not split: a prefix or base declaration (a line
+#that starts with PREFIX or BASE, or the strings found in a literal, are rejected too) or a long string
+UNSPLITTABLE = [b"@prefix", b"@base", b"\nPREFIX", b"\nprefix", b"\nBASE", b"\nbase", b'"""', b"'''"]
+
+"""
+@param: file_path, path to the RDF file
+@return True if the file is big enough to be split in chunks
+"""
+def isChunkable(file_path: str) -> bool:
+    return os.path.getsize(file_path) >= MIN_CHUNKED_SIZE
+
+"""
+@param: buffer, memory-mapped Turtle file
+@param: pos, byte offset of the beginning of a line
+@param: end, byte offset of the end of the file
+@return True if a statement ends before the line (and the line does not continue it)
+"""
+def isStatementBoundary(buffer, pos: int, end: int) -> bool:
+    if pos >= end or buffer[pos:pos + 1] in (b" ", b"\t", b"\r", b"\n"):
+        return False
+
+    previous_line = buffer[buffer.rfind(b"\n", 0, pos - 1) + 1:pos]
+
+    return CODE_PATTERN.match(previous_line).group().rstrip().endswith(b".")
+
+"""
+@param: file_path, path to the Turtle file
+@param: n_chunks, number of chunks
+@return (header, chunks) with the prefix declarations of the file and the (start, end) byte offsets of the
+        chunks, None if the file cannot be split (also when no statement ends near a split point)
+"""
+def splitTurtle(file_path: str, n_chunks: int) -> tuple:
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        header_end = HEADER_PATTERN.match(mm).end()
+
+        #every string is searched on its own (a search of a single literal string is much faster than a regex)
+        if any(mm.find(string, header_end) != -1 for string in UNSPLITTABLE):
+            return None
+
+        bounds = [header_end]
+
+        for i in range(1, n_chunks):
+            #the chunk ends at the end of the first statement that ends after its share of the file
+            split_point = max(header_end + (size - header_end) * i // n_chunks, bounds[-1] + 1)
+            bound = nextLine(mm, split_point - 1, size)
+            search_end = min(split_point + MAX_BOUNDARY_SEARCH, size)
+
+            while bound < search_end and not isStatementBoundary(mm, bound, size):
+                bound = nextLine(mm, bound, size)
+
+            if bound >= size:
+                break
+            if bound >= search_end:
+                #no statement ends near the split point, a chunk would be too big
+                return None
+            bounds.append(bound)
+
+        if len(bounds) == 1:
+            #a single chunk with the whole file, it is mined without reading it in memory
+            return None
+
+        bounds.append(size)
+        header = mm[:header_end]
+
+    return header, list(zip(bounds[:-1], bounds[1:]))
+
+"""
+@param: file_path, path to the RDF file
+@param: workers, number of processes that mine the chunks
+@return list of the (header, start, end) chunks of the file (header: bytes added in front of every chunk),
+        None if the file cannot be split
+"""
+def splitFile(file_path: str, workers: int) -> list:
+    size = os.path.getsize(file_path)
+    n_chunks = max(workers * CHUNKS_PER_WORKER, -(-size // MAX_CHUNK_SIZE), 1)
+
+    if isLineBased(file_path):
+        return [(b"", start, end) for start, end in getChunks(file_path, n_chunks)]
+
+    if file_path.rsplit(".", 1)[-1].lower() in TURTLE_SUFFIXES and size > 0:
+        split = splitTurtle(file_path, n_chunks)
+
+        if split is not None:
+            header, chunks = split
+            return [(header, start, end) for start, end in chunks]
+
+    return None
+
+"""
+@param: file_path, path to the RDF file
+@param: chunk, (header, start, end) chunk of the file
+@return bytes of the chunk, with the header in front
+"""
+def readChunk(file_path: str, chunk: tuple) -> bytes:
+    header, start, end = chunk
+
+    with open(file_path, "rb") as file:
+        file.seek(start)
+        return header + file.read(end - start)
+
+"""
+@param: triples, triples of a Turtle chunk
+@param: start, byte offset of the chunk
+@return generator of the triples with the generated blank node labels renamed with the offset of the chunk
+"""
+def renameBlankNodes(triples, start: int):
+    prefix = GENERATED_BNODE + str(start) + "_"
+
+    for triple in triples:
+        if GENERATED_BNODE in triple[0] or GENERATED_BNODE in triple[2]:
+            triple = tuple(prefix + term[len(GENERATED_BNODE):] if term.startswith(GENERATED_BNODE) else term
+                           for term in triple)
+        yield triple
+
+"""
+@param: file_path, path to the RDF file
+@param: chunk, (header, start, end) chunk of the file
+@return iterable of the triples of the chunk, as the N-Triples strings of lightrdf
+"""
+def searchChunk(file_path: str, chunk: tuple):
+    header, start, end = chunk
+
+    if isLineBased(file_path):
+        return iterTriples(file_path, start, end)
+
+    #the Turtle chunk is parsed in memory, with the prefixes of the header (lightrdf is needed only by the
+    #lightrdf miners)
+    import lightrdf
+    document = lightrdf.RDFDocument(io.BytesIO(readChunk(file_path, chunk)), parser=lightrdf.turtle.PatternParser)
+
+    return renameBlankNodes(document.search_triples(None, None, None), start)
+
+"""
+@param: function, function that mines a chunk (it must be defined at the top level of a module)
+@param: tasks, list with a tuple of picklable function arguments for every chunk
+@param: workers, number of processes (with a single worker the chunks are mined in the current process)
+@return list with the result of every chunk, in the order of the tasks
+"""
+def mineChunks(function, tasks: list, workers: int) -> list:
+    if workers <= 1 or len(tasks) <= 1:
+        return [function(*task) for task in tasks]
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        futures = [executor.submit(function, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+"""
+@param: paths, paths of the files written for the chunks, in the order of the chunks
+@param: output_path, path of the file where the files are appended (they are removed)
+"""
+def appendFiles(paths: list, output_path: str):
+    with open(output_path, "ab") as output:
+        for path in paths:
+            if os.path.exists(path):
+                with open(path, "rb") as file:
+                    shutil.copyfileobj(file, output, 16 * 1024 ** 2)
+                os.remove(path)
+
+"""
+@param: function, function(file_path, chunk_output_path, chunk) that mines a chunk and writes a file
+@param: file_path, path to the RDF file
+@param: chunks, list of the (header, start, end) chunks of the file
+@param: output_path, path of the file where the files of the chunks are appended in the order of the chunks
+@param: workers, number of processes
+@return list with the result of every chunk, in the order of the chunks
+"""
+def mineFileChunks(function, file_path: str, chunks: list, output_path: str, workers: int) -> list:
+    chunk_paths = [f"{output_path}.{i}" for i in range(len(chunks))]
+
+    try:
+        results = mineChunks(function, [(file_path, chunk_path, chunk) for chunk_path, chunk in zip(chunk_paths, chunks)], workers)
+        appendFiles(chunk_paths, output_path)
+    finally:
+        for chunk_path in chunk_paths:
+            if os.path.exists(chunk_path):
+                os.remove(chunk_path)
+
+    return results
@@ -0,0 +1,108 @@
+'''
+Converter of the dataset content files between the layouts of the term dictionary module:
+* json: the original dataset_content_*.json files, with a list of strings for every field
+* terms: the dataset_content_*.terms.json files, with the distinct terms and their counts
+* jsonl: the dataset_content_*.jsonl files, with a line for every term (jsonl.gz for the gzip compressed files)
+
+The original and JSON Lines files are read in streaming, so also the files already produced by the miners
+(Python and Java) can be converted without loading them in memory.
+
+python3 dataset_content_converter.py path_to_datasets_folder jsonl [--parser rdflibhr] [--remove]
+'''
+
+import os
+import sys
+import argparse
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.term_dictionary import OUTPUT_FORMATS, iterDatasetBatches, writeDatasetContent, readDatasetContent, getFormat, getBasePath
+
+#prefix of the names of the dataset content files
+CONTENT_PREFIX = "dataset_content_"
+
+"""
+@param: path, path of the dataset content file
+@param: output_format, layout of the converted file ("json", "terms", "jsonl" or "jsonl.gz")
+@return path of the converted file
+"""
+def convertFile(path: str, output_format: str) -> str:
+    if output_format != "terms" and getFormat(path) != "terms":
+        #the terms are written as soon as they are read, in the same order
+        return writeDatasetContent(getBasePath(path), output_format, iterDatasetBatches(path))
+
+    return readDatasetContent(path).write(getBasePath(path), output_format)
+
+"""
+@param: dataset_path, path to the dataset folder
+@param: parser, name of the parser of the files to be converted (None for all the parsers)
+@return list with the paths of the dataset content files of the dataset
+"""
+def getContentFiles(dataset_path: str, parser: str = None) -> list:
+    files = list()
+
+    for file in os.scandir(dataset_path):
+        if not file.is_file() or not file.name.startswith(CONTENT_PREFIX):
+            continue
+
+        if not any(file.name.endswith(suffix) for suffix in OUTPUT_FORMATS.values()):
+            continue
+
+        if parser is not None and os.path.basename(getBasePath(file.name)) != CONTENT_PREFIX + parser:
+            continue
+
+        files.append(file.path)
+
+    return files
+
+"""
+@param: datasets_folder, path to the folder where all the datasets are stored
+@param: output_format, layout of the converted files ("json", "terms", "jsonl" or "jsonl.gz")
+@param: parser, name of the parser of the files to be converted (None for all the parsers)
+@param: remove, True for removing the original files after the conversion
+"""
+def convertDatasets(datasets_folder: str, output_format: str, parser: str = None, remove: bool = False):
+    datasets = [dataset.path for dataset in os.scandir(datasets_folder) if dataset.is_dir()]
+
+    for dataset_path in tqdm(datasets):
+        for path in getContentFiles(dataset_path, parser):
+            if getFormat(path) == output_format:
+                continue
+
+            #a file already converted is not converted again
+            if os.path.exists(getBasePath(path) + OUTPUT_FORMATS[output_format]):
+                continue
+
+            convertFile(path, output_format)
+
+            if remove:
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    # read the command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "datasets_folder",
+        type=str,
+        help="Absolute path to the folder where all the datasets are stored"
+    )
+    parser.add_argument(
+        "output_format",
+        type=str,
+        choices=list(OUTPUT_FORMATS.keys()),
+        help="Layout of the converted files"
+    )
+    parser.add_argument(
+        "--parser",
+        type=str,
+        help="Convert only the files of this parser (e.g. rdflibhr for the dataset_content_rdflibhr files)",
+    )
+    parser.add_argument(
+        "--remove",
+        action="store_true",
+        help="Add if you want to remove the original files after the conversion",
+    )
+    args = parser.parse_args()
+
+    convertDatasets(args.datasets_folder, args.output_format, args.parser, args.remove)
@@ -0,0 +1,174 @@
+'''
+Content-addressed cache of the extraction results of the miners.
+
+Many datasets contain the same file (the same dump downloaded from different URLs or the same file with
+different extensions). The miners look up the SHA-256 hash of every file in this cache before parsing it (the
+hash recorded by the downloader in the crawl manifest, the file is read only if its hash is not recorded and
+its size is the size of a shared content):
+if the same bytes have already been mined by the same miner the stored extraction result is reused
+instead of parsing the file again. Only the results of the contents downloaded more than once (the shared
+contents of the content-addressed index of the crawl manifest) are stored, the other files are mined only once.
+
+The cache directory contains:
+* a digests.sqlite database with the hash of every file, keyed by (device, inode, size, mtime), so the
+  hash of a file (and of its hard links) is computed only once
+* a directory for every miner (stage) with a JSON file for every extraction result: the name of the stage
+  contains the version of the extractor, so the results of an older extraction are not reused
+'''
+
+import os
+import json
+import hashlib
+import sqlite3
+
+#name of the default cache directory, stored next to the datasets folder
+CACHE_DIRECTORY_NAME = "acordar_extraction_cache"
+
+#size of the blocks read for computing the hash of a file
+HASH_CHUNK_SIZE = 1024 ** 2
+
+"""
+@param: datasets_folder, path to the folder where all the datasets are stored
+@return path of the default extraction cache directory of the datasets folder
+"""
+def getDefaultCachePath(datasets_folder: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(datasets_folder)), CACHE_DIRECTORY_NAME)
+
+"""
+@param: file_path, path to the file
+@return SHA-256 hash of the file
+"""
+def computeDigest(file_path: str) -> str:
+    file_hash = hashlib.sha256()
+
+    with open(file_path, "rb") as file:
+        while True:
+            data = file.read(HASH_CHUNK_SIZE)
+            if not data:
+                break
+            file_hash.update(data)
+
+    return file_hash.hexdigest()
+
+
+class ExtractionCache:
+
+    """
+    @param: cache_path, path to the cache directory (created if it does not exist)
+    @param: stage, name of the miner (with the version of the extractor and of its parsing configuration) that
+            produces the results
+    @param: shared_digests, dictionary SHA-256 hash -> size of the contents shared by more than one file, the
+            only results that are stored (None: the results of all the files are stored)
+    """
+    def __init__(self, cache_path: str, stage: str, shared_digests: dict = None):
+        self.results_directory = os.path.join(cache_path, stage)
+        self.shared_digests = shared_digests
+        self.shared_sizes = None if shared_digests is None else set(shared_digests.values())
+        os.makedirs(self.results_directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(os.path.join(cache_path, "digests.sqlite"), timeout=60, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS digests (
+                device INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                PRIMARY KEY (device, inode, size, mtime_ns)
+            )
+            """
+        )
+
+    """
+    @param: file_path, path to the file
+    @return SHA-256 hash of the file (computed only if the file is changed since the last call)
+    """
+    def getDigest(self, file_path: str) -> str:
+        stat = os.stat(file_path)
+        key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+        row = self.connection.execute(
+            "SELECT sha256 FROM digests WHERE device = ? AND inode = ? AND size = ? AND mtime_ns = ?", key
+        ).fetchone()
+
+        if row is not None:
+            return row[0]
+
+        digest = computeDigest(file_path)
+        self.connection.execute("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?)", key + (digest,))
+
+        return digest
+
+    """
+    @param: file_path, path to the file
+    @param: record, last manifest record of the file with a hash (sha256, size and finished_at fields), None if
+            the hash of the file is not recorded
+    @return SHA-256 hash of the file, None if the file cannot have a shared content (its hash is not recorded
+            and no shared content has its size)
+    """
+    def findDigest(self, file_path: str, record=None) -> str:
+        stat = os.stat(file_path)
+
+        #the recorded hash is used if the file is not changed after the record
+        if record is not None and record["size"] == stat.st_size and record["finished_at"] is not None \
+            and stat.st_mtime <= record["finished_at"]:
+            return record["sha256"]
+
+        if self.shared_sizes is not None and stat.st_size not in self.shared_sizes:
+            return None
+
+        return self.getDigest(file_path)
+
+    """
+    @param: digest, SHA-256 hash of a file
+    @return path of the JSON file with the extraction result of the file
+    """
+    def getResultPath(self, digest: str) -> str:
+        return os.path.join(self.results_directory, digest[:2], digest + ".json")
+
+    """
+    @param: digest, SHA-256 hash of a file
+    @return the extraction result stored for the file (dictionary), None if the file has never been mined
+    """
+    def get(self, digest: str) -> dict:
+        result_path = self.getResultPath(digest)
+
+        if not os.path.isfile(result_path):
+            return None
+
+        try:
+            with open(result_path, "r", encoding="utf-8") as result_file:
+                return json.load(result_file)
+        except (OSError, ValueError):
+            return None
+
+    """
+    @param: digest, SHA-256 hash of a file
+    @return True if the result of the file is stored in the cache (the content is shared by more than one file)
+    """
+    def isShared(self, digest: str) -> bool:
+        return self.shared_digests is None or digest in self.shared_digests
+
+    """
+    @param: digest, SHA-256 hash of a file
+    @param: result, extraction result of the file (dictionary serializable in JSON), not stored if the content
+            of the file is not shared
+    """
+    def put(self, digest: str, result: dict):
+        if not self.isShared(digest):
+            return
+
+        result_path = self.getResultPath(digest)
+        os.makedirs(os.path.dirname(result_path), exist_ok=True)
+
+        #write in a temporary file and rename it, so a result is never read half written
+        temporary_path = f"{result_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as result_file:
+            json.dump(result, result_file, ensure_ascii=False)
+
+        os.replace(temporary_path, result_path)
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,223 @@
+'''
+Supervised execution of the parsing of a single file, shared by the Python miners.
+
+A pathological file (e.g. a huge RDF/XML file or a JSON-LD file with remote contexts) can hang the parser
+forever or push the machine into swap. When the supervision is enabled every file is parsed in a separate
+worker process, watched by the miner process:
+* if the parsing takes more than the timeout the worker is killed and a Timeout error is raised
+* if the resident memory (RSS) of the worker exceeds the limit the worker is killed and a MemoryLimit
+  error is raised
+* if the worker dies (e.g. killed by the OOM killer or a crash of a native parser) a WorkerCrashed error
+  is raised
+* the worker is recycled after a number of files, so the memory fragmentation and the leaks of the
+  parsers do not accumulate
+
+The class name of the raised errors is recorded by the miners as error class in the manifest.
+When the supervision is not enabled the files are parsed in the miner process.
+'''
+
+import os
+import time
+import multiprocessing
+
+#seconds between two checks of the worker
+POLL_INTERVAL = 0.1
+
+#size of a memory page, used for reading the RSS of the worker
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+class SupervisedError(Exception):
+    pass
+
+class Timeout(SupervisedError):
+    pass
+
+class MemoryLimit(SupervisedError):
+    pass
+
+class WorkerCrashed(SupervisedError):
+    pass
+
+
+"""
+Main loop of the worker process: it executes the received (function, args) tasks until it receives None
+
+@param: connection, connection with the miner process
+"""
+def workerLoop(connection):
+    while True:
+        task = connection.recv()
+
+        if task is None:
+            break
+
+        function, args = task
+
+        try:
+            connection.send((True, function(*args)))
+        except Exception as e:
+            try:
+                connection.send((False, e))
+            except Exception:
+                #the exception cannot be pickled
+                connection.send((False, Exception(f"{type(e).__name__}: {e}")))
+
+"""
+@param: pid, process id
+@return resident memory (RSS) in bytes of the process
+"""
+def getRSS(pid: int) -> int:
+    with open(f"/proc/{pid}/statm", "r") as statm:
+        return int(statm.read().split()[1]) * PAGE_SIZE
+
+
+class FileSupervisor:
+
+    """
+    @param: timeout, maximum time in seconds for the parsing of a file (None for no limit)
+    @param: memory_limit, maximum RSS in MB of the worker (None for no limit)
+    @param: max_files, number of files after which the worker is recycled (None for never)
+    """
+    def __init__(self, timeout: float = None, memory_limit: int = None, max_files: int = None):
+        self.timeout = timeout
+        self.memory_limit = memory_limit * 1024 ** 2 if memory_limit is not None else None
+        self.max_files = max_files
+
+        self.process = None
+        self.connection = None
+        self.files = 0
+
+        #process that owns the supervisor (a supervisor inherited by a child process is not used)
+        self.owner = os.getpid()
+
+    def start(self):
+        self.connection, worker_connection = multiprocessing.Pipe()
+
+        #daemon worker: it is terminated when the miner process exits
+        self.process = multiprocessing.Process(target=workerLoop, args=(worker_connection,), daemon=True)
+        self.process.start()
+        worker_connection.close()
+
+        self.files = 0
+
+    """
+    @param: graceful, True for stopping the worker after its current task, False for killing it
+    """
+    def stop(self, graceful: bool = True):
+        if self.process is None:
+            return
+
+        if graceful and self.process.is_alive():
+            try:
+                self.connection.send(None)
+                self.process.join(timeout=10)
+            except (OSError, ValueError):
+                pass
+
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+        self.connection.close()
+        self.process = None
+        self.connection = None
+
+    """
+    Execute function(*args) in the worker process
+
+    @param: function, function defined at the top level of a module (it must be picklable)
+    @param: args, arguments of the function (they must be picklable)
+    @return the value returned by the function, the exceptions raised by the function are raised again
+    """
+    def run(self, function, *args):
+        if self.process is None or not self.process.is_alive():
+            self.stop(graceful=False)
+            self.start()
+
+        self.connection.send((function, args))
+        started_at = time.monotonic()
+
+        while True:
+            crashed = False
+            if self.connection.poll(POLL_INTERVAL):
+                try:
+                    success, value = self.connection.recv()
+                    break
+                except EOFError:
+                    #the worker closed its end of the pipe without a result
+                    crashed = True
+
+            if crashed or not self.process.is_alive():
+                self.process.join(timeout=1)
+                exitcode = self.process.exitcode
+                self.stop(graceful=False)
+                raise WorkerCrashed(f"Worker exited with code {exitcode}")
+
+            if self.timeout is not None and time.monotonic() - started_at > self.timeout:
+                self.stop(graceful=False)
+                raise Timeout(f"Parsing longer than {self.timeout} seconds")
+
+            if self.memory_limit is not None:
+                try:
+                    rss = getRSS(self.process.pid)
+                except OSError:
+                    continue
+
+                if rss > self.memory_limit:
+                    self.stop(graceful=False)
+                    raise MemoryLimit(f"Worker RSS bigger than {self.memory_limit // 1024 ** 2} MB")
+
+        self.files += 1
+        if self.max_files is not None and self.files >= self.max_files:
+            self.stop()
+
+        if not success:
+            raise value
+
+        return value
+
+
+#settings and supervisor of the current process
+supervisor_settings = None
+supervisor = None
+
+"""
+Enable the supervision of the file parsing in the current process
+
+@param: timeout, maximum time in seconds for the parsing of a file (None for no limit)
+@param: memory_limit, maximum RSS in MB of the worker (None for no limit)
+@param: max_files, number of files after which the worker is recycled (None for never)
+"""
+def configureSupervisor(timeout: float = None, memory_limit: int = None, max_files: int = None):
+    global supervisor_settings
+
+    if timeout is None and memory_limit is None:
+        supervisor_settings = None
+    else:
+        supervisor_settings = (timeout, memory_limit, max_files)
+
+"""
+@return True if the files are parsed in the supervised worker
+"""
+def isSupervised() -> bool:
+    return supervisor_settings is not None
+
+"""
+Execute function(*args) in the supervised worker if the supervision is enabled, else in the current process
+
+@param: function, function defined at the top level of a module
+@param: args, arguments of the function
+@return the value returned by the function
+"""
+def runFile(function, *args):
+    global supervisor
+
+    if supervisor_settings is None:
+        return function(*args)
+
+    #every process has its own supervisor (the supervisor of a parent process is not inherited)
+    if supervisor is None or supervisor.owner != os.getpid():
+        supervisor = FileSupervisor(*supervisor_settings)
+
+    return supervisor.run(function, *args)
@@ -0,0 +1,401 @@
+'''
+Persistent crawl manifest shared by all the phases (download, retry, checking and mining).
+
+The manifest is a SQLite database with one record for every (stage, dataset, url, file) with:
+* the status of the record (e.g. downloaded, failed, mined, ...)
+* the size and the SHA-256 hash of the file 
+* the number of files of the dataset level records (e.g. the files downloaded or mined for the dataset)
+* the start and finish timestamps 
+* the error class and a detail message (error message, mime type, ...)
+
+Records with an empty url and file are dataset level records (e.g. the dataset download is completed).
+The dataset level records with the completed status are the stage completion index: the miners record there
+the mined datasets, so the resume mechanism reads the completed datasets with a single query instead of
+opening the dataset_metadata.json file of every dataset.
+
+The manifest also contains the content-addressed index of the downloaded files (SHA-256 hash -> path of the 
+first file downloaded with that content), used for the deduplication of the files shared by different datasets.
+In this way the resume mechanisms and the "what failed?" queries do not have to rescan the logs 
+or to walk all the dataset directories.
+
+It can also be used from the command line for querying the records:
+
+python3 manifest.py path_to_manifest --stage download --status failed
+'''
+
+import os
+import sqlite3
+import threading
+import argparse
+
+#name of the default manifest file, stored next to the datasets folder
+MANIFEST_FILE_NAME = "acordar_manifest.sqlite"
+
+#stage names of the records
+STAGE_DOWNLOAD = "download"
+STAGE_CHECK = "check"
+STAGE_REFRESH = "refresh"
+
+#record status
+STATUS_DOWNLOADED = "downloaded"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+STATUS_VALID = "valid"
+STATUS_NOT_RDF = "not_rdf"
+STATUS_MINED = "mined"
+STATUS_CHANGED = "changed"
+STATUS_UNCHANGED = "unchanged"
+
+#error class of the files that are too big for a miner
+ERROR_FILE_TOO_BIG = "FileTooBig"
+
+"""
+@param: datasets_folder, path to the folder where all the datasets are stored
+@return path of the default manifest of the datasets folder (it cannot be stored in the datasets folder
+        because every entry of the folder must be a dataset directory)
+"""
+def getDefaultManifestPath(datasets_folder: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(datasets_folder)), MANIFEST_FILE_NAME)
+
+"""
+@param: dataset, dataset id or name of the dataset directory (dataset-ID)
+@return the dataset id used in the manifest records
+"""
+def getDatasetId(dataset) -> str:
+    dataset = str(dataset)
+    if dataset.startswith("dataset-"):
+        return dataset[len("dataset-"):]
+    return dataset
+
+
+"""
+@param: path, path to a file of the content-addressed index
+@param: size, size in bytes of the file when it was registered
+@param: mtime_ns, modification time of the file when it was registered (None for the files registered before
+        the modification times were stored, only the size is checked)
+@return True if the file exists and it is not changed since its registration
+"""
+def isUnchanged(path: str, size: int, mtime_ns: int) -> bool:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+
+    return stat.st_size == size and (mtime_ns is None or stat.st_mtime_ns == mtime_ns)
+
+
+class Manifest:
+
+    """
+    @param: manifest_path, path to the SQLite manifest file (created if it does not exist)
+    """
+    def __init__(self, manifest_path: str):
+        self.manifest_path = manifest_path
+
+        #the connection is shared by the download threads, the writes are serialized by the lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(manifest_path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+
+        #WAL mode: readers are not blocked by the writers of the other phases
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS records (
+                stage TEXT NOT NULL,
+                dataset_id TEXT NOT NULL,
+                url TEXT NOT NULL DEFAULT '',
+                file_name TEXT NOT NULL DEFAULT '',
+                status TEXT NOT NULL,
+                size INTEGER,
+                sha256 TEXT,
+                started_at REAL,
+                finished_at REAL,
+                error_class TEXT,
+                detail TEXT,
+                attempts INTEGER NOT NULL DEFAULT 1,
+                files INTEGER,
+                PRIMARY KEY (stage, dataset_id, url, file_name)
+            )
+            """
+        )
+
+        #the manifests created before the files column are migrated
+        columns = [row["name"] for row in self.connection.execute("PRAGMA table_info(records)")]
+        if "files" not in columns:
+            try:
+                self.connection.execute("ALTER TABLE records ADD COLUMN files INTEGER")
+            except sqlite3.OperationalError:
+                #the column has been added by another process
+                pass
+        self.connection.execute("CREATE INDEX IF NOT EXISTS records_status ON records (stage, status)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS records_file ON records (dataset_id, file_name)")
+
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS contents (
+                sha256 TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                mtime_ns INTEGER
+            )
+            """
+        )
+
+        #the content-addressed indexes created before the mtime_ns column are migrated
+        columns = [row["name"] for row in self.connection.execute("PRAGMA table_info(contents)")]
+        if "mtime_ns" not in columns:
+            try:
+                self.connection.execute("ALTER TABLE contents ADD COLUMN mtime_ns INTEGER")
+            except sqlite3.OperationalError:
+                #the column has been added by another process
+                pass
+
+    """
+    Insert or update the record of (stage, dataset_id, url, file_name)
+
+    @param: stage, name of the phase that produces the record
+    @param: dataset_id, id of the dataset (or name of the dataset directory)
+    @param: status, status of the record
+    @param: url, url of the record (empty for the file and dataset records)
+    @param: file_name, name of the file (empty for the url and dataset records)
+    @param: size, size in bytes of the file
+    @param: sha256, SHA-256 hash of the file
+    @param: started_at, start timestamp
+    @param: finished_at, finish timestamp
+    @param: error_class, class of the error if the status is an error status
+    @param: detail, error message or other info about the record
+    @param: files, number of files of a dataset level record
+    """
+    def record(self, stage: str, dataset_id, status: str, url: str = "", file_name: str = "", size: int = None, 
+               sha256: str = None, started_at: float = None, finished_at: float = None, error_class: str = None, 
+               detail: str = None, files: int = None):
+        with self.lock:
+            self.writeRecord(stage, dataset_id, status, url, file_name, size, sha256, started_at, finished_at, 
+                             error_class, detail, files)
+
+    """
+    Insert or update the record of (stage, dataset_id, url, file_name), the caller holds the lock 
+    (see the record method for the parameters)
+    """
+    def writeRecord(self, stage: str, dataset_id, status: str, url: str = "", file_name: str = "", size: int = None, 
+                    sha256: str = None, started_at: float = None, finished_at: float = None, error_class: str = None, 
+                    detail: str = None, files: int = None):
+        self.connection.execute(
+            """
+            INSERT INTO records (stage, dataset_id, url, file_name, status, size, sha256, started_at, finished_at, error_class, detail, files)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (stage, dataset_id, url, file_name) DO UPDATE SET
+                status = excluded.status,
+                size = excluded.size,
+                sha256 = excluded.sha256,
+                started_at = excluded.started_at,
+                finished_at = excluded.finished_at,
+                error_class = excluded.error_class,
+                detail = excluded.detail,
+                files = excluded.files,
+                attempts = attempts + 1
+            """,
+            (stage, getDatasetId(dataset_id), url, file_name, status, size, sha256, started_at, finished_at, error_class, detail, files)
+        )
+
+    """
+    Record the result of a url: the previous records of the url with a different file name
+    (e.g. the failed attempts without a file) are replaced in the same transaction, so a reader never sees
+    the url without records or with both records
+
+    @param: stage, name of the phase that produces the record
+    @param: dataset_id, id of the dataset
+    @param: url, url of the record
+    @param: status, status of the record
+    @param: file_name, name of the file downloaded from the url (empty if the download failed)
+    @param: fields, other fields of the record (see the record method)
+    """
+    def recordURL(self, stage: str, dataset_id, url: str, status: str, file_name: str = "", **fields):
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.connection.execute(
+                    "DELETE FROM records WHERE stage = ? AND dataset_id = ? AND url = ? AND file_name != ?",
+                    (stage, getDatasetId(dataset_id), url, file_name)
+                )
+                self.writeRecord(stage, dataset_id, status, url=url, file_name=file_name, **fields)
+                self.connection.execute("COMMIT")
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    """
+    @param: stage, name of the phase
+    @param: status, if not None only the records with this status are returned
+    @param: dataset_id, if not None only the records of this dataset are returned
+    @param: error_class, if not None only the records with this error class are returned
+    @return list of records (sqlite3.Row objects, accessible as dictionaries)
+    """
+    def getRecords(self, stage: str, status: str = None, dataset_id = None, error_class: str = None) -> list:
+        query = "SELECT * FROM records WHERE stage = ?"
+        params = [stage]
+
+        if status is not None:
+            query += " AND status = ?"
+            params.append(status)
+        if dataset_id is not None:
+            query += " AND dataset_id = ?"
+            params.append(getDatasetId(dataset_id))
+        if error_class is not None:
+            query += " AND error_class = ?"
+            params.append(error_class)
+
+        with self.lock:
+            return self.connection.execute(query, params).fetchall()
+
+    """
+    @param: stage, name of the phase
+    @param: status, if not None only the datasets with at least one record with this status are returned
+    @param: dataset_level, if True only the dataset level records are considered
+    @return set with the ids of the datasets 
+    """
+    def getDatasets(self, stage: str, status: str = None, dataset_level: bool = False) -> set:
+        query = "SELECT DISTINCT dataset_id FROM records WHERE stage = ?"
+        params = [stage]
+
+        if status is not None:
+            query += " AND status = ?"
+            params.append(status)
+        if dataset_level:
+            query += " AND url = '' AND file_name = ''"
+
+        with self.lock:
+            return set(row[0] for row in self.connection.execute(query, params))
+
+    """
+    @param: stage, name of the phase
+    @return set with the ids of the datasets completed by the stage (used by the resume mechanisms)
+    """
+    def getCompleted(self, stage: str) -> set:
+        return self.getDatasets(stage, STATUS_COMPLETED, dataset_level=True)
+
+    """
+    Remove the dataset from the completion index of all the stages except the given ones
+    (e.g. when the dataset files are changed by the refresh and the dataset must be mined again)
+
+    @param: dataset_id, id of the dataset
+    @param: keep_stages, stages that are still completed
+    """
+    def resetCompleted(self, dataset_id, keep_stages: list = None):
+        query = "DELETE FROM records WHERE dataset_id = ? AND url = '' AND file_name = '' AND status = ?"
+        params = [getDatasetId(dataset_id), STATUS_COMPLETED]
+
+        if keep_stages:
+            query += f" AND stage NOT IN ({', '.join('?' for _ in keep_stages)})"
+            params.extend(keep_stages)
+
+        with self.lock:
+            self.connection.execute(query, params)
+
+    """
+    @param: stage, name of the phase
+    @return True if the manifest contains at least one record of the stage
+    """
+    def hasStage(self, stage: str) -> bool:
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM records WHERE stage = ? LIMIT 1", (stage,)).fetchone() is not None
+
+    """
+    Register a file in the content-addressed index
+
+    @param: sha256, SHA-256 hash of the file
+    @param: size, size in bytes of the file
+    @param: path, path to the file
+    @return path of the file already registered with the same content (that still exists unchanged since its
+            registration: same size and modification time), None if the file is the first one with this content
+    """
+    def registerContent(self, sha256: str, size: int, path: str) -> str:
+        path = os.path.abspath(path)
+
+        with self.lock:
+            #the path has new bytes (e.g. a file changed by the refresh): the contents registered with the
+            #previous bytes of the path are removed, so no file is linked to the new bytes
+            self.connection.execute("DELETE FROM contents WHERE path = ? AND sha256 != ?", (path, sha256))
+
+            row = self.connection.execute("SELECT size, path, mtime_ns FROM contents WHERE sha256 = ?", (sha256,)).fetchone()
+
+            if row is not None and row["path"] != path and isUnchanged(row["path"], row["size"], row["mtime_ns"]):
+                return row["path"]
+
+            #first file with this content (or the registered file has been removed, renamed or changed)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO contents (sha256, size, path, mtime_ns) VALUES (?, ?, ?, ?)", 
+                (sha256, size, path, os.stat(path).st_mtime_ns)
+            )
+            return None
+
+    """
+    @return dictionary SHA-256 hash -> size with the contents of the content-addressed index downloaded in more
+            than one file (by different URLs of the same dataset or by different datasets)
+    """
+    def getSharedContents(self) -> dict:
+        with self.lock:
+            return dict(tuple(row) for row in self.connection.execute(
+                """
+                SELECT contents.sha256, contents.size FROM contents JOIN records ON records.sha256 = contents.sha256
+                GROUP BY contents.sha256 HAVING COUNT(DISTINCT records.dataset_id || '/' || records.file_name) > 1
+                """
+            ))
+
+    """
+    @param: dataset_id, id of the dataset (or name of the dataset directory)
+    @param: file_name, name of the file in the dataset directory
+    @return the last record of the file with a SHA-256 hash (sha256, size and finished_at fields), None if the
+            hash of the file has never been recorded
+    """
+    def getFileDigest(self, dataset_id, file_name: str):
+        with self.lock:
+            return self.connection.execute(
+                """
+                SELECT sha256, size, finished_at FROM records 
+                WHERE dataset_id = ? AND file_name = ? AND sha256 IS NOT NULL
+                ORDER BY finished_at DESC LIMIT 1
+                """,
+                (getDatasetId(dataset_id), file_name)
+            ).fetchone()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+if __name__ == "__main__":
+    # read the command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "manifest", 
+        type=str, 
+        help="Path to the manifest file"
+    )
+    parser.add_argument(
+        "--stage",
+        type=str,
+        required=True,
+        help="Stage of the records (e.g. download, check, rdflib, lightrdf, ...)",
+    )
+    parser.add_argument(
+        "--status",
+        type=str,
+        help="Status of the records (e.g. failed)",
+    )
+    parser.add_argument(
+        "--dataset",
+        type=str,
+        help="Id of the dataset",
+    )
+    args = parser.parse_args()
+
+    manifest = Manifest(args.manifest)
+
+    for record in manifest.getRecords(args.stage, args.status, args.dataset):
+        print("\t".join("" if value is None else str(value) for value in tuple(record)))
+
+    manifest.close()
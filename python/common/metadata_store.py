@@ -0,0 +1,237 @@
+'''
+Safe access to the dataset_metadata.json file of every dataset, shared by all the phases.
+
+Every phase (download, retry, refresh, mining) updates the dataset_metadata.json file. Rewriting the file in
+place corrupts it if the process crashes during the write, and two phases that update the same dataset at the
+same time can lose an update. This module:
+* writes the metadata file atomically: the new content is written in a temporary file that replaces the
+  metadata file with a rename, so the file is always the old or the new version
+* serializes the updates of a dataset with a lock file (dataset_metadata.lock), taken only by the writers: the
+  readers take a shared lock if the lock file exists and they never create a file in the dataset directory
+* lets the stages record their status with an append-only record (a line of dataset_metadata.pending.jsonl
+  with the updated keys), without reading and rewriting the whole document
+* compacts the pending records in the metadata file (compactMetadata): the Java miners and the analysis
+  notebooks read only the dataset_metadata.json file, so they must run after the compaction
+
+The metadata of a dataset is the dataset_metadata.json content updated with its pending records, in order.
+
+It can also be used from the command line for compacting the pending records of all the datasets:
+
+python3 metadata_store.py path_to_datasets_folder
+'''
+
+import os
+import json
+import fcntl
+import argparse
+from contextlib import contextmanager
+from tqdm import tqdm
+
+#file names of the metadata and of its sidecar files in the dataset directory
+METADATA_FILE_NAME = "dataset_metadata.json"
+PENDING_FILE_NAME = "dataset_metadata.pending.jsonl"
+LOCK_FILE_NAME = "dataset_metadata.lock"
+
+#prefix shared by the metadata file and its sidecar files
+METADATA_PREFIX = "dataset_metadata"
+
+"""
+@param: file_name, name of a file of a dataset directory
+@return True if the file is the metadata file or one of its sidecar files
+"""
+def isMetadataFile(file_name: str) -> bool:
+    return file_name.startswith(METADATA_PREFIX)
+
+"""
+@param: dataset_path, path to the dataset directory
+@return True if the dataset has a metadata file
+"""
+def hasMetadata(dataset_path: str) -> bool:
+    return os.path.isfile(os.path.join(dataset_path, METADATA_FILE_NAME))
+
+"""
+Lock of the metadata of a dataset for the writers, held by one process at a time
+
+@param: dataset_path, path to the dataset directory
+"""
+@contextmanager
+def lockMetadata(dataset_path: str):
+    with open(os.path.join(dataset_path, LOCK_FILE_NAME), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+"""
+Shared lock of the metadata of a dataset for the readers, they do not block each other and they wait only for
+the writers. The lock file is opened read-only and it is not created: a dataset never updated through this
+module (or a read-only dataset directory) is read without a lock
+
+@param: dataset_path, path to the dataset directory
+"""
+@contextmanager
+def shareMetadata(dataset_path: str):
+    try:
+        lock_file = open(os.path.join(dataset_path, LOCK_FILE_NAME), "r")
+    except OSError:
+        yield
+        return
+
+    with lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+"""
+@param: dataset_path, path to the dataset directory
+@return list with the pending records of the dataset (dictionaries with the updated keys), in order
+"""
+def readPendingRecords(dataset_path: str) -> list:
+    records = list()
+    pending_path = os.path.join(dataset_path, PENDING_FILE_NAME)
+
+    if not os.path.exists(pending_path):
+        return records
+
+    with open(pending_path, "r", encoding="utf-8") as pending_file:
+        for line in pending_file:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                #a record truncated by a crash during the append
+                pass
+
+    return records
+
+"""
+@param: dataset_path, path to the dataset directory
+@return metadata of the dataset read from the file, without locking it
+"""
+def loadMetadata(dataset_path: str) -> dict:
+    with open(os.path.join(dataset_path, METADATA_FILE_NAME), "r", encoding="utf-8") as metadata_file:
+        metadata = json.load(metadata_file, strict=False)
+
+    for record in readPendingRecords(dataset_path):
+        metadata.update(record)
+
+    return metadata
+
+"""
+@param: dataset_path, path to the dataset directory
+@param: metadata, metadata of the dataset
+"""
+def storeMetadata(dataset_path: str, metadata: dict):
+    metadata_path = os.path.join(dataset_path, METADATA_FILE_NAME)
+    temporary_path = f"{metadata_path}.{os.getpid()}.tmp"
+
+    with open(temporary_path, "w", encoding="utf-8") as metadata_file:
+        metadata_file.write(json.dumps(metadata, indent=4, ensure_ascii=False))
+        metadata_file.flush()
+        os.fsync(metadata_file.fileno())
+
+    os.replace(temporary_path, metadata_path)
+
+    #the pending records are now in the metadata file
+    pending_path = os.path.join(dataset_path, PENDING_FILE_NAME)
+    if os.path.exists(pending_path):
+        os.remove(pending_path)
+
+"""
+@param: dataset_path, path to the dataset directory
+@return metadata of the dataset, with its pending records
+"""
+def readMetadata(dataset_path: str) -> dict:
+    with shareMetadata(dataset_path):
+        return loadMetadata(dataset_path)
+
+"""
+Replace the metadata of a dataset (e.g. when the dataset is downloaded)
+
+@param: dataset_path, path to the dataset directory
+@param: metadata, new metadata of the dataset
+"""
+def writeMetadata(dataset_path: str, metadata: dict):
+    with lockMetadata(dataset_path):
+        storeMetadata(dataset_path, metadata)
+
+"""
+Read, update and write the metadata of a dataset holding its lock, so no update of another process is lost
+
+@param: dataset_path, path to the dataset directory
+@param: update, function that receives the metadata dictionary and updates it
+@return the updated metadata
+"""
+def updateMetadata(dataset_path: str, update) -> dict:
+    with lockMetadata(dataset_path):
+        metadata = loadMetadata(dataset_path)
+        update(metadata)
+        storeMetadata(dataset_path, metadata)
+
+    return metadata
+
+"""
+Append a pending record to the metadata of a dataset, the metadata file is not read and not rewritten
+
+@param: dataset_path, path to the dataset directory
+@param: record, dictionary with the updated keys (e.g. {"mined_rdflib": True, "mined_files_rdflib": [...]})
+"""
+def appendRecord(dataset_path: str, record: dict):
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+
+    with lockMetadata(dataset_path):
+        with open(os.path.join(dataset_path, PENDING_FILE_NAME), "a", encoding="utf-8") as pending_file:
+            pending_file.write(line)
+            pending_file.flush()
+            os.fsync(pending_file.fileno())
+
+"""
+@param: dataset_path, path to the dataset directory
+@param: key, key of the metadata
+@param: default, value returned if the key is not in the metadata
+@return value of the key, the pending records are checked before the metadata file is parsed
+"""
+def getMetadataValue(dataset_path: str, key: str, default=None):
+    with shareMetadata(dataset_path):
+        for record in reversed(readPendingRecords(dataset_path)):
+            if key in record:
+                return record[key]
+
+        with open(os.path.join(dataset_path, METADATA_FILE_NAME), "r", encoding="utf-8") as metadata_file:
+            return json.load(metadata_file, strict=False).get(key, default)
+
+"""
+Write the pending records of a dataset in its metadata file
+
+@param: dataset_path, path to the dataset directory
+@return True if there were pending records
+"""
+def compactMetadata(dataset_path: str) -> bool:
+    with lockMetadata(dataset_path):
+        if not os.path.exists(os.path.join(dataset_path, PENDING_FILE_NAME)):
+            return False
+
+        storeMetadata(dataset_path, loadMetadata(dataset_path))
+        return True
+
+
+if __name__ == "__main__":
+    # read the command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "datasets_folder",
+        type=str,
+        help="Absolute path to the folder where all the datasets are stored"
+    )
+    args = parser.parse_args()
+
+    dataset_paths = [folder.path for folder in os.scandir(args.datasets_folder) if folder.is_dir() and hasMetadata(folder.path)]
+
+    compacted = 0
+    for dataset_path in tqdm(dataset_paths):
+        if compactMetadata(dataset_path):
+            compacted += 1
+
+    print(f"Compacted the pending records of {compacted} datasets")
@@ -0,0 +1,283 @@
+"""
+Scanner of the N-Triples and N-Quads files, the largest files of the collection.
+
+The generic parsers build a Python object for every term (rdflib) or go through a generic RDF parser and
+give back strings that the miners clean again (lightrdf). The scanner memory-maps the file and splits it
+on byte offsets in line-aligned blocks; every block is decoded once and all its lines are matched by a
+single precompiled pattern, so the terms are the N-Triples strings written in the file, without an object
+for every term. The kind of a term is given by its first character (<: IRI, _: blank node, ": literal) and
+only the terms needed by the extraction are decoded further, with the decoding wanted by the miner:
+* getIRI, getLexicalForm: the strings of the rdflib terms (IRI without brackets, unescaped lexical form)
+* toNTriples: the N-Triples string of the term produced by lightrdf (IRI with brackets, literal with quotes,
+  language tag or datatype, with only \\, ", \\n and \\r escaped and the language tag lowercased)
+
+The graph term of the N-Quads lines is ignored, as in the other parsers. The scanner does not validate the
+IRIs, a line that is not a triple (or a quad), an empty line or a comment raises a NTriplesError, as the
+parsers do.
+
+The file can be split in line-aligned chunks (getChunks) and every chunk can be scanned on its own, so a
+huge file can be scanned by more processes.
+
+python3 ntriples_scanner.py path_to_file [--chunks 4]
+"""
+
+import os
+import re
+import mmap
+import time
+import argparse
+
+#suffixes of the line based syntaxes handled by the scanner
+LINE_SUFFIXES = ["nt", "ntriples", "nq", "nquads"]
+
+#first character of every kind of term
+IRI = "<"
+BNODE = "_"
+LITERAL = '"'
+
+RDF_TYPE = "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>"
+
+#bytes of the file decoded and matched together
+BLOCK_SIZE = 8 * 1024 ** 2
+
+#a triple (or a quad) line, preceded by the empty and the comment lines: subject, predicate, object and the
+#optional graph term (the literal pattern is unrolled, so the regex engine does not try an alternative for
+#every character of the literal)
+_IRI = r"<[^>\n]*>"
+_BNODE = r"_:[^ \t\r\n.<>\"]+(?:\.+[^ \t\r\n.<>\"]+)*"
+_LITERAL = r'"[^"\\\n]*(?:\\.[^"\\\n]*)*"(?:@[A-Za-z]+(?:-[A-Za-z0-9]+)*|\^\^<[^>\n]*>)?'
+_EMPTY_LINES = r"(?:[ \t\r]*(?:#[^\n]*)?\n)*"
+_TRIPLE = (
+    r"[ \t]*(" + _IRI + r"|" + _BNODE + r")[ \t]*(" + _IRI + r")[ \t]*(" + _IRI + r"|" + _BNODE + r"|" + _LITERAL +
+    r")[ \t]*(?:(?:" + _IRI + r"|" + _BNODE + r")[ \t]*)?\.[ \t]*(?:#[^\n]*)?\r?(?:\n|$)"
+)
+
+#the matches start at the beginning of a line, so a block has a match for every line with a triple
+TRIPLE_PATTERN = re.compile(r"^" + _EMPTY_LINES + _TRIPLE, re.MULTILINE)
+
+#a single line (a triple or an empty or comment line), used for finding the invalid line of a block
+LINE_PATTERN = re.compile(r"(?:" + _TRIPLE + r"|[ \t\r]*(?:#[^\n]*)?(?:\n|$))")
+
+#escape sequences of the IRIs and of the literals
+ESCAPE_PATTERN = re.compile(r"\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))", re.DOTALL)
+ESCAPES = {"t": "\t", "b": "\b", "n": "\n", "r": "\r", "f": "\f", '"': '"', "'": "'", "\\": "\\"}
+
+
+class NTriplesError(ValueError):
+    pass
+
+"""
+@param: file_path, path to the RDF file
+@return True if the file is in a line based syntax handled by the scanner
+"""
+def isLineBased(file_path: str) -> bool:
+    return file_path.rsplit(".", 1)[-1].lower() in LINE_SUFFIXES
+
+"""
+@param: buffer, memory-mapped file
+@param: pos, byte offset
+@param: end, byte offset of the end of the buffer
+@return byte offset of the beginning of the first line after pos (end if there is no other line)
+"""
+def nextLine(buffer, pos: int, end: int) -> int:
+    newline = buffer.find(b"\n", pos, end)
+    return end if newline == -1 else newline + 1
+
+"""
+@param: file_path, path to the RDF file
+@param: n_chunks, number of chunks
+@return list of (start, end) byte offsets of the chunks, every chunk starts at the beginning of a line
+"""
+def getChunks(file_path: str, n_chunks: int) -> list:
+    size = os.path.getsize(file_path)
+
+    if size == 0:
+        return list()
+
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        bounds = [0]
+
+        for i in range(1, n_chunks):
+            #the chunk ends at the end of the line that contains its last byte
+            bound = nextLine(mm, max(size * i // n_chunks, bounds[-1] + 1) - 1, size)
+
+            if bound >= size:
+                break
+            bounds.append(bound)
+
+        bounds.append(size)
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+"""
+@param: text, decoded block of lines
+@param: offset, byte offset of the block in the file
+@raise NTriplesError with the first line of the block that is not a triple, an empty or a comment line
+"""
+def raiseInvalidLine(text: str, offset: int):
+    pos = 0
+
+    while pos < len(text):
+        line = LINE_PATTERN.match(text, pos)
+        line_end = text.find("\n", pos)
+        line_end = len(text) if line_end == -1 else line_end + 1
+
+        if line is None or line.end() != line_end:
+            line_offset = offset + len(text[:pos].encode("utf-8"))
+            raise NTriplesError(f"Invalid line at byte {line_offset}: {text[pos:line_end].rstrip()[:200]}")
+
+        pos = line_end
+
+"""
+@param: file_path, path to the N-Triples or N-Quads file
+@param: start, byte offset of the first line to be scanned
+@param: end, byte offset of the end of the last line to be scanned (None for the end of the file)
+@return generator of the (subject, predicate, object) triples, every term is the N-Triples string in the file
+"""
+def scanTriples(file_path: str, start: int = 0, end: int = None):
+    if os.path.getsize(file_path) == 0:
+        return
+
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if end is None:
+            end = len(mm)
+
+        pos = start
+
+        while pos < end:
+            #line-aligned block
+            block_end = nextLine(mm, min(pos + BLOCK_SIZE, end) - 1, end)
+            text = mm[pos:block_end].decode("utf-8")
+
+            triples = TRIPLE_PATTERN.findall(text)
+
+            #a block with a match for every line has only triples, the other blocks are checked line by line
+            #(they can be valid blocks with empty or comment lines)
+            if len(triples) != text.count("\n") + (not text.endswith("\n")):
+                raiseInvalidLine(text, pos)
+
+            yield from triples
+            pos = block_end
+
+"""
+@param: text, IRI or lexical form with the N-Triples escape sequences
+@return text without the escape sequences
+"""
+def unescape(text: str) -> str:
+    if "\\" not in text:
+        return text
+
+    def replace(escape):
+        code = escape.group(1) or escape.group(2)
+        if code is not None:
+            return chr(int(code, 16))
+        return ESCAPES.get(escape.group(3), escape.group(0))
+
+    return ESCAPE_PATTERN.sub(replace, text)
+
+"""
+@param: iri, IRI term (with the brackets)
+@return the IRI, without the brackets
+"""
+def getIRI(iri: str) -> str:
+    return unescape(iri[1:-1])
+
+"""
+@param: literal, literal term
+@return (lexical form, language tag, datatype IRI) of the literal, the missing parts are None
+"""
+def splitLiteral(literal: str) -> tuple:
+    close = literal.rindex('"')
+    lexical_form = unescape(literal[1:close])
+
+    suffix = literal[close + 1:]
+    if suffix.startswith("@"):
+        return lexical_form, suffix[1:], None
+    if suffix.startswith("^^"):
+        return lexical_form, None, getIRI(suffix[2:])
+
+    return lexical_form, None, None
+
+"""
+@param: literal, literal term
+@return the lexical form of the literal
+"""
+def getLexicalForm(literal: str) -> str:
+    if "\\" not in literal and literal.endswith('"'):
+        return literal[1:-1]
+
+    return splitLiteral(literal)[0]
+
+"""
+@param: text, lexical form of a literal
+@return the lexical form with the escapes of the N-Triples serialization of lightrdf
+"""
+def escapeLiteral(text: str) -> str:
+    return text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "\\r")
+
+"""
+@param: term, N-Triples term
+@return the N-Triples string of the term, the same string produced by lightrdf
+"""
+def toNTriples(term: str) -> str:
+    if term[0] == LITERAL:
+        close = term.rindex('"')
+
+        #most of the literals have no escape sequences and no uppercase language tag, they are already the string
+        if "\\" not in term and (term[close + 1:close + 2] != "@" or term[close + 1:].islower()):
+            return term
+
+        lexical_form, language, datatype = splitLiteral(term)
+        if language is not None:
+            return f'"{escapeLiteral(lexical_form)}"@{language.lower()}'
+        if datatype is not None:
+            return f'"{escapeLiteral(lexical_form)}"^^<{datatype}>'
+        return f'"{escapeLiteral(lexical_form)}"'
+
+    if term[0] == IRI and "\\" in term:
+        return "<" + getIRI(term) + ">"
+
+    return term
+
+"""
+@param: file_path, path to the N-Triples or N-Quads file
+@param: start, byte offset of the first line to be scanned
+@param: end, byte offset of the end of the last line to be scanned (None for the end of the file)
+@return generator of the (subject, predicate, object) triples as the N-Triples strings produced by lightrdf
+"""
+def iterTriples(file_path: str, start: int = 0, end: int = None):
+    for s, p, o in scanTriples(file_path, start, end):
+        #the terms without escape sequences and language tag are already the strings of lightrdf
+        if "\\" in s or "\\" in p:
+            s, p = toNTriples(s), toNTriples(p)
+        if "\\" in o or '"@' in o:
+            o = toNTriples(o)
+
+        yield s, p, o
+
+
+if __name__ == "__main__":
+    # read the command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "file",
+        type=str,
+        help="Path to the N-Triples or N-Quads file to be scanned"
+    )
+    parser.add_argument(
+        "--chunks",
+        type=int,
+        default=1,
+        help="Number of line-aligned chunks of the file, scanned one after the other (default 1)"
+    )
+    args = parser.parse_args()
+
+    started_at = time.time()
+    triples = 0
+
+    for start, end in getChunks(args.file, args.chunks):
+        for triple in scanTriples(args.file, start, end):
+            triples += 1
+
+    elapsed = time.time() - started_at
+    print(f"Triples: {triples}\tTime: {elapsed:.2f} s\tTriples/s: {triples / max(elapsed, 1e-9):.0f}")
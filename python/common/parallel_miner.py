@@ -0,0 +1,195 @@
+'''
+Parallel driver shared by the Python miners.
+
+The parsing of the RDF files is CPU bound and it holds the GIL, so the datasets are mined by a pool of
+processes. The driver:
+* dispatches the mineDataset calls of a miner to a pool of worker processes
+* initializes every worker with the miner initializer (log, manifest and cache of the worker)
+* limits the address space of every worker (memory ceiling), so a huge file raises a MemoryError in
+  its worker instead of pushing the host into swap
+* schedules the largest datasets first, so a big dataset does not start at the end of the run
+* merges the log records of all the workers in the log file of the main process (the records are written
+  by the main process only, so the multi-line records of different workers are never interleaved)
+* survives the crashed workers (segmentation fault, killed by the OOM killer): a crash breaks the whole pool,
+  so only the datasets that were being mined by the crashed workers are failed (when more datasets were being
+  mined, each of them is mined again alone to find the one that crashes) and the unfinished datasets are
+  mined by a new pool
+
+With a single worker the datasets are mined in the main process.
+'''
+
+import os
+import sys
+import logging
+import resource
+import traceback
+import multiprocessing
+from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+"""
+@param: dataset_path, path to the dataset folder
+@param: files, names of the dataset files that will be mined (None for all the files)
+@return size in bytes of the dataset files, used for scheduling the largest datasets first
+"""
+def getDatasetSize(dataset_path: str, files: list = None) -> int:
+    if files is None:
+        files = [entry.name for entry in os.scandir(dataset_path) if entry.is_file()]
+
+    size = 0
+    for file in files:
+        file_path = os.path.join(dataset_path, file)
+        if os.path.isfile(file_path):
+            size += os.path.getsize(file_path)
+
+    return size
+
+"""
+Initialization of a worker process
+
+@param: log_queue, queue where the log records of the worker are sent
+@param: memory_limit, maximum size in MB of the address space of the worker (None for no limit)
+@param: initializer, miner function that initializes the worker (e.g. opens the manifest), can be None
+@param: initargs, arguments of the initializer
+"""
+def initWorker(log_queue, memory_limit: int, initializer, initargs: tuple):
+    if memory_limit is not None:
+        limit = memory_limit * 1024 ** 2
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    #the log records are written by the main process
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(QueueHandler(log_queue))
+
+    if initializer is not None:
+        initializer(*initargs)
+
+"""
+Execution of a task in a worker process, the task is in the running dictionary while it is executed (a task
+that stays in the dictionary after the pool is broken was executed by a crashed worker)
+
+@param: running, dictionary shared with the main process (index of the task -> pid of the worker)
+@param: function, mineDataset function of the miner
+@param: index, index of the task
+@param: task, arguments of the function
+"""
+def runTask(running, function, index: int, task: tuple):
+    running[index] = os.getpid()
+    try:
+        return function(*task)
+    finally:
+        del running[index]
+
+"""
+@param: function, mineDataset function of the miner (it must be defined at the top level of the miner module)
+@param: tasks, list with a tuple of picklable mineDataset arguments for every dataset
+@param: workers, number of worker processes
+@param: initializer, miner function that initializes every worker process, can be None
+@param: initargs, arguments of the initializer
+@param: memory_limit, maximum size in MB of the address space of every worker (None for no limit)
+@param: sizes, list with the size of every dataset (None for keeping the given order)
+@param: on_done, function called with the task arguments every time a dataset is mined
+@return list with the arguments of the tasks that raised an exception or that crashed their worker
+"""
+def mineParallel(function, tasks: list, workers: int, initializer=None, initargs: tuple = (), memory_limit: int = None,
+                 sizes: list = None, on_done=None) -> list:
+
+    if sizes is not None:
+        #largest datasets first
+        order = sorted(range(len(tasks)), key=lambda i: sizes[i], reverse=True)
+        tasks = [tasks[i] for i in order]
+
+    failed_tasks = list()
+    log = logging.getLogger("parallel_miner")
+
+    if workers <= 1:
+        for task in tasks:
+            try:
+                function(*task)
+            except Exception:
+                log.error(f"Task: {task}\nError: {traceback.format_exc()}\n")
+                failed_tasks.append(task)
+
+            if on_done is not None:
+                on_done(task)
+
+        return failed_tasks
+
+    #the records of the workers are written by the handlers of the main process (a manager queue is used 
+    #because its put does not start a feeder thread, that could not be created under the memory ceiling)
+    sync_manager = multiprocessing.Manager()
+    log_queue = sync_manager.Queue()
+    listener = QueueListener(log_queue, *logging.getLogger().handlers, respect_handler_level=True)
+    listener.start()
+
+    running = sync_manager.dict()
+
+    #indexes of the tasks to be mined by the pool and of the tasks to be mined alone (suspected of a crash)
+    pending = list(range(len(tasks)))
+    isolated = list()
+
+    try:
+        while pending or isolated:
+            if isolated:
+                batch = [isolated.pop(0)]
+            else:
+                batch, pending = pending, list()
+
+            with ProcessPoolExecutor(max_workers=min(workers, len(batch)), initializer=initWorker,
+                                     initargs=(log_queue, memory_limit, initializer, initargs)) as executor:
+
+                futures = {executor.submit(runTask, running, function, index, tasks[index]): index for index in batch}
+                unfinished = list()
+
+                for future in as_completed(futures):
+                    index = futures[future]
+
+                    try:
+                        future.result()
+                    except BrokenProcessPool:
+                        #a worker crashed, the task is mined again or failed when the pool is recreated
+                        unfinished.append(index)
+                        continue
+                    except Exception as e:
+                        #e.g. a MemoryError raised by the memory ceiling
+                        log.error(f"Task: {tasks[index]}\nError: {type(e).__name__}: {e}\n")
+                        failed_tasks.append(tasks[index])
+
+                    if on_done is not None:
+                        on_done(tasks[index])
+
+            if not unfinished:
+                continue
+
+            #the tasks still running when the pool broke were mined by the crashed workers (if no task was
+            #running, e.g. a crash in the initializer, all the unfinished tasks are suspected)
+            crashed = [index for index in unfinished if index in running] or unfinished
+            running.clear()
+
+            if len(crashed) == 1:
+                log.error(f"Task: {tasks[crashed[0]]}\nError: the worker process crashed\n")
+                failed_tasks.append(tasks[crashed[0]])
+                if on_done is not None:
+                    on_done(tasks[crashed[0]])
+            else:
+                isolated.extend(crashed)
+
+            pending = sorted(set(pending) | (set(unfinished) - set(crashed)))
+    finally:
+        listener.stop()
+        sync_manager.shutdown()
+
+    return failed_tasks
+
+"""
+Print the number of failed tasks and exit with a non-zero status if a task failed
+
+@param: failed_tasks, list of the failed tasks returned by mineParallel
+"""
+def exitOnFailures(failed_tasks: list):
+    if failed_tasks:
+        print(f"Failed: {len(failed_tasks)} tasks, the errors are in the log file")
+        sys.exit(1)
@@ -0,0 +1,194 @@
+'''
+Persistent cache of the file type sniffing results, shared by the dataset checker and the file recoverer.
+
+For every sniffed file the cache stores:
+* the MIME type and the description returned by libmagic
+* the RDF syntax detected from the first bytes of the file (rdflib format name, None if not detected)
+* the presence of the UTF-8 BOM at the beginning of the file
+
+The records are keyed by the path of the file and they are valid while the size and the modification time
+of the file do not change, so a rerun over an unchanged collection does not open the files again.
+Only the header of the file (first HEADER_SIZE bytes) is read for the sniffing.
+'''
+
+import os
+import re
+import magic
+import sqlite3
+
+#name of the default sniff cache file, stored next to the datasets folder
+SNIFF_CACHE_FILE_NAME = "acordar_sniff_cache.sqlite"
+
+#number of bytes read from every file for the sniffing
+HEADER_SIZE = 8192
+
+#UTF-8 BOM sequence
+UTF8_BOM = b"\xEF\xBB\xBF"
+
+#RDF terms used for the detection of the N-Triples and N-Quads syntaxes
+IRI = r'<[^<>"{}|^`\\\s]*>'
+BLANK_NODE = r'_:\S+'
+LITERAL = r'"(?:[^"\\]|\\.)*"(?:@[a-zA-Z0-9-]+|\^\^' + IRI + r')?'
+NT_LINE = re.compile(rf'^(?:{IRI}|{BLANK_NODE})\s*{IRI}\s*(?:{IRI}|{BLANK_NODE}|{LITERAL})\s*\.\s*$')
+NQ_LINE = re.compile(rf'^(?:{IRI}|{BLANK_NODE})\s*{IRI}\s*(?:{IRI}|{BLANK_NODE}|{LITERAL})\s*(?:{IRI}|{BLANK_NODE})\s*\.\s*$')
+
+#directives of the Turtle family syntaxes
+TURTLE_DIRECTIVE = re.compile(r'^\s*(?:@prefix|@base|PREFIX\s|BASE\s)', re.IGNORECASE | re.MULTILINE)
+
+"""
+@param: datasets_folder, path to the folder where all the datasets are stored
+@return path of the default sniff cache of the datasets folder
+"""
+def getDefaultSniffCachePath(datasets_folder: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(datasets_folder)), SNIFF_CACHE_FILE_NAME)
+
+"""
+@param: header, first bytes of the file
+@return rdflib name of the RDF syntax of the file, None if the syntax is not detected
+"""
+def detectRDFSyntax(header: bytes) -> str:
+    text = header.removeprefix(UTF8_BOM).decode("utf-8", errors="ignore")
+    start = text.lstrip()
+
+    #check the first statement lines (the last line can be truncated by the header size)
+    lines = [line.strip() for line in text.splitlines()[:-1] if line.strip() and not line.lstrip().startswith("#")]
+
+    if lines:
+        if all(NT_LINE.match(line) for line in lines[:10]):
+            return "nt"
+        if all(NT_LINE.match(line) or NQ_LINE.match(line) for line in lines[:10]):
+            return "nquads"
+
+    if start.startswith("<"):
+        if "<rdf:RDF" in text or "http://www.w3.org/1999/02/22-rdf-syntax-ns#" in text:
+            return "xml"
+        if "<TriX" in text:
+            return "trix"
+        return None
+
+    if start.startswith("{") or start.startswith("["):
+        if "@context" in text or "@id" in text or "@graph" in text:
+            return "json-ld"
+        return None
+
+    if TURTLE_DIRECTIVE.search(text):
+        return "turtle"
+
+    return None
+
+
+class SniffCache:
+
+    """
+    @param: cache_path, path to the SQLite cache file (created if it does not exist)
+    """
+    def __init__(self, cache_path: str):
+        self.connection = sqlite3.connect(cache_path, timeout=60)
+        self.connection.row_factory = sqlite3.Row
+
+        #WAL mode: the worker processes can read while the main process writes
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sniffs (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                mime TEXT,
+                description TEXT,
+                syntax TEXT,
+                bom INTEGER NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+
+        #libmagic handles, created only when a file must be sniffed
+        self.magic_description = None
+        self.magic_mime = None
+
+    """
+    @param: file_path, path to the file
+    @return the cached sniffing result of the file (dictionary), None if the file is not cached or it is changed
+    """
+    def lookup(self, file_path: str) -> dict:
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+
+        row = self.connection.execute("SELECT * FROM sniffs WHERE path = ?", (file_path,)).fetchone()
+
+        if row is None or row["size"] != stat.st_size or row["mtime_ns"] != stat.st_mtime_ns:
+            return None
+
+        result = dict(row)
+        result["bom"] = bool(result["bom"])
+        return result
+
+    """
+    Sniff the file without using the cache
+
+    @param: file_path, path to the file
+    @return dictionary with the path, size, mtime_ns, mime, description, syntax and bom of the file
+    """
+    def compute(self, file_path: str) -> dict:
+        if self.magic_description is None:
+            self.magic_description = magic.Magic()
+            self.magic_mime = magic.Magic(mime=True)
+
+        file_path = os.path.abspath(file_path)
+
+        with open(file_path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            header = file.read(HEADER_SIZE)
+
+        return {
+            "path": file_path,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "mime": self.magic_mime.from_buffer(header),
+            "description": self.magic_description.from_buffer(header),
+            "syntax": detectRDFSyntax(header),
+            "bom": header.startswith(UTF8_BOM)
+        }
+
+    """
+    @param: results, list of sniffing results returned by compute()
+    """
+    def store(self, results: list):
+        with self.connection:
+            self.connection.executemany(
+                """
+                INSERT OR REPLACE INTO sniffs (path, size, mtime_ns, mime, description, syntax, bom)
+                VALUES (:path, :size, :mtime_ns, :mime, :description, :syntax, :bom)
+                """,
+                results
+            )
+
+    """
+    @param: file_path, path to the file
+    @return the sniffing result of the file, computed and stored only if the file is not cached
+    """
+    def sniff(self, file_path: str) -> dict:
+        result = self.lookup(file_path)
+
+        if result is None:
+            result = self.compute(file_path)
+            self.store([result])
+
+        return result
+
+    """
+    Move the cached result of a renamed file (the rename does not change the size and the mtime of the file)
+
+    @param: old_path, old path of the file
+    @param: new_path, new path of the file
+    """
+    def move(self, old_path: str, new_path: str):
+        with self.connection:
+            self.connection.execute("DELETE FROM sniffs WHERE path = ?", (os.path.abspath(new_path),))
+            self.connection.execute(
+                "UPDATE sniffs SET path = ? WHERE path = ?", (os.path.abspath(new_path), os.path.abspath(old_path))
+            )
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,514 @@
+'''
+Term dictionary of the dataset content produced by the miners.
+
+The lists of the dataset content repeat the same URIs, property names and literals thousands of times (e.g. the
+subject of every triple is added to the entities). The DatasetContent stores every distinct term only once in
+the term dictionary, with an integer id, and for every field (classes, entities, literals, properties) it keeps:
+* the ids of the added terms, in an unsigned int array (4 bytes for every added term)
+* the number of occurrences of every term in the field
+
+The dataset content can be written:
+* in the original layout (a JSON object with a list of strings for every field), built back from the ids
+* in the term dictionary layout, a JSON object with the list of the distinct terms and, for every field, the
+  ids of its terms with their number of occurrences:
+
+  {"terms": ["http://...", ...], "classes": {"ids": [0, 5, ...], "counts": [12, 1, ...]}, ...}
+
+  the multiset of the terms of every field is preserved (the order of the terms is not)
+* in the JSON Lines layout, a {"field": ...} line before the terms of every field and a line with a JSON
+  string for every added term (optionally compressed with gzip, .jsonl.gz files):
+
+  {"field": "classes"}
+  "http://..."
+
+All the layouts are written in streaming (the content is never serialized in a single string) and the original
+and JSON Lines layouts are also read in streaming, a term at a time, so the consumers of the dataset content
+(e.g. the cleaner) do not have to load a whole file in memory. A file is written in a temporary file that
+replaces it only when it is complete, so an interrupted writing never leaves a truncated dataset content.
+'''
+
+import os
+import gzip
+import json
+from array import array
+from contextlib import contextmanager
+
+#fields of the dataset content
+FIELDS = ["classes", "entities", "literals", "properties"]
+
+#output formats of the dataset content and suffixes of their files
+OUTPUT_FORMATS = {"json": ".json", "terms": ".terms.json", "jsonl": ".jsonl", "jsonl.gz": ".jsonl.gz"}
+
+#number of lines written together in the streaming writing
+WRITE_BATCH = 4096
+
+"""
+@param: path, path of a dataset content file
+@param: mode, "r" for reading or "w" for writing
+@param: compressed, True for a file compressed with gzip (None for the .gz files)
+@return the file opened in text mode, the .gz files are compressed with gzip
+"""
+def openContentFile(path: str, mode: str, compressed: bool = None):
+    if path.endswith(".gz") if compressed is None else compressed:
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=6)
+    return open(path, mode, encoding="utf-8")
+
+"""
+Open a temporary file for writing a dataset content file, the temporary file replaces the dataset content
+file only when it is completely written (it is removed if the writing fails)
+
+@param: path, path of the dataset content file
+"""
+@contextmanager
+def createContentFile(path: str):
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+
+    try:
+        with openContentFile(temporary_path, "w", path.endswith(".gz")) as dataset_content_file:
+            yield dataset_content_file
+
+        #the content is on the disk before it replaces the file (e.g. before the original is removed)
+        temporary_fd = os.open(temporary_path, os.O_RDONLY)
+        try:
+            os.fsync(temporary_fd)
+        finally:
+            os.close(temporary_fd)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+    os.replace(temporary_path, path)
+
+
+class JSONLinesWriter:
+
+    """
+    Streaming writer of the JSON Lines layout, the terms of the same field should be added together
+
+    @param: dataset_content_file, file opened for writing
+    """
+    def __init__(self, dataset_content_file):
+        self.dataset_content_file = dataset_content_file
+        self.field = None
+
+    """
+    @param: field, field of the dataset content
+    @param: terms, iterable of terms of the field
+    """
+    def write(self, field: str, terms):
+        if field != self.field:
+            self.dataset_content_file.write(json.dumps({"field": field}) + "\n")
+            self.field = field
+
+        if len(terms) > 0:
+            #the terms are encoded together, a term for every line
+            self.dataset_content_file.write(json.dumps(list(terms), ensure_ascii=False, separators=("\n", ":"))[1:-1] + "\n")
+
+    def close(self):
+        #nothing to be closed, the method is used with the same interface of the JSONWriter
+        pass
+
+
+class JSONWriter:
+
+    """
+    Streaming writer of the original layout, with the same formatting of json.dumps(..., indent=4). The terms of
+    the same field should be added together, the fields that are never written are written as empty lists
+
+    @param: dataset_content_file, file opened for writing
+    @param: field_order, order of the fields in the file (the missing fields are written in this order)
+    """
+    def __init__(self, dataset_content_file, field_order: list = FIELDS):
+        self.dataset_content_file = dataset_content_file
+        self.field_order = field_order
+        self.fields = list()
+        self.written_terms = 0
+
+    """
+    @param: field, field of the dataset content
+    @param: terms, list of terms of the field (it can be empty, the field is written anyway)
+    """
+    def write(self, field: str, terms: list):
+        if field not in self.fields[-1:]:
+            #the missing fields before the field are written as empty lists, so the fields keep their order
+            if field in self.field_order:
+                for previous_field in self.field_order[:self.field_order.index(field)]:
+                    if previous_field not in self.fields:
+                        self.openField(previous_field)
+
+            self.openField(field)
+
+        if len(terms) > 0:
+            #the terms are encoded together, with the separators of the indented layout
+            lines = "\n        " + json.dumps(list(terms), ensure_ascii=False, separators=(",\n        ", ":"))[1:-1]
+            self.dataset_content_file.write(("," if self.written_terms > 0 else "") + lines)
+            self.written_terms += len(terms)
+
+    """
+    @param: field, field of the dataset content
+    """
+    def openField(self, field: str):
+        self.closeField()
+        self.dataset_content_file.write(("," if self.fields else "{") + f"\n    \"{field}\": [")
+        self.fields.append(field)
+        self.written_terms = 0
+
+    def closeField(self):
+        if self.fields:
+            self.dataset_content_file.write("\n    ]" if self.written_terms > 0 else "]")
+
+    def close(self):
+        for field in self.field_order:
+            if field not in self.fields:
+                self.openField(field)
+
+        self.closeField()
+        self.dataset_content_file.write("\n}")
+
+
+class DatasetContent:
+
+    def __init__(self):
+        #term -> id and id -> term
+        self.term_ids = dict()
+        self.terms = list()
+
+        self.ids = {field: array("I") for field in FIELDS}
+        self.counts = {field: array("I") for field in FIELDS}
+
+    """
+    @param: term, string (or rdflib term) to be added to the dictionary
+    @return id of the term
+    """
+    def getId(self, term) -> int:
+        term = str(term)
+        term_id = self.term_ids.get(term)
+
+        if term_id is None:
+            term_id = len(self.terms)
+            self.term_ids[term] = term_id
+            self.terms.append(term)
+
+            for field in FIELDS:
+                self.counts[field].append(0)
+
+        return term_id
+
+    """
+    @param: field, field of the dataset content
+    @param: term, term to be added to the field
+    """
+    def add(self, field: str, term):
+        term_id = self.getId(term)
+        self.ids[field].append(term_id)
+        self.counts[field][term_id] += 1
+
+    """
+    @param: field, field of the dataset content
+    @param: terms, iterable of terms to be added to the field
+    """
+    def extend(self, field: str, terms):
+        for term in terms:
+            self.add(field, term)
+
+    """
+    @param: result, dictionary with a list of terms for every field (e.g. an extraction result)
+    """
+    def update(self, result: dict):
+        for field in FIELDS:
+            self.extend(field, result.get(field, []))
+
+    """
+    @param: field, field of the dataset content
+    @return number of terms added to the field
+    """
+    def getSize(self, field: str) -> int:
+        return len(self.ids[field])
+
+    """
+    @param: field, field of the dataset content
+    @return list with the terms of the field, in the order they were added
+    """
+    def getList(self, field: str) -> list:
+        terms = self.terms
+        return [terms[term_id] for term_id in self.ids[field]]
+
+    """
+    @param: field, field of the dataset content
+    @return dictionary term -> number of occurrences of the term in the field
+    """
+    def getCounts(self, field: str) -> dict:
+        return {self.terms[term_id]: count for term_id, count in enumerate(self.counts[field]) if count > 0}
+
+    """
+    @return dataset content in the original layout
+    """
+    def toDict(self) -> dict:
+        return {field: self.getList(field) for field in FIELDS}
+
+    """
+    @return dataset content in the term dictionary layout
+    """
+    def toTermsDict(self) -> dict:
+        content = {"terms": self.terms}
+
+        for field in FIELDS:
+            counts = self.counts[field]
+            ids = [term_id for term_id in range(len(counts)) if counts[term_id] > 0]
+            content[field] = {"ids": ids, "counts": [counts[term_id] for term_id in ids]}
+
+        return content
+
+    """
+    @param: content, dataset content in the term dictionary layout
+    @return the DatasetContent, the terms of every field are sorted by id
+    """
+    @staticmethod
+    def fromTermsDict(content: dict) -> "DatasetContent":
+        dataset_content = DatasetContent()
+
+        for term in content["terms"]:
+            dataset_content.getId(term)
+
+        for field in FIELDS:
+            for term_id, count in zip(content[field]["ids"], content[field]["counts"]):
+                dataset_content.ids[field].extend([term_id] * count)
+                dataset_content.counts[field][term_id] += count
+
+        return dataset_content
+
+    """
+    Write the dataset content in the original layout, with the same formatting of json.dumps(..., indent=4)
+
+    @param: dataset_content_file, file opened for writing
+    """
+    def writeJSON(self, dataset_content_file):
+        terms = self.terms
+        writer = JSONWriter(dataset_content_file)
+
+        for field in FIELDS:
+            ids = self.ids[field]
+            writer.write(field, [])
+
+            for start in range(0, len(ids), WRITE_BATCH):
+                writer.write(field, [terms[term_id] for term_id in ids[start:start + WRITE_BATCH]])
+
+        writer.close()
+
+    """
+    Write the dataset content in the JSON Lines layout
+
+    @param: dataset_content_file, file opened for writing
+    """
+    def writeJSONL(self, dataset_content_file):
+        terms = self.terms
+        writer = JSONLinesWriter(dataset_content_file)
+
+        for field in FIELDS:
+            ids = self.ids[field]
+
+            for start in range(0, len(ids), WRITE_BATCH):
+                writer.write(field, [terms[term_id] for term_id in ids[start:start + WRITE_BATCH]])
+
+    """
+    @param: base_path, path of the output file without the suffix (e.g. path_to_dataset/dataset_content_rdflib)
+    @param: output_format, "json" for the original layout, "terms" for the term dictionary layout, "jsonl" or 
+    "jsonl.gz" for the JSON Lines layout
+    @return path of the written file
+    """
+    def write(self, base_path: str, output_format: str = "json") -> str:
+        output_path = base_path + OUTPUT_FORMATS[output_format]
+
+        with createContentFile(output_path) as dataset_content_file:
+            if output_format == "json":
+                self.writeJSON(dataset_content_file)
+            elif output_format in ("jsonl", "jsonl.gz"):
+                self.writeJSONL(dataset_content_file)
+            else:
+                json.dump(self.toTermsDict(), dataset_content_file, ensure_ascii=False)
+
+        return output_path
+
+
+"""
+@param: path, path of a dataset content file
+@return layout of the file ("json", "terms", "jsonl" or "jsonl.gz"), given by its suffix
+"""
+def getFormat(path: str) -> str:
+    for output_format in ["terms", "jsonl", "jsonl.gz"]:
+        if path.endswith(OUTPUT_FORMATS[output_format]):
+            return output_format
+    return "json"
+
+"""
+@param: path, path of a dataset content file
+@return path of the file without the suffix of its layout
+"""
+def getBasePath(path: str) -> str:
+    return path[:-len(OUTPUT_FORMATS[getFormat(path)])]
+
+"""
+@param: base_path, path of the dataset content file without the suffix (e.g. path_to_dataset/dataset_content_rdflib)
+@return path of the existing dataset content file in any layout, None if there is no file
+"""
+def findDatasetContent(base_path: str) -> str:
+    for suffix in OUTPUT_FORMATS.values():
+        if os.path.exists(base_path + suffix):
+            return base_path + suffix
+    return None
+
+"""
+Read in streaming a file in the original layout, written with one term for every line (as json.dumps with 
+indent and the pretty printing of Gson)
+
+@param: dataset_content_file, file opened for reading
+@return generator of the (field, term) pairs
+"""
+def iterJSONLines(dataset_content_file):
+    field = None
+    lines = list()
+
+    for line in dataset_content_file:
+        line = line.strip()
+
+        if line in ("{", "}", ""):
+            continue
+
+        if field is None:
+            #"field": [ or "field": [], 
+            key, _, value = line.partition(":")
+            value = value.strip().rstrip(",")
+            if value == "[":
+                field = json.loads(key)
+            elif value != "[]":
+                raise ValueError(f"Unexpected line in the dataset content file: {line[:100]}")
+        elif line.rstrip(",") == "]":
+            yield from decodeLines(field, lines)
+            lines = list()
+            field = None
+        else:
+            lines.append(line.rstrip(","))
+
+            if len(lines) == WRITE_BATCH:
+                yield from decodeLines(field, lines)
+                lines = list()
+
+"""
+@param: field, field of the dataset content
+@param: lines, lines with a JSON string for every term
+@return generator of the (field, term) pairs of the lines, decoded together
+"""
+def decodeLines(field: str, lines: list):
+    for term in json.loads("[" + ",".join(lines) + "]"):
+        yield field, term
+
+"""
+@param: path, path of a dataset content file in any layout
+@return generator of the (field, term) pairs of the file, the original and JSON Lines layouts are read in streaming
+"""
+def iterDatasetContent(path: str):
+    output_format = getFormat(path)
+
+    with openContentFile(path, "r") as dataset_content_file:
+        if output_format in ("jsonl", "jsonl.gz"):
+            field = None
+            lines = list()
+
+            for line in dataset_content_file:
+                if line.startswith("{"):
+                    yield from decodeLines(field, lines)
+                    lines = list()
+                    field = json.loads(line)["field"]
+                elif line.strip():
+                    lines.append(line.strip())
+
+                    if len(lines) == WRITE_BATCH:
+                        yield from decodeLines(field, lines)
+                        lines = list()
+
+            yield from decodeLines(field, lines)
+            return
+
+        if output_format == "json":
+            #the pretty printed files have a term for every line, the other files are loaded
+            first_line = dataset_content_file.readline()
+            if first_line.strip() == "{":
+                yield from iterJSONLines(dataset_content_file)
+                return
+            dataset_content_file.seek(0)
+
+        content = json.load(dataset_content_file)
+
+    if output_format == "terms":
+        dataset_content = DatasetContent.fromTermsDict(content)
+        for field in FIELDS:
+            for term in dataset_content.getList(field):
+                yield field, term
+    else:
+        for field in FIELDS:
+            for term in content.get(field, []):
+                yield field, term
+
+"""
+@param: path, path of a dataset content file in any layout
+@return the DatasetContent of the file
+"""
+def readDatasetContent(path: str) -> DatasetContent:
+    if getFormat(path) == "terms":
+        with open(path, "r", encoding="utf-8") as dataset_content_file:
+            return DatasetContent.fromTermsDict(json.load(dataset_content_file))
+
+    dataset_content = DatasetContent()
+    for field, term in iterDatasetContent(path):
+        dataset_content.add(field, term)
+
+    return dataset_content
+
+"""
+@param: path, path of a dataset content file in any layout
+@param: batch_size, maximum number of terms of a batch
+@return generator of the (field, terms) pairs of the file, with the terms of a field in batches of batch_size terms
+"""
+def iterDatasetBatches(path: str, batch_size: int = WRITE_BATCH):
+    batch_field, batch = None, list()
+
+    for field, term in iterDatasetContent(path):
+        if field != batch_field or len(batch) == batch_size:
+            if batch:
+                yield batch_field, batch
+            batch_field, batch = field, list()
+
+        batch.append(term)
+
+    if batch:
+        yield batch_field, batch
+
+"""
+Write in streaming a dataset content given as a sequence of batches of terms
+
+@param: base_path, path of the output file without the suffix (e.g. path_to_dataset/dataset_content_rdflib)
+@param: output_format, layout of the file ("json", "terms", "jsonl" or "jsonl.gz"), the term dictionary layout 
+is written at the end because it needs all the term counts
+@param: batches, iterable of (field, terms) pairs, the terms of the same field should be given together
+@param: field_order, order of the fields of the original layout (the batches should be given in this order)
+@return path of the written file
+"""
+def writeDatasetContent(base_path: str, output_format: str, batches, field_order: list = FIELDS) -> str:
+    if output_format == "terms":
+        dataset_content = DatasetContent()
+        for field, terms in batches:
+            dataset_content.extend(field, terms)
+        return dataset_content.write(base_path, output_format)
+
+    output_path = base_path + OUTPUT_FORMATS[output_format]
+
+    with createContentFile(output_path) as dataset_content_file:
+        writer = JSONWriter(dataset_content_file, field_order) if output_format == "json" else JSONLinesWriter(dataset_content_file)
+
+        for field, terms in batches:
+            writer.write(field, terms)
+
+        writer.close()
+
+    return output_path
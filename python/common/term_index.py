@@ -0,0 +1,520 @@
+'''
+Global term frequency index of the dataset content, built by the miners while they mine the datasets.
+
+The statistics of the terms over the whole collection (e.g. for the analysis notebooks, the Lucene indexing or
+the detection of the stopwords) would need to read again all the dataset content files. The miners add the
+content of every mined dataset to this index, a SQLite database with:
+* the dictionary of the terms (term -> integer id)
+* the exact frequencies of every term for every stage (miner) and field: the term frequency (number of
+  occurrences in the collection) and the document frequency (number of datasets with the term)
+* the counts of the terms of every dataset, stored as arrays of term ids and counts, so the frequencies of a
+  single dataset can be read and a dataset mined again replaces its previous counts
+* a HyperLogLog sketch of the distinct terms of every dataset and field, so the number of distinct terms of
+  any group of datasets (or of the whole collection) is estimated by merging the sketches, without reading
+  the counts
+
+The indexes built on different machines (or by different runs) can be merged: the datasets of the merged
+index replace the same datasets of the index.
+
+It can also be used from the command line for indexing the content files already mined (e.g. by the Java
+miners), merging the indexes and querying the statistics:
+
+python3 term_index.py build path_to_datasets_folder jena
+python3 term_index.py merge path_to_index path_to_other_index1 path_to_other_index2 ...
+python3 term_index.py stats path_to_index rdflib literals --top 50 --stopwords 0.5
+python3 term_index.py term path_to_index rdflib properties http://www.w3.org/2000/01/rdf-schema#label
+'''
+
+import os
+import sys
+import sqlite3
+import hashlib
+import argparse
+import numpy as np
+from array import array
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.manifest import getDatasetId
+from common.term_dictionary import FIELDS, DatasetContent, findDatasetContent, readDatasetContent
+
+#name of the default term index file, stored next to the datasets folder
+TERM_INDEX_FILE_NAME = "acordar_term_index.sqlite"
+
+#the first bits of the hash of a term select one of the 2^HLL_PRECISION registers of the HyperLogLog
+#(1 KB for every dataset and field, with a standard error of about 3%)
+HLL_PRECISION = 10
+
+#the position of the first bit set is computed on the last HLL_BITS bits of the hash (exact in a float64)
+HLL_BITS = 50
+
+#maximum number of parameters of a SQLite query
+QUERY_BATCH = 900
+
+"""
+@param: datasets_folder, path to the folder where all the datasets are stored
+@return path of the default term index of the datasets folder
+"""
+def getDefaultTermIndexPath(datasets_folder: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(datasets_folder)), TERM_INDEX_FILE_NAME)
+
+"""
+@param: terms, list of terms
+@return NumPy array with the 64-bit hash of every term
+"""
+def hashTerms(terms: list) -> np.ndarray:
+    digests = b"".join(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest() for term in terms)
+    return np.frombuffer(digests, dtype="<u8")
+
+
+class HyperLogLog:
+
+    """
+    @param: registers, bytes of the registers of an existing sketch (None for an empty sketch)
+    """
+    def __init__(self, registers: bytes = None):
+        if registers is None:
+            self.registers = np.zeros(1 << HLL_PRECISION, dtype=np.uint8)
+        else:
+            self.registers = np.frombuffer(registers, dtype=np.uint8).copy()
+
+    """
+    @param: terms, list of terms to be added to the sketch
+    """
+    def add(self, terms: list):
+        if len(terms) == 0:
+            return
+
+        hashes = hashTerms(terms)
+        indexes = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+
+        #position of the first bit set in the last bits of the hash
+        rest = (hashes & np.uint64((1 << HLL_BITS) - 1)).astype(np.float64)
+        ranks = (HLL_BITS + 1 - np.frexp(rest)[1]).astype(np.uint8)
+
+        np.maximum.at(self.registers, indexes, ranks)
+
+    """
+    @param: other, HyperLogLog merged in this sketch (the union of the two sets of terms)
+    """
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    """
+    @return estimate of the number of distinct terms added to the sketch
+    """
+    def count(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+
+        #small range correction (linear counting)
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros > 0:
+            estimate = m * np.log(m / zeros)
+
+        return int(round(estimate))
+
+    """
+    @return bytes of the registers of the sketch
+    """
+    def toBytes(self) -> bytes:
+        return self.registers.tobytes()
+
+
+class TermIndex:
+
+    """
+    @param: index_path, path to the SQLite term index file (created if it does not exist)
+    """
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+
+        #the transactions are explicit, a dataset is added in a single transaction
+        self.connection = sqlite3.connect(index_path, timeout=600, isolation_level=None)
+
+        #WAL mode: the queries are not blocked by the miners that add their datasets
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS terms (
+                term_id INTEGER PRIMARY KEY,
+                term TEXT NOT NULL UNIQUE
+            )
+            """
+        )
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS frequencies (
+                stage TEXT NOT NULL,
+                field TEXT NOT NULL,
+                term_id INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                df INTEGER NOT NULL,
+                PRIMARY KEY (stage, field, term_id)
+            ) WITHOUT ROWID
+            """
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS frequencies_df ON frequencies (stage, field, df)")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS datasets (
+                stage TEXT NOT NULL,
+                dataset_id TEXT NOT NULL,
+                field TEXT NOT NULL,
+                total_terms INTEGER NOT NULL,
+                distinct_terms INTEGER NOT NULL,
+                term_ids BLOB NOT NULL,
+                counts BLOB NOT NULL,
+                sketch BLOB NOT NULL,
+                PRIMARY KEY (stage, dataset_id, field)
+            )
+            """
+        )
+
+        #counts of the field of the dataset that is being added (or removed), the frequencies are updated with
+        #a single statement for all the terms of the field
+        self.connection.execute("PRAGMA temp_store=MEMORY")
+        self.connection.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS field_terms (position INTEGER PRIMARY KEY, term TEXT NOT NULL, term_id INTEGER, count INTEGER NOT NULL)"
+        )
+        self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS removed_terms (term_id INTEGER PRIMARY KEY, count INTEGER NOT NULL)")
+
+    """
+    @param: terms, list of distinct terms of a field
+    @param: counts, list with the number of occurrences of every term
+    @return list with the id of every term, the new terms are added to the dictionary
+    """
+    def loadFieldTerms(self, terms: list, counts: list) -> list:
+        self.connection.execute("DELETE FROM temp.field_terms")
+        self.connection.executemany("INSERT INTO temp.field_terms (position, term, count) VALUES (?, ?, ?)", zip(range(len(terms)), terms, counts))
+        self.connection.execute("INSERT OR IGNORE INTO terms (term) SELECT term FROM temp.field_terms")
+        self.connection.execute("UPDATE temp.field_terms SET term_id = (SELECT term_id FROM terms WHERE terms.term = field_terms.term)")
+
+        return [row[0] for row in self.connection.execute("SELECT term_id FROM temp.field_terms ORDER BY position")]
+
+    """
+    @param: term_ids, list of term ids
+    @return dictionary term id -> term
+    """
+    def getTerms(self, term_ids: list) -> dict:
+        terms = dict()
+
+        for start in range(0, len(term_ids), QUERY_BATCH):
+            batch = term_ids[start:start + QUERY_BATCH]
+            query = f"SELECT term_id, term FROM terms WHERE term_id IN ({', '.join('?' for _ in batch)})"
+            terms.update(self.connection.execute(query, batch).fetchall())
+
+        return terms
+
+    """
+    Remove the counts of a dataset from the frequencies, it must be called in a transaction
+
+    @param: stage, name of the miner
+    @param: dataset_id, id of the dataset
+    """
+    def removeCounts(self, stage: str, dataset_id: str):
+        rows = self.connection.execute(
+            "SELECT field, term_ids, counts FROM datasets WHERE stage = ? AND dataset_id = ?", (stage, dataset_id)
+        ).fetchall()
+
+        for field, term_ids, counts in rows:
+            term_ids = array("I", term_ids)
+            counts = array("I", counts)
+
+            self.connection.execute("DELETE FROM temp.removed_terms")
+            self.connection.executemany("INSERT INTO temp.removed_terms (term_id, count) VALUES (?, ?)", zip(term_ids, counts))
+
+            self.connection.execute(
+                """
+                UPDATE frequencies SET df = df - 1,
+                    tf = tf - (SELECT count FROM temp.removed_terms WHERE removed_terms.term_id = frequencies.term_id)
+                WHERE stage = ? AND field = ? AND term_id IN (SELECT term_id FROM temp.removed_terms)
+                """,
+                (stage, field)
+            )
+            self.connection.execute(
+                "DELETE FROM frequencies WHERE stage = ? AND field = ? AND term_id IN (SELECT term_id FROM temp.removed_terms) AND df <= 0",
+                (stage, field)
+            )
+
+        self.connection.execute("DELETE FROM datasets WHERE stage = ? AND dataset_id = ?", (stage, dataset_id))
+
+    """
+    Add (or replace) the counts of the terms of a dataset
+
+    @param: stage, name of the miner
+    @param: dataset_id, id of the dataset (or name of the dataset directory)
+    @param: field_counts, dictionary field -> dictionary term -> number of occurrences of the term in the field
+    """
+    def addCounts(self, stage: str, dataset_id, field_counts: dict):
+        dataset_id = getDatasetId(dataset_id)
+
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            #a dataset mined again replaces its previous counts
+            self.removeCounts(stage, dataset_id)
+
+            for field, counts in field_counts.items():
+                terms = list(counts.keys())
+                term_counts = list(counts.values())
+                term_ids = self.loadFieldTerms(terms, term_counts)
+
+                #WHERE true: the ON CONFLICT clause of an INSERT ... SELECT needs a WHERE clause
+                self.connection.execute(
+                    """
+                    INSERT INTO frequencies (stage, field, term_id, tf, df)
+                    SELECT ?, ?, term_id, count, 1 FROM temp.field_terms WHERE true
+                    ON CONFLICT (stage, field, term_id) DO UPDATE SET tf = tf + excluded.tf, df = df + 1
+                    """,
+                    (stage, field)
+                )
+
+                sketch = HyperLogLog()
+                sketch.add(terms)
+
+                self.connection.execute(
+                    "INSERT INTO datasets (stage, dataset_id, field, total_terms, distinct_terms, term_ids, counts, sketch) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (stage, dataset_id, field, sum(term_counts), len(terms), array("I", term_ids).tobytes(),
+                     array("I", term_counts).tobytes(), sketch.toBytes())
+                )
+
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    """
+    @param: stage, name of the miner
+    @param: dataset_id, id of the dataset (or name of the dataset directory)
+    @param: dataset_content, DatasetContent mined from the dataset
+    """
+    def addDataset(self, stage: str, dataset_id, dataset_content: DatasetContent):
+        self.addCounts(stage, dataset_id, {field: dataset_content.getCounts(field) for field in FIELDS})
+
+    """
+    @param: stage, name of the miner
+    @param: dataset_id, id of the dataset (or name of the dataset directory)
+    """
+    def removeDataset(self, stage: str, dataset_id):
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.removeCounts(stage, getDatasetId(dataset_id))
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    """
+    Merge another term index in this index
+
+    @param: other_index_path, path to the term index to be merged
+    """
+    def merge(self, other_index_path: str):
+        other = TermIndex(other_index_path)
+
+        datasets = other.connection.execute("SELECT DISTINCT stage, dataset_id FROM datasets").fetchall()
+
+        for stage, dataset_id in tqdm(datasets):
+            field_counts = dict()
+
+            for field, term_ids, counts in other.connection.execute(
+                "SELECT field, term_ids, counts FROM datasets WHERE stage = ? AND dataset_id = ?", (stage, dataset_id)
+            ):
+                term_ids = array("I", term_ids)
+                terms = other.getTerms(list(term_ids))
+                field_counts[field] = {terms[term_id]: count for term_id, count in zip(term_ids, array("I", counts))}
+
+            self.addCounts(stage, dataset_id, field_counts)
+
+        other.close()
+
+    """
+    @param: stage, name of the miner
+    @return number of datasets of the stage in the index
+    """
+    def getDatasetCount(self, stage: str) -> int:
+        return self.connection.execute("SELECT COUNT(DISTINCT dataset_id) FROM datasets WHERE stage = ?", (stage,)).fetchone()[0]
+
+    """
+    @param: stage, name of the miner
+    @param: field, field of the dataset content
+    @param: term, term
+    @return (term frequency, document frequency) of the term, (0, 0) if the term is not in the index
+    """
+    def getFrequency(self, stage: str, field: str, term: str) -> tuple:
+        row = self.connection.execute(
+            """
+            SELECT tf, df FROM frequencies JOIN terms ON terms.term_id = frequencies.term_id
+            WHERE stage = ? AND field = ? AND term = ?
+            """,
+            (stage, field, term)
+        ).fetchone()
+
+        return (0, 0) if row is None else tuple(row)
+
+    """
+    @param: stage, name of the miner
+    @param: field, field of the dataset content
+    @param: limit, number of terms
+    @param: order, "df" for the terms in the most datasets, "tf" for the most frequent terms
+    @return list of (term, term frequency, document frequency) tuples
+    """
+    def getTopTerms(self, stage: str, field: str, limit: int = 100, order: str = "df") -> list:
+        order = "df DESC, tf DESC" if order == "df" else "tf DESC, df DESC"
+
+        return self.connection.execute(
+            f"""
+            SELECT term, tf, df FROM frequencies JOIN terms ON terms.term_id = frequencies.term_id
+            WHERE stage = ? AND field = ? ORDER BY {order} LIMIT ?
+            """,
+            (stage, field, limit)
+        ).fetchall()
+
+    """
+    @param: stage, name of the miner
+    @param: field, field of the dataset content
+    @param: min_df_ratio, minimum fraction of the datasets that contain a stopword
+    @return list of (term, term frequency, document frequency) tuples of the terms contained in at least
+            min_df_ratio of the datasets, in the most datasets first
+    """
+    def getStopwords(self, stage: str, field: str, min_df_ratio: float = 0.5) -> list:
+        min_df = max(1, int(np.ceil(min_df_ratio * self.getDatasetCount(stage))))
+
+        return self.connection.execute(
+            """
+            SELECT term, tf, df FROM frequencies JOIN terms ON terms.term_id = frequencies.term_id
+            WHERE stage = ? AND field = ? AND df >= ? ORDER BY df DESC, tf DESC
+            """,
+            (stage, field, min_df)
+        ).fetchall()
+
+    """
+    @param: stage, name of the miner
+    @param: dataset_id, id of the dataset (or name of the dataset directory)
+    @param: field, field of the dataset content
+    @return dictionary term -> number of occurrences of the term in the field of the dataset
+    """
+    def getDatasetCounts(self, stage: str, dataset_id, field: str) -> dict:
+        row = self.connection.execute(
+            "SELECT term_ids, counts FROM datasets WHERE stage = ? AND dataset_id = ? AND field = ?",
+            (stage, getDatasetId(dataset_id), field)
+        ).fetchone()
+
+        if row is None:
+            return dict()
+
+        term_ids = array("I", row[0])
+        terms = self.getTerms(list(term_ids))
+
+        return {terms[term_id]: count for term_id, count in zip(term_ids, array("I", row[1]))}
+
+    """
+    @param: stage, name of the miner
+    @param: field, field of the dataset content
+    @param: dataset_ids, ids of the datasets (None for all the datasets of the stage)
+    @return estimate of the number of distinct terms of the field in the datasets
+    """
+    def countDistinctTerms(self, stage: str, field: str, dataset_ids: list = None) -> int:
+        sketch = HyperLogLog()
+
+        if dataset_ids is None:
+            rows = self.connection.execute("SELECT sketch FROM datasets WHERE stage = ? AND field = ?", (stage, field))
+        else:
+            dataset_ids = set(getDatasetId(dataset_id) for dataset_id in dataset_ids)
+            rows = (
+                (row[1],) for row in self.connection.execute(
+                    "SELECT dataset_id, sketch FROM datasets WHERE stage = ? AND field = ?", (stage, field)
+                ) if row[0] in dataset_ids
+            )
+
+        for row in rows:
+            sketch.merge(HyperLogLog(row[0]))
+
+        return sketch.count()
+
+    def close(self):
+        self.connection.close()
+
+"""
+Index the dataset content files already mined by a parser
+
+@param: datasets_folder, path to the folder where all the datasets are stored
+@param: parser, name of the parser of the files (e.g. jena for the dataset_content_jena files)
+@param: term_index, TermIndex where the datasets are added
+@param: stage, name of the stage in the index (default: the parser name)
+"""
+def indexDatasets(datasets_folder: str, parser: str, term_index: TermIndex, stage: str = None):
+    stage = stage or parser
+
+    datasets = [dataset for dataset in os.scandir(datasets_folder) if dataset.is_dir()]
+
+    for dataset in tqdm(datasets):
+        path = findDatasetContent(dataset.path + "/dataset_content_" + parser)
+
+        if path is not None:
+            term_index.addDataset(stage, dataset.name, readDatasetContent(path))
+
+
+if __name__ == "__main__":
+    # read the command line arguments
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser("build", help="Index the dataset content files already mined by a parser")
+    build_parser.add_argument("datasets_folder", type=str, help="Absolute path to the folder where all the datasets are stored")
+    build_parser.add_argument("parser", type=str, help="Parser of the dataset content files (e.g. jena, rdflib, rdflibhr)")
+    build_parser.add_argument("--index", type=str, help="Path to the term index (default: acordar_term_index.sqlite next to the datasets folder)")
+    build_parser.add_argument("--stage", type=str, help="Stage of the datasets in the index (default: the parser name)")
+
+    merge_parser = commands.add_parser("merge", help="Merge other term indexes in a term index")
+    merge_parser.add_argument("index", type=str, help="Path to the term index where the other indexes are merged")
+    merge_parser.add_argument("other_indexes", type=str, nargs="+", help="Paths to the term indexes to be merged")
+
+    stats_parser = commands.add_parser("stats", help="Print the statistics of a field of a stage")
+    stats_parser.add_argument("index", type=str, help="Path to the term index")
+    stats_parser.add_argument("stage", type=str, help="Stage of the datasets (e.g. rdflib)")
+    stats_parser.add_argument("field", type=str, choices=FIELDS, help="Field of the dataset content")
+    stats_parser.add_argument("--top", type=int, default=20, help="Number of terms in the most datasets to be printed (default 20)")
+    stats_parser.add_argument("--stopwords", type=float, help="Print the terms contained in at least this fraction of the datasets")
+
+    term_parser = commands.add_parser("term", help="Print the frequencies of a term")
+    term_parser.add_argument("index", type=str, help="Path to the term index")
+    term_parser.add_argument("stage", type=str, help="Stage of the datasets (e.g. rdflib)")
+    term_parser.add_argument("field", type=str, choices=FIELDS, help="Field of the dataset content")
+    term_parser.add_argument("term", type=str, help="Term")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        term_index = TermIndex(args.index or getDefaultTermIndexPath(args.datasets_folder))
+        indexDatasets(args.datasets_folder, args.parser, term_index, args.stage)
+
+    elif args.command == "merge":
+        term_index = TermIndex(args.index)
+        for other_index in args.other_indexes:
+            term_index.merge(other_index)
+
+    elif args.command == "stats":
+        term_index = TermIndex(args.index)
+
+        print(f"Datasets: {term_index.getDatasetCount(args.stage)}")
+        print(f"Distinct terms (estimate): {term_index.countDistinctTerms(args.stage, args.field)}")
+
+        print("term\ttf\tdf")
+        for term, tf, df in term_index.getTopTerms(args.stage, args.field, args.top):
+            print(f"{term}\t{tf}\t{df}")
+
+        if args.stopwords is not None:
+            print(f"Stopwords (df >= {args.stopwords} of the datasets):")
+            for term, tf, df in term_index.getStopwords(args.stage, args.field, args.stopwords):
+                print(f"{term}\t{tf}\t{df}")
+
+    else:
+        term_index = TermIndex(args.index)
+        tf, df = term_index.getFrequency(args.stage, args.field, args.term)
+        print(f"tf: {tf}\tdf: {df}")
+
+    term_index.close()
@@ -0,0 +1,237 @@
+"""
+Deterministic sampling of the triples of the files too big to be mined fully.
+
+The first triples of a file are not a sample of the file: the serializers write the schema or the triples
+of a class first, so the head of a huge file is all about one part of the data. Every strategy keeps at
+most size triples (the memory budget) and draws its random numbers from a generator seeded with the seed,
+so the same file gives always the same sample:
+* head: the first size triples of the file (the previous behaviour of the miners)
+* reservoir: a uniform sample of all the triples of the file, with a single scan (reservoir sampling with
+  the geometric skips of the Algorithm L, so only the selected triples need a random number)
+* stratified: a reservoir for every predicate, the budget is split in equal parts among the predicates, so
+  the rare predicates are in the sample too (every predicate keeps at least a triple during the scan and the
+  reservoirs shrink while new predicates are found, so they can hold up to half again the budget; with more
+  predicates than size, a triple of size predicates taken at random is kept)
+* seek: for the N-Triples and N-Quads files, the lines at size random byte offsets are parsed, without
+  reading the rest of the file (the lines after a long line are picked more often, the lines that are not
+  triples are skipped)
+
+The sampled triples are given back in the order of the file.
+
+python3 triple_sampler.py path_to_file [--strategy reservoir] [--size 1000] [--seed 0]
+"""
+
+import os
+import sys
+import math
+import mmap
+import random
+import argparse
+from itertools import islice
+
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.ntriples_scanner import isLineBased, iterTriples, nextLine, toNTriples, TRIPLE_PATTERN
+
+SAMPLING_STRATEGIES = ["head", "reservoir", "stratified", "seek"]
+
+"""
+@param: rng, random generator
+@return random number in (0, 1)
+"""
+def uniform(rng: random.Random) -> float:
+    return rng.random() or 5e-324
+
+"""
+@param: triples, iterable of triples
+@param: size, number of triples of the sample
+@param: seed, seed of the random generator
+@return list with a uniform sample of the triples, in the order of the triples
+"""
+def reservoirSample(triples, size: int, seed: int) -> list:
+    rng = random.Random(seed)
+    items = enumerate(triples)
+    reservoir = list(islice(items, size))
+
+    if len(reservoir) == size and size > 0:
+        #the logarithm of the weight of the Algorithm L, the number of skipped triples before the next
+        #selected triple follows a geometric distribution
+        log_w = math.log(uniform(rng)) / size
+
+        while True:
+            skip = math.floor(math.log(uniform(rng)) / math.log(-math.expm1(log_w)))
+            item = next(islice(items, skip, None), None)
+
+            if item is None:
+                break
+
+            reservoir[rng.randrange(size)] = item
+            log_w += math.log(uniform(rng)) / size
+
+    reservoir.sort(key=lambda item: item[0])
+    return [triple for index, triple in reservoir]
+
+"""
+@param: triples, iterable of triples
+@param: size, number of triples of the sample
+@param: seed, seed of the random generator
+@return list with a sample of the triples stratified by predicate, in the order of the triples
+"""
+def stratifiedSample(triples, size: int, seed: int) -> list:
+    rng = random.Random(seed)
+
+    #predicate -> [number of triples of the predicate, reservoir of the predicate]
+    strata = dict()
+    kept = 0
+
+    for index, triple in enumerate(triples):
+        stratum = strata.get(triple[1])
+
+        if stratum is None:
+            stratum = strata[triple[1]] = [0, list()]
+
+        capacity = max(size // len(strata), 1)
+        stratum[0] += 1
+        reservoir = stratum[1]
+
+        #the capacity of the reservoirs decreases when a new predicate is found: a uniform sample of a
+        #reservoir is still a uniform sample of the triples of the predicate
+        if len(reservoir) > capacity:
+            kept -= len(reservoir) - capacity
+            reservoir[:] = rng.sample(reservoir, capacity)
+
+        if len(reservoir) < capacity:
+            reservoir.append((index, triple))
+            kept += 1
+        else:
+            position = rng.randrange(stratum[0])
+            if position < capacity:
+                reservoir[position] = (index, triple)
+
+        #the reservoirs not updated since the last predicates are shrunk all together
+        if kept > size + size // 2:
+            kept = 0
+            for stratum in strata.values():
+                if len(stratum[1]) > capacity:
+                    stratum[1][:] = rng.sample(stratum[1], capacity)
+                kept += len(stratum[1])
+
+    capacity = max(size // max(len(strata), 1), 1)
+
+    sample = list()
+    for seen, reservoir in strata.values():
+        sample.extend(rng.sample(reservoir, capacity) if len(reservoir) > capacity else reservoir)
+
+    #with more predicates than triples in the budget, the sample keeps size predicates at random
+    if len(sample) > size:
+        sample = rng.sample(sample, size)
+
+    sample.sort(key=lambda item: item[0])
+    return [triple for index, triple in sample]
+
+"""
+@param: file_path, path to the N-Triples or N-Quads file
+@param: size, number of random byte offsets
+@param: seed, seed of the random generator
+@return list with the triples of the lines at the random byte offsets, in the order of the file, as the
+        N-Triples strings produced by lightrdf
+"""
+def seekSample(file_path: str, size: int, seed: int) -> list:
+    rng = random.Random(seed)
+    file_size = os.path.getsize(file_path)
+    triples = list()
+
+    if file_size == 0:
+        return triples
+
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        #the line picked for an offset is the first line that starts at or after the offset
+        offsets = rng.sample(range(file_size), min(size, file_size))
+        starts = sorted({0 if offset == 0 else nextLine(mm, offset - 1, file_size) for offset in offsets})
+
+        for start in starts:
+            if start >= file_size:
+                continue
+
+            try:
+                line = mm[start:nextLine(mm, start, file_size)].decode("utf-8")
+            except UnicodeDecodeError:
+                continue
+
+            triple = TRIPLE_PATTERN.match(line)
+            if triple is not None:
+                triples.append(tuple(toNTriples(term) for term in triple.groups()))
+
+    return triples
+
+"""
+@param: triples, iterable of triples
+@param: strategy, sampling strategy ("head", "reservoir" or "stratified")
+@param: size, number of triples of the sample
+@param: seed, seed of the random generator
+@return iterable of the sampled triples, in the order of the triples
+"""
+def sampleTriples(triples, strategy: str, size: int, seed: int = 0):
+    if strategy == "head":
+        return islice(triples, size)
+    if strategy == "reservoir":
+        return reservoirSample(triples, size, seed)
+    if strategy == "stratified":
+        return stratifiedSample(triples, size, seed)
+
+    raise ValueError(f"Unknown sampling strategy: {strategy}")
+
+"""
+@param: file_path, path to the RDF file
+@param: triples, iterable of the triples of the file (it is not read by the seek strategy)
+@param: strategy, sampling strategy (one of SAMPLING_STRATEGIES)
+@param: size, number of triples of the sample
+@param: seed, seed of the random generator
+@return iterable of the sampled triples, in the order of the file (the files that are not line based are
+        sampled with the reservoir strategy instead of the seek strategy)
+"""
+def sampleFile(file_path: str, triples, strategy: str, size: int, seed: int = 0):
+    if strategy == "seek":
+        if isLineBased(file_path):
+            return seekSample(file_path, size, seed)
+        strategy = "reservoir"
+
+    return sampleTriples(triples, strategy, size, seed)
+
+
+if __name__ == "__main__":
+    # read the command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "file",
+        type=str,
+        help="Path to the RDF file to be sampled"
+    )
+    parser.add_argument(
+        "--strategy",
+        type=str,
+        choices=SAMPLING_STRATEGIES,
+        default="reservoir",
+        help="Sampling strategy (default reservoir)"
+    )
+    parser.add_argument(
+        "--size",
+        type=int,
+        default=1000,
+        help="Number of triples of the sample (default 1000)"
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the random generator (default 0)"
+    )
+    args = parser.parse_args()
+
+    if isLineBased(args.file):
+        triples = iterTriples(args.file)
+    else:
+        import lightrdf
+        triples = lightrdf.RDFDocument(args.file).search_triples(None, None, None)
+
+    for triple in sampleFile(args.file, triples, args.strategy, args.size, args.seed):
+        print(" ".join(triple) + " .")
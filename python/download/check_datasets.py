@@ -7,75 +7,162 @@ It will:
 
 It will log for each dataset:
 * which files have not an RDF extension or empty extension
+
+The dataset directories are checked in parallel by a pool of processes: every process keeps its own libmagic
+handles and sniffs the file type from a fixed size header of the file. The sniffing results are stored in the
+sniff cache (common/sniff_cache.py), so the unchanged files are not sniffed again in the next runs. 
+The reported files are also written in the logs/check_datasets.jsonl file (one JSON object for every file), 
+that is read by the file recovering phase.
 '''
 
 import os
 import pathlib
 import re
 import magic
+import json
 import argparse
 import logging
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+#the common modules are shared by all the phases
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.manifest import Manifest, getDefaultManifestPath, STAGE_CHECK, STATUS_VALID, STATUS_NOT_RDF
+from common.sniff_cache import SniffCache, getDefaultSniffCachePath
+from common.metadata_store import isMetadataFile
 
 #accepted RDF suffixes
 RDF_SUFFIXES = [".rdf", ".ttl", ".owl", ".n3", ".nt", ".ntriples", ".jsonld", ".nq", ".trig", ".trix"]
 
+#URL noise in the file names (REST API syntax)
+NOISE_PATTERN = re.compile(r"\.+[?\/_#:]")
+
+#path of the structured results of the checker, read by the file recovering phase
+RESULTS_FILE_PATH = "logs/check_datasets.jsonl"
+
+#sniff cache of the worker process
+sniff_cache = None
+
 '''
-@param: datasets_directory, path of directory where are all the dataset
+Open the sniff cache of the worker process, so the cache connection and the libmagic handles are created 
+only once for every process
+
+@param: sniff_cache_path, path to the sniff cache
 '''
-def startCheck(datasets_directory:str):
+def initWorker(sniff_cache_path: str):
+    global sniff_cache
+    sniff_cache = SniffCache(sniff_cache_path)
 
-    index = 0
-    dataset_name = "dataset-0"
+'''
+@param: file_name, name of the file
+@return the suffix of the file name cleaned up from the URL noise
+'''
+def getFileSuffix(file_name: str) -> str:
+    #clean up the file name and highlight the file extension: check for REST API syntax
+    match = NOISE_PATTERN.search(file_name)
 
-    first = True
+    if match:
+        file_name = file_name[0:match.start()]
+
+    return pathlib.Path(file_name).suffix
+
+'''
+Check all the files of a dataset, executed in a worker process
+
+@param: dataset_path, path to the dataset directory
+@return list with a dictionary for every checked file
+'''
+def checkDataset(dataset_path: str) -> list:
+    dataset_name = os.path.basename(dataset_path)
+    results = list()
+
+    for file in os.scandir(dataset_path):
+
+        #not consider the dataset_metadata.json file and its sidecar files (lock and pending records)
+        if isMetadataFile(file.name):
+            continue
+
+        result = {
+            "dataset": dataset_name,
+            "file": file.name,
+            "size": file.stat().st_size,
+            "suffix": getFileSuffix(file.name)
+        }
+
+        #recover a possible file type for the files that have not a valid RDF extension or empty extension
+        if result["suffix"] not in RDF_SUFFIXES:
+            try:
+                sniff = sniff_cache.lookup(file.path)
+                if sniff is None:
+                    #the new sniffing results are stored by the main process
+                    sniff = sniff_cache.compute(file.path)
+                    result["sniff"] = sniff
+
+                result["description"] = sniff["description"]
+                result["mime"] = sniff["mime"]
+                result["syntax"] = sniff["syntax"]
+                result["bom"] = sniff["bom"]
+            except (OSError, magic.MagicException) as err:
+                result["description"] = f"error: {err}"
+                result["mime"] = None
+
+        results.append(result)
+
+    return results
 
-    for folder in os.scandir(datasets_directory):
+'''
+@param: datasets_directory, path of directory where are all the dataset
+@param: workers, number of worker processes
+@param: sniff_cache_path, path to the sniff cache
+'''
+def startCheck(datasets_directory: str, workers: int, sniff_cache_path: str):
 
-        if index % 1000 == 0:
-            print("Checked: "+str(index)+" datasets")
+    dataset_paths = [folder.path for folder in os.scandir(datasets_directory) if folder.is_dir()]
 
-        dataset_path = datasets_directory+"/"+folder.name
-            
-        for file in os.scandir(folder):
+    results_file = open(RESULTS_FILE_PATH, "w", encoding="utf-8")
 
-            #not consider the dataset.json file
+    #the sniff cache is written only by the main process
+    main_sniff_cache = SniffCache(sniff_cache_path)
 
-            if file.name != "dataset_metadata.json":
+    first = True
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=(sniff_cache_path,)) as executor:
+        #the results are returned in the datasets order, so the log is the same of the sequential checker
+        for index, results in enumerate(executor.map(checkDataset, dataset_paths, chunksize=64)):
 
-                path = pathlib.Path(file)
+            if index % 1000 == 0:
+                print("Checked: "+str(index)+" datasets")
 
-                #clean up the file name and highlight the file extension: check for REST API syntax
-                
-                filename = file.name
+            new_sniffs = [result.pop("sniff") for result in results if "sniff" in result]
+            if new_sniffs:
+                main_sniff_cache.store(new_sniffs)
 
-                match = re.search("\.+[?\/_#:]", filename)
+            dataset_logged = False
 
-                if(match):
-                    filename = filename[0:match.start()]
+            for result in results:
+                dataset_name = result["dataset"]
 
-                path = dataset_path+"/"+filename
+                if result["suffix"] in RDF_SUFFIXES:
+                    manifest.record(STAGE_CHECK, dataset_name, STATUS_VALID, file_name=result["file"], size=result["size"])
+                    continue
 
-                #check for the file extension (file suffix)
+                manifest.record(STAGE_CHECK, dataset_name, STATUS_NOT_RDF, file_name=result["file"], 
+                                size=result["size"], error_class="NotRDFExtension", detail=result["description"])
 
-                file_suffix = pathlib.Path(path).suffix
+                results_file.write(json.dumps(result, ensure_ascii=False) + "\n")
 
-                #log files that have not a valid RDF extension or empty extension
-                if (file_suffix not in RDF_SUFFIXES):
+                #Log the file
+                if not dataset_logged:
+                    dataset_logged = True
+                    if first:
+                        log.warning(f"Dataset: {dataset_name}")
+                        first = False
+                    else:
+                        log.warning(f"\nDataset: {dataset_name}")
+                log.warning(f"File: {result['file']} \nMime: {result['description']}")
 
-                    #recover a possible file type
-                    file_type = magic.from_file(path)
-                    
-                    #Log the file
-                    if folder.name != dataset_name:
-                        dataset_name = folder.name
-                        if first:
-                            log.warning(f"Dataset: {dataset_name}")
-                            first = False
-                        else:
-                            log.warning(f"\nDataset: {dataset_name}")
-                    log.warning(f"File: {file.name} \nMime: {file_type}")
-            
-        index += 1 
+    results_file.close()
+    main_sniff_cache.close()
 
 
 if __name__ == "__main__" :
@@ -86,6 +173,22 @@ if __name__ == "__main__" :
         type=str, 
         help="Absolute path to the folder where all the datasets are stored"
     )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        help="Path to the crawl manifest (default: acordar_manifest.sqlite next to the datasets folder)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of processes that check the datasets (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--sniff-cache",
+        type=str,
+        help="Path to the sniff cache shared with the file recoverer (default: acordar_sniff_cache.sqlite next to the datasets folder)",
+    )
     args = parser.parse_args()     
 
     global log 
@@ -96,4 +199,9 @@ if __name__ == "__main__" :
     )
     log = logging.getLogger("checker")
 
-    startCheck(args.datasets_folder)
\ No newline at end of file
+    global manifest
+    manifest = Manifest(args.manifest or getDefaultManifestPath(args.datasets_folder))
+
+    startCheck(args.datasets_folder, args.workers, args.sniff_cache or getDefaultSniffCachePath(args.datasets_folder))
+
+    manifest.close()
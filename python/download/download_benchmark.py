@@ -0,0 +1,139 @@
+'''
+This script measures the throughput (MB/s) of the download() function of the downloader against a local
+HTTP server that stands in for the dataset hosts, so that the results depend on the transfer path and
+not on the network.
+
+It compares:
+* the original transfer loop (iter_content with the default 1 byte chunks and one progress bar update
+  and one write for every chunk)
+* the download() function with different chunk sizes
+
+python3 download_benchmark.py --size-mb 256 --chunk-sizes 64 1024 4096
+'''
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import requests
+from tqdm import tqdm
+
+from downloader import getSession, download
+
+#size of the block repeatedly sent by the server
+BLOCK_SIZE = 1024 ** 2
+
+'''
+HTTP handler that answers every GET /N request with a body of N bytes
+'''
+class PayloadHandler(BaseHTTPRequestHandler):
+
+    block = os.urandom(BLOCK_SIZE)
+
+    def do_GET(self):
+        size = int(self.path.strip("/"))
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(size))
+        self.send_header("Content-Disposition", "attachment; filename=payload.nt")
+        self.end_headers()
+
+        sent = 0
+        while sent < size:
+            data = self.block[:min(BLOCK_SIZE, size - sent)]
+            self.wfile.write(data)
+            sent += len(data)
+
+    def log_message(self, format, *args):
+        pass
+
+"""
+@return the local HTTP server (started in a daemon thread)
+"""
+def startServer() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PayloadHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+"""
+Original transfer loop of the downloader, used as baseline
+
+@param: url, url to be downloaded
+@param: download_path, path of the downloaded file
+"""
+def legacyDownload(url: str, download_path: str):
+    response = requests.get(url, stream=True)
+    response.raise_for_status()
+
+    total_size_in_bytes = int(response.headers.get("content-length", 0))
+
+    with (
+        tqdm(total=total_size_in_bytes, unit="iB", unit_scale=True, disable=True) as progress_bar,
+        open(download_path, "wb") as target,
+    ):
+        for data in response.iter_content():
+            progress_bar.update(len(data))
+            target.write(data)
+
+"""
+@param: name, name of the measured transfer path
+@param: size, number of downloaded bytes
+@param: function, function that executes the download
+"""
+def measure(name: str, size: int, function):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:<30} {size / (1024 ** 2):>8.1f} MB {elapsed:>8.2f} s {size / (1024 ** 2) / elapsed:>10.1f} MB/s")
+
+
+if __name__ == "__main__":
+    # read the command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--size-mb",
+        type=int,
+        default=256,
+        help="Size in MB of the file downloaded with the download() function (default 256)",
+    )
+    parser.add_argument(
+        "--legacy-size-mb",
+        type=int,
+        default=8,
+        help="Size in MB of the file downloaded with the original 1 byte loop (default 8)",
+    )
+    parser.add_argument(
+        "--chunk-sizes",
+        type=int,
+        nargs="+",
+        default=[64, 1024, 4096],
+        help="Chunk sizes in KB measured for the download() function (default 64 1024 4096)",
+    )
+    args = parser.parse_args()
+
+    server = startServer()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    directory = tempfile.mkdtemp(prefix="download_benchmark_")
+
+    try:
+        legacy_size = args.legacy_size_mb * 1024 ** 2
+        measure("original loop (1 B chunks)", legacy_size, lambda: legacyDownload(f"{base_url}/{legacy_size}", directory + "/legacy.nt"))
+
+        size = args.size_mb * 1024 ** 2
+        session = getSession()
+
+        for chunk_size in args.chunk_sizes:
+            dataset_directory_path = f"{directory}/chunk-{chunk_size}"
+            os.makedirs(dataset_directory_path)
+
+            measure(f"download() ({chunk_size} KB chunks)", size,
+                    lambda: download(f"{base_url}/{size}", dataset_directory_path, session, False, chunk_size * 1024))
+    finally:
+        server.shutdown()
+        shutil.rmtree(directory)
@@ -16,6 +16,7 @@ See the README.md file for the instructions
 
 import json 
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 import os
 import re
@@ -23,10 +24,122 @@ from slugify import slugify
 import time
 import argparse 
 import logging
+import threading
+import hashlib
+import sys
+from email.message import Message
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+#the common modules are shared by all the phases
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.manifest import Manifest, getDefaultManifestPath, STAGE_DOWNLOAD, STATUS_DOWNLOADED, STATUS_FAILED, STATUS_COMPLETED
+from common.manifest import STAGE_REFRESH, STATUS_CHANGED, STATUS_UNCHANGED
+from common.metadata_store import hasMetadata, readMetadata, writeMetadata, updateMetadata
 
 #accepted RDF suffixes
 RDF_SUFFIXES = ["rdf", "ttl", "owl", "n3", "nt", "ntriples", "jsonld", "nq", "trig", "trix"]
 
+#maximum number of keep-alive connections kept in a session pool for every host
+POOL_MAXSIZE = 8
+
+#default size of the chunks read from the network and written to the disk (1MB)
+CHUNK_SIZE = 1024 ** 2
+
+#minimum number of seconds between two updates of a progress bar
+PROGRESS_INTERVAL = 0.5
+
+#the checkpoint of a download is rewritten every CHECKPOINT_INTERVAL seconds or every CHECKPOINT_BYTES received bytes,
+#so a killed download (SIGKILL, OOM, power loss) can be resumed from its last checkpoint
+CHECKPOINT_INTERVAL = 5
+CHECKPOINT_BYTES = 64 * 1024 ** 2
+
+#every download thread has its own requests.Session (sessions are not thread safe)
+thread_local = threading.local()
+
+"""
+@return the requests.Session of the calling thread, it is created at the first call 
+and it reuses pooled keep-alive connections for every host
+"""
+def getSession() -> requests.Session:
+    session = getattr(thread_local, "session", None)
+
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_MAXSIZE, pool_maxsize=POOL_MAXSIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        thread_local.session = session
+
+    return session
+
+"""
+Schedules the datasets of the concurrent mode by host, so that a slow portal cannot occupy all the download threads.
+A dataset is submitted to the pool only when every host of its urls has a free slot: the datasets of a saturated 
+host wait in the queue of the host (in the main thread) and never block a download thread, so the threads 
+are always used by the datasets of the other hosts.
+"""
+class HostScheduler:
+
+    """
+    @param: max_per_host, maximum number of datasets in flight for a single host
+    """
+    def __init__(self, max_per_host: int):
+        self.max_per_host = max_per_host
+        #datasets in flight for every host
+        self.active = Counter()
+        #waiting datasets for every set of hosts, with the sequence number of their arrival
+        self.queues = dict()
+        self.sequence = 0
+
+    """
+    @param: dataset, a dictionary with all the dataset info (metadata and links)
+    @return tuple with the hosts of the dataset urls
+    """
+    @staticmethod
+    def getHosts(dataset: dict) -> tuple:
+        return tuple(sorted({urlsplit(url).netloc.lower() for url in dataset["download"]}))
+
+    """
+    @param: task, task to be scheduled
+    @param: hosts, hosts used by the task
+    """
+    def add(self, task, hosts: tuple):
+        self.queues.setdefault(hosts, deque()).append((self.sequence, task))
+        self.sequence += 1
+
+    """
+    @return (task, hosts) of the oldest waiting task whose hosts have all a free slot (the slots are taken), 
+            None if no task can be started
+    """
+    def next(self) -> tuple:
+        ready = None
+
+        for hosts, queue in self.queues.items():
+            if all(self.active[host] < self.max_per_host for host in hosts):
+                if ready is None or queue[0][0] < self.queues[ready][0][0]:
+                    ready = hosts
+
+        if ready is None:
+            return None
+
+        sequence, task = self.queues[ready].popleft()
+        if len(self.queues[ready]) == 0:
+            del self.queues[ready]
+
+        for host in ready:
+            self.active[host] += 1
+
+        return task, ready
+
+    """
+    @param: hosts, hosts of a completed task (their slots are released)
+    """
+    def release(self, hosts: tuple):
+        for host in hosts:
+            self.active[host] -= 1
+
 """
 @param: url, string with url 
 @param: dataset_directory_path, path to the dataset directory
@@ -56,66 +169,351 @@ def getFilenNameFromURL(url: str, dataset_directory_path: str) -> str:
             list(map(lambda x: slugify(x), resource_split))
         )
 
+    return getUniqueFileName(file_name, dataset_directory_path)
+
+"""
+@param: file_name, name of a file
+@param: dataset_directory_path, path to the dataset directory
+@return the file name with a timestamp prefix if the dataset directory already contains a file with the same name
+"""
+def getUniqueFileName(file_name: str, dataset_directory_path: str) -> str:
+
     # check that the dataset directory does not already contains a file with the same name
     if os.path.isdir(dataset_directory_path):
         files_in_directory = os.listdir(dataset_directory_path)
 
-        # if a file with the same name has been found generate a timestamp and append file name
-        if file_name in files_in_directory:
+        # if a file with the same name (or an interrupted download of a file with the same name) has been found 
+        # generate a timestamp and append file name
+        if file_name in files_in_directory or f"{file_name}.part" in files_in_directory:
             time_str = time.strftime("%Y_%m_%d-%I_%M_%S")
             file_name = f"{time_str}-{file_name}"
 
     return file_name
 
 """
-@param: url, string with the url
-@return: the file name to which the url is referring by looking to the headers, if the header is not setted it returns None
+@param: response, response of the GET request of the url
+@param: dataset_directory_path, path to the dataset directory
+@return: the file name to which the url is referring by looking to the content-disposition header of the response,
+         if the header is not setted (or it has not a file name) it returns None
 """
-def getFileNameFromRequest(url: str) -> str:
-    response = requests.head(url)
-    response.raise_for_status()
+def getFileNameFromResponse(response: requests.Response, dataset_directory_path: str) -> str:
+    content_disposition = response.headers.get("content-disposition")
 
-    #extract the file name from the content-disposition header
-    if(hasattr(response.headers, "content-disposition")):
-        return response.headers["content-disposition"].split("=", -1)[-1]
-    
-    return None
+    if content_disposition is None:
+        return None
+
+    #parse the header parameters (quoted file names and RFC 2231 filename* parameters)
+    message = Message()
+    message["content-disposition"] = content_disposition
+    file_name = message.get_filename()
+
+    if file_name is None:
+        return None
+
+    #keep only the name, the header can contain a path
+    file_name = os.path.basename(file_name.replace("\\", "/")).strip()
+
+    if file_name in ("", ".", ".."):
+        return None
+
+    return getUniqueFileName(file_name, dataset_directory_path)
+
+"""
+@param: part_path, path to the .part file of a download
+@return path to the sidecar file with the checkpoint of the download
+"""
+def getCheckpointPath(part_path: str) -> str:
+    return part_path + ".json"
+
+"""
+@param: part_path, path to the .part file of a download
+@param: url, url of the download
+@return the checkpoint of a previous interrupted download of the url (dictionary with the received bytes
+        and the ETag/Last-Modified validators), None if there is no usable checkpoint
+"""
+def readCheckpoint(part_path: str, url: str) -> dict:
+    checkpoint_path = getCheckpointPath(part_path)
+
+    if not os.path.isfile(part_path) or not os.path.isfile(checkpoint_path):
+        return None
+
+    try:
+        with open(checkpoint_path, "r", encoding="utf-8") as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+    except (OSError, ValueError):
+        return None
+
+    if checkpoint.get("url") != url:
+        return None
+
+    #trust only the bytes that are both in the .part file and in the checkpoint
+    checkpoint["bytes"] = min(int(checkpoint.get("bytes", 0)), os.path.getsize(part_path))
+
+    return checkpoint
+
+"""
+@param: dataset_directory_path, path to the dataset directory
+@param: url, url of the download
+@return name of the file and checkpoint of a previous interrupted download of the url, (None, None) if 
+        there is no usable checkpoint in the dataset directory
+"""
+def findCheckpoint(dataset_directory_path: str, url: str) -> tuple:
+
+    if not os.path.isdir(dataset_directory_path):
+        return None, None
+
+    for entry in os.scandir(dataset_directory_path):
+        if entry.name.endswith(".part.json"):
+            file_name = entry.name[:-len(".part.json")]
+            checkpoint = readCheckpoint(f"{dataset_directory_path}/{file_name}.part", url)
+
+            if checkpoint is not None:
+                return file_name, checkpoint
+
+    return None, None
+
+"""
+@param: part_path, path to the .part file of a download
+"""
+def removePartialDownload(part_path: str):
+    for path in (part_path, getCheckpointPath(part_path)):
+        if os.path.exists(path):
+            os.remove(path)
+
+"""
+@param: part_path, path to the .part file of a download
+@param: checkpoint, dictionary with the url, the received bytes and the validators of the download
+"""
+def writeCheckpoint(part_path: str, checkpoint: dict):
+    checkpoint_path = getCheckpointPath(part_path)
+
+    with open(checkpoint_path + ".tmp", "w", encoding="utf-8") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+
+    os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+"""
+@param: response, streaming response of the GET request
+@param: chunk_size, maximum size of every chunk
+@return generator of the chunks of the response body: if the body is not encoded the chunks are read 
+        with readinto in a preallocated buffer (every chunk is a view of the buffer, valid until the next one), 
+        else they are decoded by requests
+"""
+def readChunks(response: requests.Response, chunk_size: int):
+    if response.headers.get("content-encoding", "identity").lower() == "identity":
+        buffer = memoryview(bytearray(chunk_size))
+        received = 0
+
+        while True:
+            n_bytes = response.raw.readinto(buffer)
+            if n_bytes == 0:
+                break
+            received += n_bytes
+            yield buffer[:n_bytes]
+
+        #the connection can be closed before the end of the body
+        expected = response.headers.get("content-length")
+        if expected is not None and received != int(expected):
+            raise requests.exceptions.ChunkedEncodingError(f"Incomplete body: received {received} bytes of {expected}")
+    else:
+        yield from response.iter_content(chunk_size=chunk_size)
 
 """
 @param: url, url to be downloaded
 @param: dataset_directory_path, path to the folder in which the downloaded file will be saved
-@param: file_name, name of the downloaded file
-@return True if the download has been completed without errors, otherwise an exception is thrown
+@param: session, requests.Session used for the request
+@param: progress, True if a progress bar must be shown
+@param: chunk_size, size of the chunks read from the network and written to the disk
+@param: file_name, name of the file for the refresh of an already downloaded file (None for a new download)
+@param: validators, dictionary with the etag, last_modified and sha256 of the already downloaded file
+        for a conditional request (None for a new download)
+@return dictionary with the name, the size, the SHA-256 hash and the ETag/Last-Modified validators of the downloaded 
+        file if the download has been completed without errors, otherwise an exception is thrown.
+        In a conditional request it returns None if the file is not changed (and the file is not touched)
+
+The name of a new file is extracted from the content-disposition header of the GET response if available, 
+else from the URL, and it is decided before writing the body of the response.
+The file is written in a file_name.part file with a file_name.part.json checkpoint: if the download fails
+the next call continues it with a Range request (when the server supports it)
 """
-def download(url: str, file_name: str, dataset_directory_path: str, ) -> bool:
+def download(url: str, dataset_directory_path: str, session: requests.Session, progress: bool = True, chunk_size: int = CHUNK_SIZE,
+             file_name: str = None, validators: dict = None) -> dict:
+
+    target_file_name = file_name
+
+    #check for a previous interrupted download of the same url
+    file_name, checkpoint = findCheckpoint(dataset_directory_path, url)
+
+    headers = dict()
+    offset = 0
+
+    if checkpoint is not None and checkpoint["bytes"] > 0 and checkpoint.get("accept_ranges") != "none":
+        offset = checkpoint["bytes"]
+        headers["Range"] = f"bytes={offset}-"
+
+        #the server sends only the missing bytes if the file is not changed, otherwise the whole file
+        validator = checkpoint.get("etag") or checkpoint.get("last_modified")
+        if validator:
+            headers["If-Range"] = validator
+    elif validators is not None:
+        #conditional request: the server answers 304 if the file is not changed
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    response = session.get(url, stream=True, headers=headers)
+
+    if response.status_code == 304:
+        response.close()
+        return None
+
+    #the checkpoint is not valid anymore (e.g. the file is now shorter), restart from byte zero
+    if response.status_code == 416:
+        response.close()
+        response = session.get(url, stream=True)
 
-    response = requests.get(url, stream=True)
     response.raise_for_status()
 
+    if response.status_code == 206:
+        if not response.headers.get("content-range", "").startswith(f"bytes {offset}-"):
+            raise requests.exceptions.HTTPError(f"Unexpected Content-Range for url: {url}", response=response)
+    else:
+        #the whole file is downloaded (first attempt or the server ignored the Range request):
+        #extract the file name from the content-disposition header if available, if not from the URL
+        if file_name is not None:
+            removePartialDownload(f"{dataset_directory_path}/{file_name}.part")
+
+        offset = 0
+
+        if target_file_name is not None:
+            file_name = target_file_name
+        else:
+            file_name = getFileNameFromResponse(response, dataset_directory_path)
+
+            if file_name is None:
+                file_name = getFilenNameFromURL(url, dataset_directory_path)
+
     download_path = dataset_directory_path + f"/{file_name}"
+    part_path = download_path + ".part"
+
+    checkpoint = {
+        "url": url,
+        "bytes": offset,
+        "etag": response.headers.get("etag"),
+        "last_modified": response.headers.get("last-modified"),
+        "accept_ranges": response.headers.get("accept-ranges"),
+    }
 
     # Create a progress bar to track progress while downloading
-    total_size_in_bytes = int(response.headers.get("content-length", 0))
+    total_size_in_bytes = offset + int(response.headers.get("content-length", 0))
 
     with (
         tqdm(
             total=total_size_in_bytes,
+            initial=offset,
             unit="iB",
             unit_scale=True,
+            disable=not progress,
         ) as progress_bar,
-        open(download_path, "wb") as target,
+        open(part_path, "r+b" if offset > 0 else "wb") as target,
     ):
-        for data in response.iter_content():
-            progress_bar.update(len(data))
-            target.write(data)
+        #the hash of a resumed download starts from the bytes already in the .part file
+        file_hash = hashlib.sha256()
+        while target.tell() < offset:
+            file_hash.update(target.read(min(1024 ** 2, offset - target.tell())))
+
+        target.seek(offset)
+        target.truncate()
+
+        #the checkpoint is written as soon as the .part file is opened, so the .part file has always a sidecar
+        target.flush()
+        writeCheckpoint(part_path, checkpoint)
+
+        #the progress bar is updated at most every PROGRESS_INTERVAL seconds
+        progress_bytes = 0
+        last_progress = time.monotonic()
 
-    return True
+        checkpoint_bytes = 0
+        last_checkpoint = time.monotonic()
+
+        try:
+            for data in readChunks(response, chunk_size):
+                target.write(data)
+                file_hash.update(data)
+                checkpoint["bytes"] += len(data)
+
+                progress_bytes += len(data)
+                if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                    progress_bar.update(progress_bytes)
+                    progress_bytes = 0
+                    last_progress = time.monotonic()
+
+                #periodic checkpoint: only the bytes flushed to the .part file are recorded
+                checkpoint_bytes += len(data)
+                if checkpoint_bytes >= CHECKPOINT_BYTES or time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                    target.flush()
+                    writeCheckpoint(part_path, checkpoint)
+                    checkpoint_bytes = 0
+                    last_checkpoint = time.monotonic()
+        finally:
+            progress_bar.update(progress_bytes)
+
+            #last update of the checkpoint: save the received bytes, so that a retry can continue from here
+            target.flush()
+            writeCheckpoint(part_path, checkpoint)
+
+    #the server does not support conditional requests but the content is not changed: keep the current file
+    if validators is not None and validators.get("sha256") == file_hash.hexdigest():
+        removePartialDownload(part_path)
+        return None
+
+    #the download is completed: give the file its final name and remove the checkpoint
+    os.replace(part_path, download_path)
+    os.remove(getCheckpointPath(part_path))
+
+    return {
+        "file_name": file_name, 
+        "size": checkpoint["bytes"], 
+        "sha256": file_hash.hexdigest(),
+        "etag": checkpoint["etag"],
+        "last_modified": checkpoint["last_modified"]
+    }
   
+"""
+Replace a downloaded file with a hard link to the file already downloaded with the same content (if any)
+
+@param: manifest, crawl manifest with the content-addressed index
+@param: dataset_directory_path, path to the folder of the downloaded file
+@param: downloaded_file, dictionary with name, size and SHA-256 hash of the downloaded file
+@return path of the file with the same content, None if the downloaded file is the first one with its content
+"""
+def deduplicateFile(manifest: Manifest, dataset_directory_path: str, downloaded_file: dict) -> str:
+    download_path = dataset_directory_path + f"/{downloaded_file['file_name']}"
+
+    duplicate_path = manifest.registerContent(downloaded_file["sha256"], downloaded_file["size"], download_path)
+
+    if duplicate_path is None:
+        return None
+
+    link_path = download_path + ".link"
+    try:
+        os.link(duplicate_path, link_path)
+    except OSError:
+        #hard links are not supported (e.g. different file systems), keep the copy
+        return None
+
+    os.replace(link_path, download_path)
+
+    return duplicate_path
+
 '''
 @param: dataset, a dictionary with all the dataset info (metadata and links)
 @param: datasets_folder_path, path where to store all the datasets
+@param: progress, True if a progress bar must be shown for every download
+@param: chunk_size, size of the chunks read from the network and written to the disk
 '''
-def downloadDataset(dataset: dict, datasets_folder_path: str):
+def downloadDataset(dataset: dict, datasets_folder_path: str, progress: bool = True, chunk_size: int = CHUNK_SIZE):
 
     dataset_id = dataset["dataset_id"]
 
@@ -136,24 +534,40 @@ def downloadDataset(dataset: dict, datasets_folder_path: str):
     downloaded_files = list()
     failed_urls = list()
 
+    session = getSession()
+
+    #the urls of a dataset are always downloaded one after the other, so the file names
+    #and the metadata are the same in the sequential and in the concurrent mode
     for url in dataset_urls:
+        started_at = time.time()
         try:
-            
-            #extract the file name from the content-disposition header of a request if available
-            #if not we extract the name from the URL
-            downloaded_file_name = getFileNameFromRequest(url)
 
-            if downloaded_file_name is None:
-                downloaded_file_name = getFilenNameFromURL(url, dataset_directory_path)
+            downloaded_file = download(url, dataset_directory_path, session, progress, chunk_size)
 
-            download(url,downloaded_file_name, dataset_directory_path)
+            downloaded_file_name = downloaded_file["file_name"]
 
-            #save the downloaded file into the downloaded entry
-            downloaded_files.append({"url": url, "file_name": downloaded_file_name})
+            #the same content downloaded by another url is stored only once
+            duplicate_path = deduplicateFile(manifest, dataset_directory_path, downloaded_file)
+
+            #save the downloaded file into the downloaded entry, with the validators used for the refresh
+            downloaded_files.append({
+                "url": url, 
+                "file_name": downloaded_file_name,
+                "etag": downloaded_file["etag"],
+                "last_modified": downloaded_file["last_modified"],
+                "length": downloaded_file["size"]
+            })
+
+            manifest.recordURL(STAGE_DOWNLOAD, dataset_id, url, STATUS_DOWNLOADED, file_name=downloaded_file_name,
+                               size=downloaded_file["size"], sha256=downloaded_file["sha256"], 
+                               started_at=started_at, finished_at=time.time(),
+                               detail=None if duplicate_path is None else f"duplicate of {duplicate_path}")
 
         except Exception as err:
             failed_urls.append(url)
             error_message = str(err).replace("\n"," ")
+            manifest.recordURL(STAGE_DOWNLOAD, dataset_id, url, STATUS_FAILED, started_at=started_at, 
+                               finished_at=time.time(), error_class=type(err).__name__, detail=error_message)
             log.warning(
                 f"""
                 Dataset: {dataset_id}\n
@@ -177,16 +591,129 @@ def downloadDataset(dataset: dict, datasets_folder_path: str):
         "total_URLS" : len(dataset_urls)
     }
 
-    # prepare the JSON representation of the metadata
-    metadata_json = json.dumps(metadata, ensure_ascii=False, indent=4)
+    # write the metadata file (atomically, a crash never leaves a truncated file)
+    writeMetadata(dataset_directory_path, metadata)
+
+    #dataset level record used by the resume mechanism
+    manifest.record(STAGE_DOWNLOAD, dataset_id, STATUS_COMPLETED, files=len(downloaded_files), finished_at=time.time())
+
+'''
+Incremental refresh of an already downloaded dataset: every downloaded url is requested with a conditional 
+request built from the validators saved in the dataset_metadata.json file, the unchanged files are not touched
+and the changed files are replaced. If at least one file is changed the mining flags of the dataset are reset, 
+so the dataset is mined again by the miners (also with the resume mechanism).
+
+@param: dataset, a dictionary with all the dataset info (metadata and links)
+@param: datasets_folder_path, path where all the datasets are stored
+@param: progress, True if a progress bar must be shown for every download
+@param: chunk_size, size of the chunks read from the network and written to the disk
+@return list with the names of the changed files
+'''
+def refreshDataset(dataset: dict, datasets_folder_path: str, progress: bool = True, chunk_size: int = CHUNK_SIZE) -> list:
+
+    dataset_id = dataset["dataset_id"]
+
+    dataset_directory_path = f"{datasets_folder_path}/dataset-{dataset_id}"
+
+    metadata = readMetadata(dataset_directory_path)
+
+    #hashes of the downloaded files, used when the server does not support conditional requests
+    downloaded_hashes = dict()
+    for record in manifest.getRecords(STAGE_DOWNLOAD, STATUS_DOWNLOADED, dataset_id=dataset_id):
+        downloaded_hashes[record["url"]] = record["sha256"]
+
+    session = getSession()
+
+    changed_files = list()
+
+    for downloaded_entry in metadata["downloaded_urls"]:
+        url = downloaded_entry["url"]
+        file_name = downloaded_entry["file_name"]
+        started_at = time.time()
+
+        validators = {
+            "etag": downloaded_entry.get("etag"),
+            "last_modified": downloaded_entry.get("last_modified"),
+            "sha256": downloaded_hashes.get(url)
+        }
+
+        try:
+            downloaded_file = download(url, dataset_directory_path, session, progress, chunk_size, file_name, validators)
+
+            if downloaded_file is None:
+                manifest.recordURL(STAGE_REFRESH, dataset_id, url, STATUS_UNCHANGED, file_name=file_name, 
+                                   started_at=started_at, finished_at=time.time())
+                continue
+
+            duplicate_path = deduplicateFile(manifest, dataset_directory_path, downloaded_file)
+
+            downloaded_entry["etag"] = downloaded_file["etag"]
+            downloaded_entry["last_modified"] = downloaded_file["last_modified"]
+            downloaded_entry["length"] = downloaded_file["size"]
+
+            changed_files.append(file_name)
+
+            manifest.recordURL(STAGE_DOWNLOAD, dataset_id, url, STATUS_DOWNLOADED, file_name=file_name,
+                               size=downloaded_file["size"], sha256=downloaded_file["sha256"], 
+                               started_at=started_at, finished_at=time.time(),
+                               detail=None if duplicate_path is None else f"duplicate of {duplicate_path}")
+            manifest.recordURL(STAGE_REFRESH, dataset_id, url, STATUS_CHANGED, file_name=file_name, 
+                               size=downloaded_file["size"], sha256=downloaded_file["sha256"],
+                               started_at=started_at, finished_at=time.time())
+
+        except Exception as err:
+            #the current file is kept
+            error_message = str(err).replace("\n"," ")
+            manifest.recordURL(STAGE_REFRESH, dataset_id, url, STATUS_FAILED, file_name=file_name, started_at=started_at, 
+                               finished_at=time.time(), error_class=type(err).__name__, detail=error_message)
+            log.warning(
+                f"""
+                Dataset: {dataset_id}\n
+                URL: {url}\n
+                Error: {error_message}\n
+                """
+            )
+
+    #the metadata is updated with its current version, a stage may have updated it during the refresh
+    def updateRefreshedMetadata(current_metadata: dict):
+        #the validators are saved also for the unchanged datasets (e.g. downloaded before the refresh mode)
+        current_metadata["downloaded_urls"] = metadata["downloaded_urls"]
+
+        if len(changed_files) > 0:
+            #flag the dataset for the mining: reset the mining flags of all the miners
+            for key in current_metadata.keys():
+                if key.startswith("mined_") and isinstance(current_metadata[key], bool):
+                    current_metadata[key] = False
+
+            current_metadata["refreshed_files"] = changed_files
+
+    updateMetadata(dataset_directory_path, updateRefreshedMetadata)
 
-    # path to the file in which the data will be stored
-    metadata_file_path = f"{dataset_directory_path}/dataset_metadata.json"
+    if len(changed_files) > 0:
+        #the miners find the dataset again in the resume mode
+        manifest.resetCompleted(dataset_id, keep_stages=[STAGE_DOWNLOAD])
+        manifest.record(STAGE_REFRESH, dataset_id, STATUS_CHANGED, files=len(changed_files), finished_at=time.time())
+    else:
+        manifest.record(STAGE_REFRESH, dataset_id, STATUS_UNCHANGED, finished_at=time.time())
+
+    return changed_files
+
+'''
+@param: dataset, a dictionary with all the dataset info (metadata and links)
+@param: datasets_folder_path, path where to store all the datasets
+@param: refresh, True for the incremental refresh of the already downloaded datasets
+@param: progress, True if a progress bar must be shown for every download
+@param: chunk_size, size of the chunks read from the network and written to the disk
+'''
+def processDataset(dataset: dict, datasets_folder_path: str, refresh: bool, progress: bool = True, chunk_size: int = CHUNK_SIZE):
+    dataset_directory_path = f"{datasets_folder_path}/dataset-{dataset['dataset_id']}"
 
-    # write the json data in the file
-    metadata_file = open(metadata_file_path, "w", encoding="utf-8")
-    metadata_file.write(metadata_json)
-    metadata_file.close()
+    if refresh and hasMetadata(dataset_directory_path):
+        changed_files = refreshDataset(dataset, datasets_folder_path, progress, chunk_size)
+        if len(changed_files) > 0:
+            print(f"Changed dataset [ID: {dataset['dataset_id']}] files: {', '.join(changed_files)}")
+    else:
+        downloadDataset(dataset, datasets_folder_path, progress, chunk_size)
         
 
 if __name__ == "__main__" : 
@@ -207,6 +734,39 @@ if __name__ == "__main__" :
         type=int,
         help="Start downloading from the given row index in the datasets.json file (included)",
     )
+    parser.add_argument(
+        "--resume", 
+        action="store_true",
+        help="Skip the datasets that are already completely processed according to the manifest"
+    )
+    parser.add_argument(
+        "--refresh", 
+        action="store_true",
+        help="Incremental refresh of the already downloaded datasets with conditional requests (new datasets are downloaded)"
+    )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        help="Path to the crawl manifest (default: acordar_manifest.sqlite next to the datasets folder)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of datasets downloaded concurrently (default 1: sequential download)",
+    )
+    parser.add_argument(
+        "--max-per-host",
+        type=int,
+        default=2,
+        help="Maximum number of datasets downloaded concurrently from the same host in the concurrent mode (default 2)",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=CHUNK_SIZE // 1024,
+        help="Size in KB of the chunks read from the network and written to the disk (default 1024)",
+    )
     args = parser.parse_args()         
     
     #row in the datasets.json file from which resume the download
@@ -227,15 +787,76 @@ if __name__ == "__main__" :
     )
     log = logging.getLogger("downloader")
 
-    row_index = 0
+    global manifest
+    manifest = Manifest(args.manifest or getDefaultManifestPath(args.datasets_folder))
+
+    #datasets already processed according to the manifest
+    completed_datasets = set()
+    if args.resume and args.refresh:
+        completed_datasets = manifest.getDatasets(STAGE_REFRESH, dataset_level=True)
+    elif args.resume:
+        completed_datasets = manifest.getCompleted(STAGE_DOWNLOAD)
+
+    if args.workers > 1:
+        #concurrent mode: keep args.workers datasets in flight, the progress bars are disabled
+        #and the row index of every dataset is printed when its download is completed
+        scheduler = HostScheduler(args.max_per_host)
+
+        for row_index, dataset in enumerate(datasets_list["datasets"]):
+            if str(dataset["dataset_id"]) in completed_datasets:
+                continue
+
+            if resume_row is None or (resume_row is not None and row_index > resume_row):
+                scheduler.add((row_index, dataset), HostScheduler.getHosts(dataset))
+            else:
+                print(f"Already downloaded dataset with ID {dataset['dataset_id']} - [INDEX: {row_index}]")
+
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = dict()
+
+            #the datasets are submitted only when their hosts have a free slot, so the threads never wait for a host
+            def submitReady():
+                while len(futures) < args.workers:
+                    scheduled = scheduler.next()
+                    if scheduled is None:
+                        break
+
+                    (row_index, dataset), hosts = scheduled
+                    future = executor.submit(processDataset, dataset, args.datasets_folder, args.refresh, False, args.chunk_size * 1024)
+                    futures[future] = (row_index, dataset, hosts)
+
+            submitReady()
+
+            while len(futures) > 0:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    row_index, dataset, hosts = futures.pop(future)
+                    scheduler.release(hosts)
+                    try:
+                        future.result()
+                        print(f"Processed dataset [ID: {dataset['dataset_id']}] [ROW_INDEX: {row_index}] downloads: {len(dataset['download'])}")
+                    except Exception as err:
+                        error_message = str(err).replace("\n"," ")
+                        print(f"Error while processing dataset [ID: {dataset['dataset_id']}] [ROW_INDEX: {row_index}]: {error_message}")
+
+                submitReady()
+    else:
+        row_index = 0
 
-    for dataset in datasets_list["datasets"]:
-        dataset_id = dataset["dataset_id"]
+        for dataset in datasets_list["datasets"]:
+            dataset_id = dataset["dataset_id"]
 
-        if resume_row is None or (resume_row is not None and row_index > resume_row):
-            print(f"Processing dataset [ID: {dataset_id}] [ROW_INDEX: {row_index}] downloads: {len(dataset['download'])}")
-            downloadDataset(dataset, args.datasets_folder)
-        else:
-            print(f"Already downloaded dataset with ID {dataset_id} - [INDEX: {row_index}]")
-        
-        row_index += 1
\ No newline at end of file
+            if str(dataset_id) in completed_datasets:
+                row_index += 1
+                continue
+
+            if resume_row is None or (resume_row is not None and row_index > resume_row):
+                print(f"Processing dataset [ID: {dataset_id}] [ROW_INDEX: {row_index}] downloads: {len(dataset['download'])}")
+                processDataset(dataset, args.datasets_folder, args.refresh, chunk_size=args.chunk_size * 1024)
+            else:
+                print(f"Already downloaded dataset with ID {dataset_id} - [INDEX: {row_index}]")
+            
+            row_index += 1
+
+    manifest.close()
@@ -1,14 +1,26 @@
 '''
 This script check if a file contains a UTF-8 BOM sequence at the beginning.
 This convention sometimes give problems to the RDFLib parsing phase, so we want to remove it.
+
+The BOM is removed copying the rest of the file through a fixed size buffer in a temporary file, that
+replaces the original file with an atomic rename: the file is never decoded and it is never loaded in memory,
+and an interrupted run never leaves a truncated file. The datasets are checked in parallel.
 '''
 
 import os
 import pathlib
+import shutil
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 
 RDF_SUFFIXES = [".rdf", ".rdfs", ".ttl", ".owl", ".n3", ".nt", ".jsonld", ".xml", ".ntriples", ".nq", ".trig", ".trix"]
 
+#UTF-8 BOM sequence
+UTF8_BOM = b"\xEF\xBB\xBF"
+
+#size of the buffer used for copying the files
+BUFFER_SIZE = 1024 ** 2
+
 """
 @param: path_to_file, path to the RDF file
 @return true if the file contains the BOM prefix
@@ -18,33 +30,59 @@ def contains_utf8_bom(path_to_file: str) -> bool:
     #read the first 3 bytes in the file and check if they are the UTF-8 BOM sequence
     bom_bytes = file.read(3)
     file.close()
-    return bom_bytes == b"\xEF\xBB\xBF"
+    return bom_bytes == UTF8_BOM
 
 """
 @param: path_to_file, path to the RDF file
 @return true if the BOM prefix was correctly removed
 """
 def remove_utf8_bom(path_to_file: str) -> bool:
-    file = open(path_to_file, "r", encoding="utf-8-sig")
-    file_content = file.read()
-    file.close()
+    temporary_path = path_to_file + ".bom.tmp"
 
-    file = open(path_to_file, "w", encoding="utf-8")
-    file.write(file_content)
-    file.close()
+    try:
+        with open(path_to_file, "rb") as source, open(temporary_path, "wb") as target:
+            if source.read(len(UTF8_BOM)) != UTF8_BOM:
+                return False
+
+            #copy the rest of the file as it is, without decoding it
+            shutil.copyfileobj(source, target, BUFFER_SIZE)
+
+        shutil.copymode(path_to_file, temporary_path)
+        os.replace(temporary_path, path_to_file)
+        return True
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+"""
+@param: dataset_folder_path, path to the dataset folder
+@return list with the paths of the files of the dataset where the BOM was removed
+"""
+def checkDataset(dataset_folder_path: str) -> list:
+    cleaned_files = list()
+
+    for file in os.scandir(dataset_folder_path):
+        file_suffix = pathlib.Path(file.path).suffix
+
+        if file_suffix in RDF_SUFFIXES:
+            if contains_utf8_bom(file.path):
+                if remove_utf8_bom(file.path):
+                    cleaned_files.append(file.path)
+
+    return cleaned_files
 
 """
 @param: datasets_directory_path, path to the folder where all the  datasets are stored
+@param: workers, number of datasets checked at the same time
 """
-def bomChecking(datasets_directory_path: str):
-    for dataset_folder in os.scandir(datasets_directory_path):
-        for file in os.scandir(dataset_folder):
-            file_suffix = pathlib.Path(file.path).suffix
+def bomChecking(datasets_directory_path: str, workers: int = 1):
+    dataset_folder_paths = [dataset_folder.path for dataset_folder in os.scandir(datasets_directory_path) if dataset_folder.is_dir()]
 
-            if file_suffix in RDF_SUFFIXES:
-                if contains_utf8_bom(file.path):
-                    print("REMOVING UTF-U BOM FROM: "+file.path)
-                    remove_utf8_bom(file.path)
+    #the check is I/O bound: the threads do not compete for the GIL while they read and write the files
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for cleaned_files in executor.map(checkDataset, dataset_folder_paths):
+            for file_path in cleaned_files:
+                print("REMOVED UTF-8 BOM FROM: "+file_path)
 
 
 if __name__ == "__main__":
@@ -56,6 +94,12 @@ if __name__ == "__main__":
         type=str, 
         help="Absolute path to the folder where all the datasets are stored"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Number of datasets checked at the same time (default 8)"
+    )
     args = parser.parse_args()  
 
-    bomChecking(args.datasets_folder)
+    bomChecking(args.datasets_folder, args.workers)
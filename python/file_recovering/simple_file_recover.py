@@ -1,6 +1,8 @@
 '''
-This script will recover the files that are reported by the check_datasets.py script in its log file
-In particular it will check the mime type of every reported file and:
+This script will recover the files that are reported by the check_datasets.py script in its structured
+results file (logs/check_datasets.jsonl)
+In particular it will check the mime type of every reported file (read from the sniff cache shared with the
+dataset checker) and:
 * if the file is an html file it will log it and the extension remain the same
 * if the file is a txt file it will check if it is ttl file by checking the @prefix directive in the first lines
 * if the file is a xml file it will convert it to rdf
@@ -10,10 +12,15 @@ In the log file it will log which files have been recovered and which not
 
 import os
 import re
-import magic
+import sys
+import json
 import argparse
 import logging
 
+#the common modules are shared by all the phases
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+from common.sniff_cache import SniffCache, getDefaultSniffCachePath
+
 '''
 @param dataset name of the dataset
 @param file name of the file to be checked
@@ -25,92 +32,130 @@ def checkForTTL(dataset, file, datasets_directory):
     file = open(file_path,"r")
 
     line = file.readline()
+    file.close()
     return re.search("@prefix", line, re.IGNORECASE)
 
 
+'''
+Rename the file with the given extension and move its record in the sniff cache
+
+@param file_path path to the file
+@param extension extension added to the file name
+'''
+def renameFile(file_path, extension):
+    os.rename(file_path, file_path+extension)
+    sniff_cache.move(file_path, file_path+extension)
+
 '''
 @param dataset name of the dataset
 @param file name of the file to be checked
 @param datasets_directory directory where all the dataset are saved
+@param sniff sniffing result of the file (MIME type, description and RDF syntax) from the sniff cache
 @return true if the file was recovered else false
 @output rename the file with ttl or rdf if can be recovered
 '''
-def recoverFile(dataset, file, datasets_directory): 
+def recoverFile(dataset, file, datasets_directory, sniff): 
     file_path = datasets_directory+"/"+dataset+"/"+file
-    mime_type = magic.from_file(file_path, mime=True)
+    mime_type = sniff["mime"]
 
     if "xml" in mime_type:
-        os.rename(file_path, str(file_path)+".rdf")
+        renameFile(file_path, ".rdf")
         return True
     elif "html" in mime_type:
-        os.rename(file_path, str(file_path)+".html")
+        renameFile(file_path, ".html")
         return True
     elif "text" in mime_type:
-        if checkForTTL(dataset, file, datasets_directory):
-            os.rename(file_path, str(file_path)+".ttl")
+        if sniff["syntax"] == "turtle" or checkForTTL(dataset, file, datasets_directory):
+            renameFile(file_path, ".ttl")
             return True
     return False
 
 '''
-@param datasets_directory directory where are saved all the datasets
-@param checker_error_log_file_path path to the txt errors log file of the dataset checker
-@param error_log_file_path path to the error log of the file recover 
+Read the reported files from the structured results of the dataset checker
+
+@param checker_results_path path to the check_datasets.jsonl file of the dataset checker
+@return list with a dictionary (dataset, file, mime) for every reported file
 '''
-def startRecover(datasets_directory,checker_error_log_file_path, error_log_file_path):
-    #open the error log files of the dataset checker
-    f_log_checker=open(checker_error_log_file_path, "r")
+def readCheckerResults(checker_results_path):
+    reported_files = list()
 
-    #open the error log file
-    f_log=open(error_log_file_path, "a")
+    with open(checker_results_path, "r", encoding="utf-8") as f_results:
+        for line in f_results:
+            if line.strip():
+                reported_files.append(json.loads(line))
 
-    dataset= ""
-    while True:
-        line = f_log_checker.readline()
+    return reported_files
+
+'''
+Read the reported files from the log file of the dataset checker, used for the collections checked 
+before the structured results were available
+
+@param checker_log_path path to the check_datasets.log file of the dataset checker
+@return list with a dictionary (dataset, file) for every reported file
+'''
+def readCheckerLog(checker_log_path):
+    reported_files = list()
 
-        if(not line):
-            break
+    f_log_checker = open(checker_log_path, "r")
+
+    dataset= ""
+    for line in f_log_checker:
 
         #skip blank lines
         if ":" in line:
             #split the line
-            fields = line.split(": ")
+            fields = line.split(": ", 1)
 
             if fields[0] == "Dataset":
-                dataset = fields[1].strip("\n")
+                dataset = fields[1].strip()
             elif fields[0] == "File":
-                file = fields[1].strip("\n")
-
-                split = file.split(".")
-
-                #check if there is no extension available for the file
-
-                if len(split) == 1:
-
-                    if os.path.isfile(datasets_directory+"/"+dataset+"/"+file):
-                        if not recoverFile(dataset, file, datasets_directory):
-                            mime_type = magic.from_file(datasets_directory+"/"+dataset+"/"+file)
-
-                            log.warning(
-                                f"""
-                                Dataset: {dataset}\n
-                                File: {file}\n
-                                Mime: {mime_type}\n
-                                """
-                            )
-                        else:
-            
-                            log.warning(
-                                f"""
-                                Recover in Dataset: {dataset}\n
-                                File: {file}\n
-                                """
-                            )
-    
+                reported_files.append({"dataset": dataset, "file": fields[1].strip()})
+
     f_log_checker.close()
-    f_log.close()
+
+    return reported_files
+
+'''
+@param datasets_directory directory where are saved all the datasets
+@param reported_files list with the files reported by the dataset checker
+'''
+def startRecover(datasets_directory, reported_files):
+
+    for reported_file in reported_files:
+        dataset = reported_file["dataset"]
+        file = reported_file["file"]
+
+        split = file.split(".")
+
+        #check if there is no extension available for the file
+
+        if len(split) == 1:
+
+            if os.path.isfile(datasets_directory+"/"+dataset+"/"+file):
+                #the file is sniffed only if it is not in the cache (or it is changed after the checking)
+                sniff = sniff_cache.sniff(datasets_directory+"/"+dataset+"/"+file)
+
+                if not recoverFile(dataset, file, datasets_directory, sniff):
+                    mime_type = sniff["description"]
+
+                    log.warning(
+                        f"""
+                        Dataset: {dataset}\n
+                        File: {file}\n
+                        Mime: {mime_type}\n
+                        """
+                    )
+                else:
+    
+                    log.warning(
+                        f"""
+                        Recover in Dataset: {dataset}\n
+                        File: {file}\n
+                        """
+                    )
 
 if __name__ == "__main__":
-    scriptDir = os.path.dirname(os.path.realpath('__file__'))
+    scriptDir = os.path.dirname(os.path.realpath(__file__))
 
     # read the command line arguments
     parser = argparse.ArgumentParser()
@@ -119,6 +164,17 @@ if __name__ == "__main__":
         type=str, 
         help="Absolute path to the folder where all the datasets will be downloaded"
     )
+    parser.add_argument(
+        "--checker-results",
+        type=str,
+        default=os.path.join(scriptDir, "../download/logs/check_datasets.jsonl"),
+        help="Path to the structured results of the dataset checker (default: ../download/logs/check_datasets.jsonl)"
+    )
+    parser.add_argument(
+        "--sniff-cache",
+        type=str,
+        help="Path to the sniff cache shared with the dataset checker (default: acordar_sniff_cache.sqlite next to the datasets folder)"
+    )
     args = parser.parse_args()  
     
     global log 
@@ -129,7 +185,15 @@ if __name__ == "__main__":
     )
     log = logging.getLogger("simple_file_recover")
 
-    #path to the checker error log file path
-    checker_error_log_path = os.path.join(scriptDir, '../download/logs/checker_error_log.txt')       
+    global sniff_cache
+    sniff_cache = SniffCache(args.sniff_cache or getDefaultSniffCachePath(args.datasets_folder))
+
+    if os.path.isfile(args.checker_results):
+        reported_files = readCheckerResults(args.checker_results)
+    else:
+        #collection checked without the structured results: read the checker log file
+        reported_files = readCheckerLog(os.path.join(scriptDir, "../download/logs/check_datasets.log"))
+
+    startRecover(args.datasets_folder, reported_files)
 
-    startRecover(args.datasets_folder,checker_error_log_path)
+    sniff_cache.close()
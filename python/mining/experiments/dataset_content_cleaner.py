@@ -1,84 +1,210 @@
 """
 This script will help the indexing phase by cleaning the data that is extracted from the developed parsers.
-The scope is to remove from the lists of literals, classes ecc. all the elements that are codes, numbers and 
+The scope is to remove from the lists of literals, classes ecc. all the elements that are codes, numbers and
 other string that does not contains human readable text and thus are not so useful in a Lucene index
+
+The dataset content is read and written in streaming, in batches of terms of the same field, so the lists of
+a dataset are never loaded in memory (except for the "terms" output layout, that needs all the term counts).
+Every batch is cleaned with precompiled patterns and the control characters, the repeated spaces and the html
+tags of all the terms of the batch are removed with a single substitution. The datasets are cleaned in parallel by a pool of processes.
+The fields of the cleaned files are written in the order of the original cleaner (entities, literals, classes and
+properties): the cleaned batches of the fields after the entities are kept in temporary files until the entities
+are written.
+
+The cleaned files depend on the parsing strategy:
+* labels: the dataset_content_rdflibhr files, all the fields are cleaned
+* standard: the dataset_content_jena and dataset_content_rdflib files, only the literals are cleaned because
+  the classes, entities and properties are URIs (that do not contain spaces) and they are copied as they are
+
+python3 dataset_content_cleaner.py path_to_datasets_folder labels [--workers 8] [--output-format jsonl.gz]
 """
 
-import json
 import os
 import argparse
 import logging
 import re
+import sys
+import json
+import tempfile
 from tqdm import tqdm
 
-def clean_dataset_content(dataset_content_rdflibhr_path:str, dataset_content_rdflibhr_clean_path:str):
-    dataset_content_rdflibhr_file = open(dataset_content_rdflibhr_path, "r", encoding="utf-8")
-    dataset_content_rdflibhr = json.load(dataset_content_rdflibhr_file)
-    dataset_content_rdflibhr_file.close()
+#the common modules are shared by all the phases
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../.."))
+from common.term_dictionary import iterDatasetBatches, writeDatasetContent, findDatasetContent, getBasePath
+from common.parallel_miner import mineParallel, exitOnFailures
 
-    dataset_content_rdflibhr_clean = {
-        "entities" : list(),  
-        "literals" : list(), 
-        "classes" : list(),
-        "properties" : list()
-    }
+#a term is kept if it contains a space and it has less numbers than half of its characters
+NUMBERS_PATTERN = re.compile(r"\d+")
 
-    fields = ["entities", "literals", "properties", "classes"]
+#control characters, repeated spaces and html tags, replaced by a space in a single pass (the same result of
+#the substitution of the control characters and of the spaces followed by the substitution of the tags)
+NOISE_PATTERN = re.compile(r"<.*?>|\n|\r|  +", re.DOTALL)
 
-    #clean the fields
-    for field in fields:
-        for element in dataset_content_rdflibhr[field]:
-            if " " in element:
-                numbers = re.findall("\d+", element)
-                
-                if len(numbers) < 0.5 * len(element):
+#the same pattern applied to all the terms of a batch joined by the separator, a tag cannot span two terms
+TERM_SEPARATOR = "\x00"
+BATCH_NOISE_PATTERN = re.compile(r"<[^\x00]*?>|\n|\r|  +")
 
-                    #clean from control characters
-                    element = re.sub("\\n|\\r|  +", ' ', element)
+#parsers of the dataset content files cleaned for every parsing strategy
+PARSING_STRATEGIES = {
+    "labels": ["rdflibhr"],
+    "standard": ["jena", "rdflib"]
+}
 
-                    #clean from html tags 
-                    element = re.sub(r'<.*?>', ' ', element)
+#fields of the standard parsing that contain URIs
+URI_FIELDS = ["classes", "entities", "properties"]
 
-                    dataset_content_rdflibhr_clean[field].append(element)
+#order of the fields in the cleaned files, the same of the original cleaner
+CLEAN_FIELDS = ["entities", "literals", "classes", "properties"]
+
+#number of terms cleaned together
+CLEAN_BATCH = 16384
+
+"""
+@param: terms, list of terms of a field
+@return list with the cleaned terms, without the terms that are not human readable text
+"""
+def clean_terms(terms:list) -> list:
+    findall = NUMBERS_PATTERN.findall
+    terms = [term for term in terms if " " in term and len(findall(term)) < 0.5 * len(term)]
 
-    #save the new file
-    dataset_content_rdflibhr_clean_file = open(dataset_content_rdflibhr_clean_path, "w", encoding="utf-8")
-    json.dump(dataset_content_rdflibhr_clean, dataset_content_rdflibhr_clean_file, ensure_ascii=False, indent=4)
-    dataset_content_rdflibhr_clean_file.close()
+    if len(terms) == 0:
+        return terms
 
+    #the whole batch is cleaned with a single substitution
+    batch = TERM_SEPARATOR.join(terms)
+
+    if batch.count(TERM_SEPARATOR) != len(terms) - 1:
+        #a term contains the separator: the terms are cleaned one at a time
+        return [NOISE_PATTERN.sub(" ", term) for term in terms]
+
+    return BATCH_NOISE_PATTERN.sub(" ", batch).split(TERM_SEPARATOR)
 
 """
-@param: datasets_folder, path to the folder where all the datasets are stored
+@param: dataset_content_path, path to the dataset content file (in any layout)
+@param: parsing_strategy, parsing strategy of the dataset content file ("labels" or "standard")
+@return generator of the (field, cleaned terms) batches of the file, in the order of CLEAN_FIELDS
+"""
+def clean_batches(dataset_content_path:str, parsing_strategy:str):
+    #the first field is written while it is read, the other fields are kept in a temporary file for every field
+    spill_files = dict()
+
+    try:
+        for field, terms in iterDatasetBatches(dataset_content_path, CLEAN_BATCH):
+            if not (parsing_strategy == "standard" and field in URI_FIELDS):
+                terms = clean_terms(terms)
+
+            if field == CLEAN_FIELDS[0]:
+                yield field, terms
+                continue
+
+            if field not in spill_files:
+                spill_files[field] = tempfile.TemporaryFile("w+", encoding="utf-8")
+            spill_files[field].write(json.dumps(terms, ensure_ascii=False) + "\n")
+
+        #the fields that are not in CLEAN_FIELDS are written at the end
+        for field in CLEAN_FIELDS[1:] + [field for field in spill_files if field not in CLEAN_FIELDS]:
+            if field in spill_files:
+                spill_files[field].seek(0)
+                for line in spill_files[field]:
+                    yield field, json.loads(line)
+
+    finally:
+        for spill_file in spill_files.values():
+            spill_file.close()
+
+"""
+@param: dataset_content_path, path to the dataset content file (in any layout)
+@param: dataset_content_clean_path, path of the cleaned dataset content file without the suffix
+@param: output_format, layout of the cleaned dataset content file ("json", "terms", "jsonl" or "jsonl.gz")
+@param: parsing_strategy, parsing strategy of the dataset content file ("labels" or "standard")
+"""
+def clean_dataset_content(dataset_content_path:str, dataset_content_clean_path:str, output_format:str = "json",
+                          parsing_strategy:str = "labels"):
+    #the cleaned batches are written as soon as they are read
+    writeDatasetContent(dataset_content_clean_path, output_format, clean_batches(dataset_content_path, parsing_strategy),
+                        CLEAN_FIELDS)
+
 """
-def clean_datasets_contents_labels(datasets_folder:str):
+@param: dataset_path, path to the dataset folder
+@param: parsing_strategy, parsing strategy of the dataset content files to be cleaned ("labels" or "standard")
+@return list with the paths of the dataset content files of the parsing strategy that exist in the dataset
+"""
+def get_dataset_contents(dataset_path:str, parsing_strategy:str) -> list:
+    dataset_content_paths = list()
+
+    for parser in PARSING_STRATEGIES[parsing_strategy]:
+        dataset_content_path = findDatasetContent(dataset_path + "/dataset_content_" + parser)
+
+        if dataset_content_path is not None:
+            dataset_content_paths.append(dataset_content_path)
 
-    bar = tqdm(total = len(os.listdir(datasets_folder)))
+    return dataset_content_paths
 
-    for dataset in os.scandir(datasets_folder):
-        dataset_content_rdflibhr_path = dataset.path + "/dataset_content_rdflibhr.json"
+"""
+@param: dataset_path, path to the dataset folder
+@param: parsing_strategy, parsing strategy of the dataset content files to be cleaned ("labels" or "standard")
+@param: output_format, layout of the cleaned dataset content files ("json", "terms", "jsonl" or "jsonl.gz")
+"""
+def clean_dataset(dataset_path:str, parsing_strategy:str, output_format:str = "json"):
+    for dataset_content_path in get_dataset_contents(dataset_path, parsing_strategy):
+        dataset_content_clean_path = getBasePath(dataset_content_path) + "_clean"
+        clean_dataset_content(dataset_content_path, dataset_content_clean_path, output_format, parsing_strategy)
+
+"""
+@param: datasets_folder, path to the folder where all the datasets are stored
+@param: parsing_strategy, parsing strategy of the dataset content files to be cleaned ("labels" or "standard")
+@param: output_format, layout of the cleaned dataset content files ("json", "terms", "jsonl" or "jsonl.gz")
+@param: workers, number of cleaning processes
+@return list with the arguments of the datasets that could not be cleaned
+"""
+def clean_datasets_contents(datasets_folder:str, parsing_strategy:str, output_format:str = "json", workers:int = 1) -> list:
+    dataset_paths = [dataset.path for dataset in os.scandir(datasets_folder) if dataset.is_dir()]
 
-        if os.path.exists(dataset_content_rdflibhr_path):
-            dataset_content_rdflibhr_clean_path = dataset.path + "/dataset_content_rdflibhr_clean.json"
-            clean_dataset_content(dataset_content_rdflibhr_path, dataset_content_rdflibhr_clean_path)
+    tasks = [(dataset_path, parsing_strategy, output_format) for dataset_path in dataset_paths]
 
-        bar.update(1)
+    #the datasets with the biggest content files are cleaned first
+    sizes = [sum(os.path.getsize(path) for path in get_dataset_contents(dataset_path, parsing_strategy))
+             for dataset_path in dataset_paths]
+
+    bar = tqdm(total = len(tasks))
+    return mineParallel(clean_dataset, tasks, workers, sizes=sizes, on_done=lambda task: bar.update(1))
 
 
 if __name__ == "__main__":
     # read the command line arguments
     parser = argparse.ArgumentParser()
     parser.add_argument(
-        "datasets_folder", 
-        type=str, 
+        "datasets_folder",
+        type=str,
         help="Absolute path to the folder where all the datasets are stored"
     )
     parser.add_argument(
         "parsing_strategy",
         type=str,
+        choices=list(PARSING_STRATEGIES.keys()),
         help="Which parsing strategy dataset_content files must be cleaned (\"labels\" or \"standard\")",
     )
-    args = parser.parse_args()        
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        choices=["json", "terms", "jsonl", "jsonl.gz"],
+        default="json",
+        help="Layout of the cleaned dataset content files (default json)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of cleaning processes (default 1, the datasets are cleaned in the main process)",
+    )
+    args = parser.parse_args()
 
-    if args.parsing_strategy == "labels":
-        clean_datasets_contents_labels(args.datasets_folder)
+    #the errors of the cleaning of a dataset are logged, the other datasets are cleaned anyway
+    logging.basicConfig(
+        filename="../logs/dataset_content_cleaner_errors.log",
+        filemode="a",
+        format="%(message)s",
+    )
 
+    failed_tasks = clean_datasets_contents(args.datasets_folder, args.parsing_strategy, args.output_format, args.workers)
+    exitOnFailures(failed_tasks)
@@ -8,12 +8,26 @@ import os
 import lightrdf
 import argparse
 import logging
-import re
+import sys
+import time
 from tqdm import tqdm
 
-SUFFIXES = ["rdf", "rdfs", "ttl", "owl", "n3", "nt", "jsonld", "xml", "ntriples", "nq", "trig", "trix"]
+#the common modules are shared by all the phases
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../.."))
+from common.manifest import Manifest, getDefaultManifestPath, getDatasetId, STATUS_MINED, STATUS_FAILED, STATUS_COMPLETED
+from common.extraction_cache import computeDigest
+from common.parallel_miner import mineParallel, getDatasetSize, exitOnFailures
+from common.metadata_store import getMetadataValue, appendRecord
+from common.file_supervisor import runFile, configureSupervisor
+from common.ntriples_scanner import isLineBased, iterTriples
+from common.chunked_miner import isChunkable, splitFile, searchChunk, mineFileChunks
+from common.term_dictionary import DatasetContent
+from triple_deduplication import TripleHashSet, dumpTriples, loadTriples
+
+#stage name of the miner in the crawl manifest
+STAGE = "lightrdf_deduplication_labels"
 
-MAX_TRIPLES = 300000
+SUFFIXES = ["rdf", "rdfs", "ttl", "owl", "n3", "nt", "jsonld", "xml", "ntriples", "nq", "trig", "trix"]
 
 '''
 @param: node, string representation of a RDF graph node
@@ -23,63 +37,148 @@ def is_literal(node: str) -> bool:
     return node.startswith('"') and node.endswith('"')
 
 '''
-@param: dataset_path, path to the dataset folder
-@param: file, path to the RDF file
-@param: triples, set of triples
-@param: map_uri_label, mapping from URI to label
-@return True if the file is mined, else False
+@param: file_path, path to the RDF file
+@param: chunk, (header, start, end) chunk of the file to be parsed (None for the whole file)
+@return iterable of the triples of the file, as N-Triples strings
 '''
-def tripleDeduplication(dataset_path:str, file: str, triples:set, map_uri_label:dict)->bool:
+def searchTriples(file_path: str, chunk: tuple = None):
+    if chunk is not None:
+        return searchChunk(file_path, chunk)
 
-    ext = file.split(".")[-1]
+    #the N-Triples and N-Quads files are scanned line by line (lightrdf does not parse the N-Quads files)
+    if isLineBased(file_path):
+        return iterTriples(file_path)
 
-    if ext in SUFFIXES:
+    return lightrdf.RDFDocument(file_path).search_triples(None, None, None)
 
-        file_path = dataset_path+"/"+file
+'''
+@param: triples, iterable of triples
+@param: map_uri_label, mapping from URI to label where the labels of the triples are saved
+@return generator of the triples
+'''
+def collectLabels(triples, map_uri_label:dict):
+    for triple in triples:
+
+        #retrieve labels
+        sub = triple[0]
+        prop = triple[1]
+        obj = triple[2]
 
-        #check the file size
-        size = os.path.getsize(file_path) / (1024*1024)
+        #clean subject and property from < > 
+        sub = sub.replace("<", "").replace(">", "")
+        prop = prop.replace("<", "").replace(">", "")
 
-        is_big = False
-        if size > 500:
-            is_big = True
+        #save the labels
+        if "label" in prop.lower() or "name" in prop.lower() and is_literal(obj):
+            map_uri_label[sub] = obj; 
 
-        try: 
+        yield triple
 
-            doc = lightrdf.RDFDocument(file_path)
+'''
+@param: file_path, path to the RDF file
+@param: triples_path, path of the triples file where the triples of the file are written
+@param: chunk, (header, start, end) chunk of the file to be parsed (None for the whole file)
+@return mapping from URI to label of the file
+'''
+def extractTriples(file_path:str, triples_path:str, chunk:tuple = None) -> dict:
+    map_uri_label = dict()
+    dumpTriples(collectLabels(searchTriples(file_path, chunk), map_uri_label), triples_path)
 
-            triple_count = 0 
+    return map_uri_label
 
-            #triple deduplication
-            for triple in doc.search_triples(None, None, None):
-                if is_big and triple_count > MAX_TRIPLES: 
-                    break
+'''
+@param: file_path, path to the RDF file
+@param: triples_path, path of the triples file where the triples of the file are written
+@return mapping from URI to label of the file
+'''
+def parseTriples(file_path:str, triples_path:str) -> dict:
+    chunks = splitFile(file_path, chunk_workers) if chunk_workers > 1 and isChunkable(file_path) else None
 
-                triples.add(triple)
+    if chunks is None:
+        #the file is parsed in the supervised worker if the supervision is enabled
+        return runFile(extractTriples, file_path, triples_path)
 
-                #retrieve labels
-                sub = triple[0]
-                prop = triple[1]
-                obj = triple[2]
+    #the chunks of the huge line based files are parsed in parallel by the chunk workers (without supervision),
+    #their triples files are appended and their labels are merged in the order of the file
+    map_uri_label = dict()
+    for chunk_map_uri_label in mineFileChunks(extractTriples, file_path, chunks, triples_path, chunk_workers):
+        map_uri_label.update(chunk_map_uri_label)
 
-                #clean subject and property from < > 
-                sub = re.sub("<|>", "", sub)
-                prop = re.sub("<|>", "", prop)
+    return map_uri_label
 
-                #save the labels
-                if "label" in prop.lower() or "name" in prop.lower() and is_literal(obj):
-                    map_uri_label[sub] = obj; 
+'''
+@param: dataset_content, content of the dataset
+@param: triple, deduplicated triple
+@param: map_uri_label, mapping from URI to label of the dataset
+'''
+def addTriple(dataset_content: DatasetContent, triple: tuple, map_uri_label: dict):
+    sub = triple[0]
+    prop = triple[1]
+    obj = triple[2]
+
+    #clean subject and property from < > 
+    sub = sub.replace("<", "").replace(">", "")
+    prop = prop.replace("<", "").replace(">", "")
+    
+    #retrieve the possible label for the subject
+    subject_label = map_uri_label.get(sub, sub)
+    dataset_content.add("entities", subject_label)
 
-                triple_count += 1
+    #retrieve the possible label for the object
+    object_label = map_uri_label.get(obj, obj)
+    
+    if "type" in prop.lower() or "a" == prop.lower():
+        obj = obj.replace("<", "").replace(">", "")
+        dataset_content.add("properties", prop)
+        dataset_content.add("classes", object_label)
+        return
+
+    dataset_content.add("properties", prop)
+
+    if is_literal(obj):
+        dataset_content.add("literals", obj+"\n")
+    else:
+        obj = obj.replace("<", "").replace(">", "")
+        dataset_content.add("entities", object_label+"\n")
+
+'''
+@param: dataset_path, path to the dataset folder
+@param: dataset, name of the dataset
+@param: file, path to the RDF file
+@param: triples_path, path of the triples file where the triples of the file are written
+@param: map_uri_label, mapping from URI to label
+@return True if the file is mined, else False
+'''
+def parseFile(dataset_path:str, dataset: str, file: str, triples_path:str, map_uri_label:dict)->bool:
+
+    ext = file.split(".")[-1]
+
+    started_at = time.time()
+
+    if ext in SUFFIXES:
+
+        file_path = dataset_path+"/"+file
+
+        try: 
+
+            map_uri_label.update(parseTriples(file_path, triples_path))
         
         except Exception as e :
             error_message = str(e).strip("\n")
             log.warning(f"Dataset: {dataset}\nFile: {file}\nError: {error_message}\n")
+            manifest.record(STAGE, dataset, STATUS_FAILED, file_name=file, started_at=started_at, finished_at=time.time(),
+                            error_class=type(e).__name__, detail=error_message)
+            if os.path.exists(triples_path):
+                os.remove(triples_path)
             return False
 
+        manifest.record(STAGE, dataset, STATUS_MINED, file_name=file, size=os.path.getsize(file_path), 
+                        started_at=started_at, finished_at=time.time())
         return True
     
     log.warning(f"Dataset: {dataset}\nFile: {file}\nError: File not RDF\n")
+    manifest.record(STAGE, dataset, STATUS_FAILED, file_name=file, started_at=started_at, finished_at=time.time(),
+                    error_class="NotRDF", detail="File not RDF")
     return False
 
 
@@ -88,89 +187,124 @@ def tripleDeduplication(dataset_path:str, file: str, triples:set, map_uri_label:
 @param: dataset, to be considered (string with the dataset name)
 @param: errors, list of problem files for jena in the dataset
 @param: resume, boolean used for resume mechanism
+@param: dedup_memory, memory in MB of the hash table of the triples deduplication
+@param: spill_directory, directory where the triples and their hashes are spilled (None for the system temporary directory)
+@param: output_format, layout of the dataset content file ("json", "terms", "jsonl" or "jsonl.gz")
 '''
-def mineDataset(datasets_directory_path: str, dataset: str, errors: list, resume: bool):
+def mineDataset(datasets_directory_path: str, dataset: str, errors: list, resume: bool, dedup_memory: int = 256, 
+                spill_directory: str = None, output_format: str = "json"):
 
     dataset_path = datasets_directory_path+"/"+dataset 
 
-    #open the dataset metadata file
-    dataset_metadata_file = open(dataset_path+"/dataset_metadata.json", "r", encoding="utf-8")
-    dataset_metadata = json.load(dataset_metadata_file, strict = False)
-    dataset_metadata_file.close()
-
-    #checking for the resume mechanism
-    if "mined_lightrdf_deduplication" in dataset_metadata.keys():
-        if dataset_metadata["mined_lightrdf_deduplication"] and resume:
-            return
+    #checking for the resume mechanism (the datasets in the completion index of the manifest are
+    #not even scheduled, the metadata key of the stage is read for the datasets mined before the index)
+    if resume and getMetadataValue(dataset_path, "mined_lightrdf_deduplication_labels", False):
+        manifest.record(STAGE, dataset, STATUS_COMPLETED, finished_at=time.time())
+        return
 
     mined_files = list()
 
-    dataset_content = dict()
-    dataset_content["entities"] = list()
-    dataset_content["literals"] = list()
-    dataset_content["properties"] = list()
-    dataset_content["classes"] = list()
+    #every distinct term is stored once, the fields keep the ids of the terms
+    dataset_content = DatasetContent()
+
+    #save the hashes of all the triples for doing triple deduplication
+    triples = TripleHashSet(dedup_memory, spill_directory)
 
-    #save all the triples in a set for doing triple deduplication
-    triples = set()
+    #triples files of the parsed files
+    triples_paths = list()
 
     #map uri->lable
     map_uri_label = dict()
 
+    #files with the same content add no new triple to the set, so only the first one is parsed
+    #(the hash is computed only for the files with the same size of another file of the dataset)
+    files_sizes = [os.path.getsize(dataset_path+"/"+file) for file in errors if os.path.isfile(dataset_path+"/"+file)]
+    mined_digests = dict()
+
     for file in errors:
 
-        if tripleDeduplication(dataset_path, file, triples, map_uri_label): 
+        file_path = dataset_path+"/"+file
+
+        digest = None
+        if os.path.isfile(file_path) and files_sizes.count(os.path.getsize(file_path)) > 1:
+            digest = computeDigest(file_path)
+
+            if digest in mined_digests:
+                mined_files.append(file)
+                manifest.record(STAGE, dataset, STATUS_MINED, file_name=file, size=os.path.getsize(file_path),
+                                sha256=digest, detail=f"duplicate of {mined_digests[digest]}")
+                continue
+
+        #first pass: the triples of the file are written in a triples file and its labels are saved
+        triples_path = os.path.join(triples.directory, f"triples_{len(triples_paths)}.jsonl")
+
+        if parseFile(dataset_path, dataset, file, triples_path, map_uri_label): 
             mined_files.append(file) 
+            triples_paths.append(triples_path)
+
+            if digest is not None:
+                mined_digests[digest] = file
     
-    #read the deduplicated triples
-    for triple in triples:
-        sub = triple[0]
-        prop = triple[1]
-        obj = triple[2]
+    #second pass: triple deduplication, all the labels of the dataset are known and only the new triples 
+    #are added to the dataset content
+    for triples_path in triples_paths:
+        for batch in loadTriples(triples_path):
+            for triple, new in zip(batch, triples.add(batch)):
+                if new:
+                    addTriple(dataset_content, triple, map_uri_label)
 
-        #clean subject and property from < > 
-        sub = re.sub("<|>", "", sub)
-        prop = re.sub("<|>", "", prop)
-        
-        #retrieve the possible label for the subject
-        subject_label = map_uri_label.get(sub, sub)
-        dataset_content["entities"].append(subject_label)
+        os.remove(triples_path)
 
-        #retrieve the possible label for the object
-        object_label = map_uri_label.get(obj, obj)
-        
-        if "type" in prop.lower() or "a" == prop.lower():
-            obj = re.sub("<|>", "", obj)
-            dataset_content["properties"].append(prop)
-            dataset_content["classes"].append(object_label)
-            continue
-
-        dataset_content["properties"].append(prop)
-
-        if is_literal(obj):
-            dataset_content["literals"].append(obj+"\n")
-        else:
-            obj = re.sub("<|>", "", obj)
-            dataset_content["entities"].append(object_label+"\n")
-
-
-    #update the dataset_metadata json file with the mining information
-    dataset_metadata["mined_lightrdf_not_large"] = True
-    dataset_metadata["mined_lightrdf_not_large_files"] = mined_files
-
-    #writing the json file of the metaadata
-    json_serial = json.dumps(dataset_metadata, indent=4, ensure_ascii=False)
-    with open(dataset_path+"/dataset_metadata.json", "w", encoding="utf-8") as dataset_metadata_file:
-        dataset_metadata_file.write(json_serial)
-
-    #writing the json file of the content   
-    json_serial = json.dumps(dataset_content, indent=4, ensure_ascii=False)
-    with open(dataset_path+"/dataset_content_lightrdf_deduplication.json", "w", encoding="utf-8") as dataset_content_file:
-        dataset_content_file.write(json_serial)
-    
-    del json_serial
-    del dataset_metadata
-    del dataset_content
+    triples.close()
+
+    #writing the file of the content   
+    dataset_content.write(dataset_path+"/dataset_content_lightrdf_deduplication", output_format)
+
+    #update the dataset metadata with the mining information (append-only record, the metadata file is not rewritten)
+    appendRecord(dataset_path, {"mined_lightrdf_deduplication_labels": True, "mined_lightrdf_not_large_files": mined_files})
+
+    #stage completion index used by the resume mechanism
+    manifest.record(STAGE, dataset, STATUS_COMPLETED, files=len(mined_files), finished_at=time.time())
+
+    #the term frequencies of the dataset are added to the global term index (if it is built) after the dataset is
+    #recorded as completed: an error of the index (e.g. a lock timeout) is logged and the dataset is not mined again
+    if term_index is not None:
+        try:
+            term_index.addDataset(STAGE, dataset, dataset_content)
+        except Exception as e:
+            log.warning(f"Dataset: {dataset}\nTerm index error: {e}\n")
+
+'''
+Opening of the global term frequency index, that is built only on request (the index module and numpy are
+imported only when the index is built)
+
+@param: term_index_path, path to the global term frequency index, None if the index is not built
+@return the term index, None if the index is not built
+'''
+def openTermIndex(term_index_path:str):
+    if term_index_path is None:
+        return None
+
+    from common.term_index import TermIndex
+    return TermIndex(term_index_path)
+
+'''
+Initialization of the worker processes of the parallel mining
+
+@param: manifest_path, path to the crawl manifest
+@param: term_index_path, path to the global term frequency index (None if the index is not built)
+@param: supervision, settings of the file supervision (timeout, memory limit, recycle after)
+@param: chunks, number of processes that parse the chunks of a huge line based file
+'''
+def initWorker(manifest_path: str, term_index_path: str, supervision:tuple, chunks:int = 1):
+    global log, manifest, term_index, chunk_workers
+
+    log = logging.getLogger("lightrdf_miner")
+    manifest = Manifest(manifest_path)
+    term_index = openTermIndex(term_index_path)
+
+    configureSupervisor(*supervision)
+    chunk_workers = chunks
 
 
 if __name__ == "__main__":
@@ -189,6 +323,67 @@ if __name__ == "__main__":
         action="store_true",
 		help="Add if you want to resume the parsing process"
     )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        help="Path to the crawl manifest (default: acordar_manifest.sqlite next to the datasets folder)",
+    )
+    parser.add_argument(
+        "--term-index",
+        type=str,
+        help="Path to the global term frequency index where the term counts of every mined dataset are added (default: no index, the dataset content files can be indexed later with the build command of term_index.py)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes that mine the datasets in parallel (default 1)",
+    )
+    parser.add_argument(
+        "--memory-limit",
+        type=int,
+        help="Maximum memory in MB of every mining process (default: no limit)",
+    )
+    parser.add_argument(
+        "--file-timeout",
+        type=float,
+        help="Maximum time in seconds for the parsing of a file, every file is parsed in a supervised process (default: no limit)",
+    )
+    parser.add_argument(
+        "--file-memory-limit",
+        type=int,
+        help="Maximum RSS in MB of the process that parses a file, every file is parsed in a supervised process (default: no limit)",
+    )
+    parser.add_argument(
+        "--recycle-after",
+        type=int,
+        default=100,
+        help="Number of files after which the supervised parsing process is restarted (default 100)",
+    )
+    parser.add_argument(
+        "--chunk-workers",
+        type=int,
+        default=1,
+        help="Number of processes that parse the chunks of a huge N-Triples, N-Quads or Turtle file in parallel (default 1, the files are not split)",
+    )
+    parser.add_argument(
+        "--dedup-memory",
+        type=int,
+        default=256,
+        help="Memory in MB of the hash table of the triples deduplication of every dataset (default 256)",
+    )
+    parser.add_argument(
+        "--spill-directory",
+        type=str,
+        help="Directory where the triples and their hashes are spilled (default: system temporary directory)",
+    )
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        choices=["json", "terms", "jsonl", "jsonl.gz"],
+        default="json",
+        help="Layout of the dataset content file: \"json\" (lists of strings), \"terms\" (term dictionary with the term counts, dataset_content_*.terms.json) or \"jsonl\" / \"jsonl.gz\" (a line for every term, dataset_content_*.jsonl[.gz])",
+    )
     args = parser.parse_args()
 
     #path to the error log file of Jena Deduplication miner
@@ -202,6 +397,23 @@ if __name__ == "__main__":
     )
     log = logging.getLogger("lightrdf_miner")
 
+    #supervision of the parsing of every file
+    supervision = (args.file_timeout, args.file_memory_limit, args.recycle_after)
+    configureSupervisor(*supervision)
+
+    #parallel parsing of the chunks of the huge line based files
+    global chunk_workers
+    chunk_workers = args.chunk_workers
+
+    manifest_path = args.manifest or getDefaultManifestPath(args.datasets_folder)
+    term_index_path = args.term_index
+
+    global manifest
+    manifest = Manifest(manifest_path)
+
+    global term_index
+    term_index = openTermIndex(term_index_path)
+
     #open the error log file of the rdflib miner
     f_log=open(error_log_file_path, "r")
 
@@ -229,8 +441,21 @@ if __name__ == "__main__":
                 
     print("Find: "+str(n_dataset)+" datasets with problem files, starts mining ...")
 
-    pbar = tqdm(total = len(datasets_files_errors.keys()))
+    if args.resume:
+        #the datasets already mined are skipped with the completion index of the manifest, without reading their metadata
+        completed_datasets = manifest.getCompleted(STAGE)
+        datasets_files_errors = {dataset: errors for dataset, errors in datasets_files_errors.items() 
+                                 if getDatasetId(dataset) not in completed_datasets}
+
+    tasks = [(args.datasets_folder, dataset, errors, args.resume, args.dedup_memory, args.spill_directory, args.output_format) for dataset, errors in datasets_files_errors.items()]
+    sizes = [getDatasetSize(args.datasets_folder+"/"+dataset, errors) for dataset, errors in datasets_files_errors.items()]
+
+    pbar = tqdm(total = len(tasks))
+    failed_tasks = mineParallel(mineDataset, tasks, args.workers, initWorker, (manifest_path, term_index_path, supervision, args.chunk_workers), args.memory_limit, sizes, lambda task: pbar.update(1))
+
+    manifest.close()
+    if term_index is not None:
+        term_index.close()
 
-    for dataset, errors in datasets_files_errors.items():
-        mineDataset(args.datasets_folder, dataset, errors, args.resume)
-        pbar.update(1)
+    #the datasets that raised an error or crashed their worker are in the log file
+    exitOnFailures(failed_tasks)
@@ -1,6 +1,9 @@
 """
 Extracts the ACORDAR baseline needed data from all the datasets files with valid suffixes that are not mined from by JENA 
 or RDFLib because were too big
+
+The files bigger than 4 GB that cannot be split in chunks (or all of them, with --sampling) are mined from a 
+deterministic sample of their triples (common/triple_sampler.py)
 """
 
 import json
@@ -8,11 +11,36 @@ import os
 import lightrdf
 import argparse
 import logging
+import sys
+import time
+import tempfile
+
+#the common modules are shared by all the phases
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../.."))
+from common.manifest import Manifest, getDefaultManifestPath, getDatasetId, STATUS_MINED, STATUS_FAILED, ERROR_FILE_TOO_BIG, STATUS_COMPLETED
+from common.parallel_miner import mineParallel, getDatasetSize, exitOnFailures
+from common.metadata_store import getMetadataValue, appendRecord
+from common.file_supervisor import runFile, configureSupervisor
+from common.ntriples_scanner import isLineBased, iterTriples
+from common.chunked_miner import isChunkable, splitFile, searchChunk, mineChunks, appendFiles
+from common.triple_sampler import sampleFile, SAMPLING_STRATEGIES
+
+#stage name of the miner in the crawl manifest
+STAGE = "lightrdf"
+
+#stage of the rdflib miner, it reports the files too big for RDFLib
+RDFLIB_STAGE = "rdflib"
 
 SUFFIXES = ["rdf", "rdfs", "ttl", "owl", "n3", "nt", "jsonld", "xml", "ntriples", "nq", "trig", "trix"]
 
 MAX_ROWS = 300000
 
+#sampling of the files bigger than 4 GB that are not mined fully: (strategy, size, seed)
+DEFAULT_SAMPLING = ("head", MAX_ROWS, 0)
+
+#txt files written by the miner in the dataset folder
+OUTPUT_FILES = ["classes_lightrdf.txt", "entities_lightrdf.txt", "literals_lightrdf.txt", "properties_lightrdf.txt"]
+
 '''
 @param: node, string representation of a RDF graph node
 @return True if the node is a string else False
@@ -20,93 +48,146 @@ MAX_ROWS = 300000
 def is_literal(node: str) -> bool:
     return node.startswith('"') and node.endswith('"')
 
+'''
+@param: file_path, path to the RDF file
+@param: chunk, (header, start, end) chunk of the file to be parsed (None for the whole file)
+@return iterable of the triples of the file, as N-Triples strings
+'''
+def searchTriples(file_path: str, chunk: tuple = None):
+    if chunk is not None:
+        return searchChunk(file_path, chunk)
+
+    #the N-Triples and N-Quads files are scanned line by line (lightrdf does not parse the N-Quads files)
+    if isLineBased(file_path):
+        return iterTriples(file_path)
+
+    return lightrdf.RDFDocument(file_path).search_triples(None, None, None)
+
+
+'''
+@param: dataset_path, path to the dataset folder
+@param: file_path, path to the file that must be mined
+@param: file_too_big, boolean that indicates if the file is bigger than 4GB
+@param: chunk, (header, start, end) chunk of the file to be mined (None for the whole file)
+@param: sampling, (strategy, size, seed) sampling of the file if it is bigger than 4GB (None for the first MAX_ROWS triples)
+@output the classes, entities, literals and properties of the file are appended to the txt files of the dataset
+'''
+def extractFile(dataset_path:str, file_path:str, file_too_big:bool, chunk:tuple = None, sampling:tuple = None):
+    with (
+        open(dataset_path+"/classes_lightrdf.txt", "a") as classes,
+        open(dataset_path+"/entities_lightrdf.txt", "a") as entities,
+        open(dataset_path+"/literals_lightrdf.txt", "a") as literals,
+        open(dataset_path+"/properties_lightrdf.txt", "a") as properties,
+    ):
+        triples = searchTriples(file_path, chunk)
+
+        if file_too_big:
+            #only a sample of the triples of the file is mined
+            for triple in sampleFile(file_path, triples, *(sampling or DEFAULT_SAMPLING)):
+                sub = triple[0]
+                prop = triple[1]
+                obj = triple[2]
+
+                entities.write(sub+"\n")
+
+                if "type" in prop.lower() or "a" == prop.lower():
+                    classes.write(obj+"\n")
+                    continue
+
+                properties.write(prop+"\n")
+
+                if is_literal(obj):
+                    literals.write(obj+"\n")
+                else:
+                    entities.write(obj+"\n")
+        else:
+            for triple in triples:
+                sub = triple[0]
+                prop = triple[1]
+                obj = triple[2]
+
+                entities.write(sub+"\n")
+
+                if "type" in prop.lower() or "a" == prop.lower():
+                    properties.write(prop+"\n")
+                    classes.write(obj+"\n")
+                    continue
+
+                properties.write(prop+"\n")
+
+                if is_literal(obj):
+                    literals.write(obj+"\n")
+                else:
+                    entities.write(obj+"\n")
+
+'''
+@param: dataset_path, path to the dataset folder
+@param: file_path, path to the file that must be mined
+@param: chunks, list of the (header, start, end) chunks of the file
+@output the classes, entities, literals and properties of the chunks are appended to the txt files of the 
+        dataset, in the order of the file
+'''
+def extractChunks(dataset_path:str, file_path:str, chunks:list):
+    with tempfile.TemporaryDirectory(prefix="lightrdf_chunks_") as chunks_path:
+        #every chunk writes its txt files in its own folder
+        chunk_paths = [os.path.join(chunks_path, str(i)) for i in range(len(chunks))]
+        for chunk_path in chunk_paths:
+            os.mkdir(chunk_path)
+
+        mineChunks(extractFile, [(chunk_path, file_path, False, chunk) for chunk_path, chunk in zip(chunk_paths, chunks)], chunk_workers)
+
+        for output_file in OUTPUT_FILES:
+            appendFiles([chunk_path+"/"+output_file for chunk_path in chunk_paths], dataset_path+"/"+output_file)
 
 '''
 @param: dataset_path, path to the dataset folder
 @param: dataset, name of the dataset
 @param: file, name of the file that must be mined
 @param: file_too_big, boolean that indicates if the file is bigger than 4GB
-@param: dataset_content, dictionary with the dataset content already mined
 @return True if the file is mined, else False
 '''
 def mineFile(dataset_path:str, dataset: str, file: str, file_too_big: bool) -> bool : 
-    classes = open(dataset_path+"/classes_lightrdf.txt", "a")
-    entities = open(dataset_path+"/entities_lightrdf.txt", "a")
-    literals = open(dataset_path+"/literals_lightrdf.txt", "a")
-    properties = open(dataset_path+"/properties_lightrdf.txt", "a")
-
     ext = file.split(".")[-1]
 
+    started_at = time.time()
+
     if ext in SUFFIXES:
 
         file_path = dataset_path+"/"+file
 
         try: 
-
-            doc = lightrdf.RDFDocument(file_path)
-
-            if file_too_big:
-                i = 0 
-        
-                for triple in doc.search_triples(None, None, None):
-                    sub = triple[0]
-                    prop = triple[1]
-                    obj = triple[2]
-
-                    entities.write(sub+"\n")
-
-                    if "type" in prop.lower() or "a" == prop.lower():
-                        classes.write(obj+"\n")
-                        continue
-
-                    properties.write(prop+"\n")
-
-                    if is_literal(obj):
-                        literals.write(obj+"\n")
-                    else:
-                        entities.write(obj+"\n")
-                    
-                    if i > MAX_ROWS:
-                        break
-                    
-                    i += 1 
+            #the huge line based files are split in chunks and mined fully (without the MAX_ROWS limit, unless a
+            #sampling strategy is chosen), the chunks are parsed in parallel if there are more chunk workers
+            chunks = None
+            if (sampling is None if file_too_big else chunk_workers > 1) and isChunkable(file_path):
+                chunks = splitFile(file_path, chunk_workers)
+
+            if chunks is not None:
+                #the chunk workers are not supervised
+                extractChunks(dataset_path, file_path, chunks)
             else:
-                for triple in doc.search_triples(None, None, None):
-                    sub = triple[0]
-                    prop = triple[1]
-                    obj = triple[2]
-
-                    entities.write(sub+"\n")
-
-                    if "type" in prop.lower() or "a" == prop.lower():
-                        properties.write(prop+"\n")
-                        classes.write(obj+"\n")
-                        continue
-
-                    properties.write(prop+"\n")
-
-                    if is_literal(obj):
-                        literals.write(obj+"\n")
-                    else:
-                        entities.write(obj+"\n")
+                #the file is parsed in the supervised worker if the supervision is enabled
+                runFile(extractFile, dataset_path, file_path, file_too_big, None, sampling)
 
         except Exception as e :
             error_message = str(e).strip("\n")
             log.warning(f"Dataset: {dataset}\nFile: {file}\nError: {error_message}\n")
+            manifest.record(STAGE, dataset, STATUS_FAILED, file_name=file, started_at=started_at, finished_at=time.time(),
+                            error_class=type(e).__name__, detail=error_message)
             return False
 
-        entities.close() 
-        classes.close()
-        properties.close()
-        literals.close()   
+        #the sampled files are marked in the manifest
+        detail = None
+        if file_too_big and chunks is None:
+            detail = "sample: {} {} triples, seed {}".format(*(sampling or DEFAULT_SAMPLING))
+
+        manifest.record(STAGE, dataset, STATUS_MINED, file_name=file, size=os.path.getsize(file_path), 
+                        started_at=started_at, finished_at=time.time(), detail=detail)
         return True
     
-
-    entities.close() 
-    classes.close()
-    properties.close()
-    literals.close()
     log.warning(f"Dataset: {dataset}\nFile: {file}\nError: File not RDF\n")
+    manifest.record(STAGE, dataset, STATUS_FAILED, file_name=file, started_at=started_at, finished_at=time.time(),
+                    error_class="NotRDF", detail="File not RDF")
     return False
 
 """
@@ -128,15 +209,11 @@ def mineDataset(datasets_directory_path: str, dataset: str, errors: list, resume
 
     dataset_path = datasets_directory_path+"/"+dataset 
 
-    #open the dataset metadata file
-    dataset_metadata_file = open(dataset_path+"/dataset_metadata.json", "r", encoding="utf-8")
-    dataset_metadata = json.load(dataset_metadata_file, strict = False)
-    dataset_metadata_file.close()
-
-    #checking for the resume mechanism
-    if "mined_lightrdf" in dataset_metadata.keys():
-        if dataset_metadata["mined_lightrdf"] and resume:
-            return
+    #checking for the resume mechanism (the datasets in the completion index of the manifest are
+    #not even scheduled, the metadata key is read for the datasets mined before the index)
+    if resume and getMetadataValue(dataset_path, "mined_lightrdf", False):
+        manifest.record(STAGE, dataset, STATUS_COMPLETED, finished_at=time.time())
+        return
 
     print("Mining dataset: "+dataset)
 
@@ -149,19 +226,62 @@ def mineDataset(datasets_directory_path: str, dataset: str, errors: list, resume
         if mineFile(dataset_path, dataset, file, file_too_big):
             mined_files.append(file) 
 
-    #update the dataset_metadata json file with the mining information
-    dataset_metadata["mined_lightrdf"] = True
-    dataset_metadata["mined_files_lightrdf"] = mined_files
+    #update the dataset metadata with the mining information (append-only record, the metadata file is not rewritten)
+    appendRecord(dataset_path, {"mined_lightrdf": True, "mined_files_lightrdf": mined_files})
 
-    json_serial = json.dumps(dataset_metadata, indent=4, ensure_ascii=False)
+    #stage completion index used by the resume mechanism
+    manifest.record(STAGE, dataset, STATUS_COMPLETED, files=len(mined_files), finished_at=time.time())
 
-    #writing the json file of the content
-    with open(dataset_path+"/dataset_metadata.json", "w", encoding="utf-8") as dataset_metadata_file:
-        dataset_metadata_file.write(json_serial)
+"""
+@param: rdflib_error_log_file_path, path to the error log file of the rdflib miner
+@return dictionary with the list of the files bigger than the RDFLib limit for every dataset
+"""
+def readRDFLibLog(rdflib_error_log_file_path: str) -> dict:
+
+    #open the error log file of the rdflib miner
+    f_log_rdflib=open(rdflib_error_log_file_path, "r")
+
+    datasets_files_errors = {}
+
+    while True:
+        line1 = f_log_rdflib.readline()
+    
+        if not line1:
+            break
+
+        line2 = f_log_rdflib.readline()
+        line3 = f_log_rdflib.readline()
     
-    dataset_metadata_file.close()
-    del json_serial
-    del dataset_metadata
+        if "Bigger than" in line3:
+            dataset = line1.split(": ")[1].strip("\n")
+            file = line2.split(": ")[1].strip("\n")
+
+            if dataset not in datasets_files_errors:
+                datasets_files_errors[dataset] = list()
+            
+            datasets_files_errors[dataset].append(file)
+
+    f_log_rdflib.close()
+
+    return datasets_files_errors
+
+'''
+Initialization of the worker processes of the parallel mining
+
+@param: manifest_path, path to the crawl manifest
+@param: supervision, settings of the file supervision (timeout, memory limit, recycle after)
+@param: chunks, number of processes that parse the chunks of a huge line based file
+@param: sample, (strategy, size, seed) sampling of the files bigger than 4GB (None to mine fully the files that can be split)
+'''
+def initWorker(manifest_path: str, supervision:tuple, chunks:int = 1, sample:tuple = None):
+    global log, manifest, chunk_workers, sampling
+
+    log = logging.getLogger("lightrdf_miner")
+    manifest = Manifest(manifest_path)
+
+    configureSupervisor(*supervision)
+    chunk_workers = chunks
+    sampling = sample
 
 
 if __name__ == "__main__":
@@ -180,6 +300,62 @@ if __name__ == "__main__":
         action="store_true",
 		help="Add if you want to resume the parsing process"
     )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        help="Path to the crawl manifest (default: acordar_manifest.sqlite next to the datasets folder)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes that mine the datasets in parallel (default 1)",
+    )
+    parser.add_argument(
+        "--memory-limit",
+        type=int,
+        help="Maximum memory in MB of every mining process (default: no limit)",
+    )
+    parser.add_argument(
+        "--file-timeout",
+        type=float,
+        help="Maximum time in seconds for the parsing of a file, every file is parsed in a supervised process (default: no limit)",
+    )
+    parser.add_argument(
+        "--file-memory-limit",
+        type=int,
+        help="Maximum RSS in MB of the process that parses a file, every file is parsed in a supervised process (default: no limit)",
+    )
+    parser.add_argument(
+        "--recycle-after",
+        type=int,
+        default=100,
+        help="Number of files after which the supervised parsing process is restarted (default 100)",
+    )
+    parser.add_argument(
+        "--chunk-workers",
+        type=int,
+        default=1,
+        help="Number of processes that parse the chunks of a huge N-Triples, N-Quads or Turtle file in parallel (default 1, only the files bigger than 4 GB are split and their chunks are parsed one after the other)",
+    )
+    parser.add_argument(
+        "--sampling",
+        type=str,
+        choices=SAMPLING_STRATEGIES,
+        help="Sampling strategy of the files bigger than 4 GB: \"head\" (the first triples), \"reservoir\" (uniform sample), \"stratified\" (uniform sample of every predicate) or \"seek\" (lines at random offsets of the N-Triples and N-Quads files) (default: the files that can be split are mined fully, the first triples of the others)",
+    )
+    parser.add_argument(
+        "--sample-size",
+        type=int,
+        default=MAX_ROWS,
+        help=f"Number of triples of the sample of a file (default {MAX_ROWS})",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the sampling (default 0)",
+    )
     args = parser.parse_args()
 
     #path to the error log file of the rdflib miner
@@ -195,39 +371,60 @@ if __name__ == "__main__":
     )
     log = logging.getLogger("lightrdf_miner")
 
-    #open the error log file of the rdflib miner
-    f_log_rdflib=open(rdflib_error_log_file_path, "r")
+    #supervision of the parsing of every file
+    supervision = (args.file_timeout, args.file_memory_limit, args.recycle_after)
+    configureSupervisor(*supervision)
 
-    n_dataset = 0
+    #parallel parsing of the chunks of the huge line based files
+    global chunk_workers
+    chunk_workers = args.chunk_workers
 
-    datasets_files_errors = {}
+    #sampling of the files bigger than 4 GB
+    global sampling
+    sampling = (args.sampling, args.sample_size, args.seed) if args.sampling else None
 
-    while True:
-        line1 = f_log_rdflib.readline()
-    
-        if not line1:
-            break
+    manifest_path = args.manifest or getDefaultManifestPath(args.datasets_folder)
 
-        line2 = f_log_rdflib.readline()
-        line3 = f_log_rdflib.readline()
-    
-        if "Bigger than" in line3:
-            dataset = line1.split(": ")[1].strip("\n")
-            file = line2.split(": ")[1].strip("\n")
+    global manifest
+    manifest = Manifest(manifest_path)
 
+    if manifest.hasStage(RDFLIB_STAGE):
+        #files reported as too big by the rdflib miner
+        datasets_files_errors = dict()
+        for record in manifest.getRecords(RDFLIB_STAGE, STATUS_FAILED, error_class=ERROR_FILE_TOO_BIG):
+            dataset = "dataset-"+record["dataset_id"]
             if dataset not in datasets_files_errors:
                 datasets_files_errors[dataset] = list()
-                n_dataset += 1 
-            
-            datasets_files_errors[dataset].append(file)
-                
+            datasets_files_errors[dataset].append(record["file_name"])
+    else:
+        #rdflib miner executed without the manifest: read its error log file
+        datasets_files_errors = readRDFLibLog(rdflib_error_log_file_path)
+
+    n_dataset = len(datasets_files_errors)
+
     print("Find: "+str(n_dataset)+" datasets with big files, starts mining ...")
 
     print(datasets_files_errors)
 
-    i = 0 
-    for dataset, errors in datasets_files_errors.items():
-        mineDataset(args.datasets_folder, dataset, errors, log, args.resume)
-        i+=1
-        print("Mined: "+str(i)+" datasets over: "+str(n_dataset))
+    if args.resume:
+        #the datasets already mined are skipped with the completion index of the manifest, without reading their metadata
+        completed_datasets = manifest.getCompleted(STAGE)
+        datasets_files_errors = {dataset: errors for dataset, errors in datasets_files_errors.items() 
+                                 if getDatasetId(dataset) not in completed_datasets}
+        n_dataset = len(datasets_files_errors)
+        print("Resume: "+str(n_dataset)+" datasets to be mined")
+
+    tasks = [(args.datasets_folder, dataset, errors, args.resume) for dataset, errors in datasets_files_errors.items()]
+    sizes = [getDatasetSize(args.datasets_folder+"/"+dataset, errors) for dataset, errors in datasets_files_errors.items()]
+
+    progress = iter(range(1, n_dataset + 1))
+
+    def printProgress(task):
+        print("Mined: "+str(next(progress))+" datasets over: "+str(n_dataset))
+
+    failed_tasks = mineParallel(mineDataset, tasks, args.workers, initWorker, (manifest_path, supervision, args.chunk_workers, sampling), args.memory_limit, sizes, printProgress)
+
+    manifest.close()
 
+    #the datasets that raised an error or crashed their worker are in the log file
+    exitOnFailures(failed_tasks)
@@ -0,0 +1,305 @@
+"""
+Exact triple deduplication with a fixed memory budget, used by the lightrdf deduplication miners.
+
+A Python set of triple tuples needs hundreds of bytes for every triple, so the deduplication of a big dataset
+does not fit in memory. The TripleHashSet keeps only a 128-bit hash (blake2b) of every triple:
+* the hashes are stored in a NumPy open-addressing table (linear probing), 16 bytes for every slot
+* when the table is full, its hashes are sorted and spilled to a run on disk, then the table is emptied
+* a triple is new if its hash is neither in the table nor in a run (the runs are memory-mapped and searched
+  with a binary search)
+* every FAN_IN runs of the same level are merged in a run of the next level, so there are at most
+  (FAN_IN - 1) runs of every level: the number of runs grows with the logarithm of the number of spills and
+  every hash is rewritten once for every level
+
+The triples are checked in batches, so the probing and the searches are vectorized. The size of the table is
+given by the memory budget, so a dataset of any size is deduplicated with the same memory (plus the disk
+space of the runs). One bit of the hash is used to mark the empty slots, so two different triples are
+considered equal only if 127 bits of their hashes collide.
+
+The parsed triples of a file are written in a triples file (a JSON array for every line), so the parsing can
+run in another process (e.g. the supervised worker) and the triples are read back in batches.
+"""
+
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+import numpy as np
+
+#number of triples checked together
+BATCH_SIZE = 65536
+
+#maximum fraction of used slots of the table, a fuller table is spilled to disk
+MAX_LOAD = 0.7
+
+#number of runs of the same level that are merged in a run of the next level
+FAN_IN = 4
+
+#number of hashes read from every run in a step of a merge
+MERGE_BLOCK = 1 << 20
+
+"""
+@param: triples, list of triples (tuples of strings)
+@return array with a 128-bit hash (two uint64) for every triple, the hashes are never (0, 0)
+"""
+def hashTriples(triples: list) -> np.ndarray:
+    digests = b"".join(hashlib.blake2b("\n".join(triple).encode("utf-8", "surrogatepass"), digest_size=16).digest()
+                       for triple in triples)
+
+    hashes = np.frombuffer(digests, dtype="<u8").reshape(-1, 2).copy()
+
+    #(0, 0) marks the empty slots of the table
+    hashes[:, 0] |= 1
+
+    return hashes
+
+"""
+@param: triples, iterable of triples (tuples of strings)
+@param: triples_path, path of the triples file
+@return number of triples written
+"""
+def dumpTriples(triples, triples_path: str) -> int:
+    count = 0
+
+    with open(triples_path, "w", encoding="utf-8") as triples_file:
+        for triple in triples:
+            triples_file.write(json.dumps(triple, ensure_ascii=False))
+            triples_file.write("\n")
+            count += 1
+
+    return count
+
+"""
+@param: triples, iterable of triples
+@param: batch_size, number of triples of every batch
+@return generator of lists of triples
+"""
+def batchTriples(triples, batch_size: int = BATCH_SIZE):
+    batch = list()
+
+    for triple in triples:
+        batch.append(triple)
+
+        if len(batch) == batch_size:
+            yield batch
+            batch = list()
+
+    if batch:
+        yield batch
+
+"""
+@param: triples_path, path of a triples file
+@param: batch_size, number of triples of every batch
+@return generator of lists of triples
+"""
+def loadTriples(triples_path: str, batch_size: int = BATCH_SIZE):
+    with open(triples_path, "r", encoding="utf-8") as triples_file:
+        yield from batchTriples((tuple(json.loads(line)) for line in triples_file), batch_size)
+
+
+class TripleHashSet:
+
+    """
+    @param: memory_limit, memory in MB of the hash table
+    @param: spill_directory, directory where the runs are spilled (None for the system temporary directory)
+    """
+    def __init__(self, memory_limit: int = 256, spill_directory: str = None):
+        #the biggest power of two of slots that fits in the memory limit
+        capacity = 1 << max(10, (memory_limit * 1024 ** 2 // 16).bit_length() - 1)
+
+        self.table = np.zeros((capacity, 2), dtype=np.uint64)
+        self.mask = np.uint64(capacity - 1)
+        self.max_size = int(capacity * MAX_LOAD)
+        self.size = 0
+
+        self.directory = tempfile.mkdtemp(prefix="triple_runs_", dir=spill_directory)
+        self.runs = list()
+        self.run_paths = list()
+        #level of every run (a run of level l contains the hashes of about FAN_IN ** l spills)
+        self.levels = list()
+        self.run_number = 0
+
+        #number of distinct triples
+        self.count = 0
+
+    """
+    Sort the hashes of the table, write them in a new run and empty the table
+    """
+    def spill(self):
+        hashes = self.table[self.table[:, 0] != 0]
+        hashes = hashes[np.lexsort((hashes[:, 1], hashes[:, 0]))]
+
+        run_path = self.newRunPath()
+        np.save(run_path, hashes)
+        self.appendRun(run_path, 0)
+
+        self.table[:] = 0
+        self.size = 0
+
+        #the last FAN_IN runs of the same level are merged in a run of the next level
+        while len(self.levels) >= FAN_IN and len(set(self.levels[-FAN_IN:])) == 1:
+            self.mergeRuns(FAN_IN)
+
+    """
+    @return path of a new run in the spill directory
+    """
+    def newRunPath(self) -> str:
+        run_path = os.path.join(self.directory, f"run_{self.run_number}.npy")
+        self.run_number += 1
+        return run_path
+
+    """
+    @param: run_path, path of the run
+    @param: level, level of the run
+    """
+    def appendRun(self, run_path: str, level: int):
+        self.runs.append(np.load(run_path, mmap_mode="r"))
+        self.run_paths.append(run_path)
+        self.levels.append(level)
+
+    """
+    Merge the last runs in a single sorted run of the next level and remove them from the disk. The runs are
+    disjoint (a hash is added to the table only if it is not in a run), so the merged run has the sum of their
+    lengths and it is written in blocks: in every step the hashes up to the smallest last high part of the next
+    block of every run are taken from all the runs, sorted and appended to the merged run
+
+    @param: number, number of runs to merge
+    """
+    def mergeRuns(self, number: int):
+        runs = self.runs[-number:]
+        level = self.levels[-1] + 1
+
+        run_path = self.newRunPath()
+        merged = np.lib.format.open_memmap(run_path, mode="w+", dtype=np.uint64,
+                                           shape=(sum(len(run) for run in runs), 2))
+
+        positions = [0] * len(runs)
+        written = 0
+        while written < len(merged):
+            pivot = min(run[min(position + MERGE_BLOCK, len(run)) - 1, 0]
+                        for run, position in zip(runs, positions) if position < len(run))
+
+            blocks = list()
+            for i, run in enumerate(runs):
+                end = positions[i] + int(np.searchsorted(run[positions[i]:, 0], pivot, side="right"))
+                blocks.append(run[positions[i]:end])
+                positions[i] = end
+
+            block = np.concatenate(blocks)
+            merged[written:written + len(block)] = block[np.lexsort((block[:, 1], block[:, 0]))]
+            written += len(block)
+
+        merged.flush()
+        del merged, runs
+
+        for old_path in self.run_paths[-number:]:
+            os.remove(old_path)
+        del self.runs[-number:], self.run_paths[-number:], self.levels[-number:]
+
+        self.appendRun(run_path, level)
+
+    """
+    @param: run, sorted array of hashes
+    @param: hashes, array of hashes
+    @return boolean array, True for the hashes that are in the run
+    """
+    @staticmethod
+    def inRun(run: np.ndarray, hashes: np.ndarray) -> np.ndarray:
+        run_high = run[:, 0]
+        run_low = run[:, 1]
+        n = len(run)
+
+        positions = np.searchsorted(run_high, hashes[:, 0])
+
+        #the hashes with the same high part are sorted by the low part
+        while True:
+            valid = positions < n
+            clipped = np.minimum(positions, n - 1)
+            advance = valid & (run_high[clipped] == hashes[:, 0]) & (run_low[clipped] < hashes[:, 1])
+            if not advance.any():
+                break
+            positions[advance] += 1
+
+        valid = positions < n
+        clipped = np.minimum(positions, n - 1)
+        return valid & (run_high[clipped] == hashes[:, 0]) & (run_low[clipped] == hashes[:, 1])
+
+    """
+    Add the hashes to the table
+
+    @param: hashes, array of distinct hashes that are not in the runs
+    @return boolean array, True for the hashes that were not in the table
+    """
+    def insert(self, hashes: np.ndarray) -> np.ndarray:
+        new = np.zeros(len(hashes), dtype=bool)
+
+        pending = np.arange(len(hashes))
+        slots = hashes[:, 1] & self.mask
+
+        while len(pending) > 0:
+            entries = self.table[slots]
+            pending_hashes = hashes[pending]
+
+            found = (entries[:, 0] == pending_hashes[:, 0]) & (entries[:, 1] == pending_hashes[:, 1])
+            empty = entries[:, 0] == 0
+
+            #only one of the hashes that probe the same empty slot takes it, the others probe it again
+            empty_indexes = np.flatnonzero(empty)
+            empty_slots, first = np.unique(slots[empty_indexes], return_index=True)
+            winners = empty_indexes[first]
+
+            self.table[empty_slots] = hashes[pending[winners]]
+            new[pending[winners]] = True
+
+            taken = np.zeros(len(pending), dtype=bool)
+            taken[winners] = True
+
+            #the hashes that find a different hash in their slot probe the next slot
+            collision = ~found & ~empty
+            slots[collision] = (slots[collision] + np.uint64(1)) & self.mask
+
+            keep = ~found & ~taken
+            pending = pending[keep]
+            slots = slots[keep]
+
+        self.size += int(new.sum())
+
+        return new
+
+    """
+    @param: triples, list of triples (tuples of strings)
+    @return boolean list, True for the triples that were never added before (only the first occurrence of a
+    triple repeated in the list is True)
+    """
+    def add(self, triples: list) -> list:
+        new = np.zeros(len(triples), dtype=bool)
+
+        for start in range(0, len(triples), self.max_size):
+            hashes = hashTriples(triples[start:start + self.max_size])
+
+            #first occurrence of every hash of the batch
+            _, candidates = np.unique(hashes.view("V16").ravel(), return_index=True)
+            candidates.sort()
+
+            if self.size + len(candidates) > self.max_size:
+                self.spill()
+
+            for run in self.runs:
+                candidates = candidates[~self.inRun(run, hashes[candidates])]
+
+            inserted = self.insert(hashes[candidates])
+            new[start + candidates[inserted]] = True
+
+        self.count += int(new.sum())
+
+        return new.tolist()
+
+    """
+    Remove the runs from the disk
+    """
+    def close(self):
+        self.runs = list()
+        self.run_paths = list()
+        self.levels = list()
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,132 @@
+"""
+Label resolution of the rdflib_labels_extracor.py miner.
+
+The original miner resolved the human readable names with SPARQL queries with an OPTIONAL pattern for every
+label predicate (and, in the labels v2 parsing, a REGEX filter evaluated on every candidate predicate of every
+row). The LabelIndex builds once for every graph a subject -> labels index with the label predicates found in
+the graph and resolves the classes, entities and properties with dictionary lookups.
+
+The produced lists are the same of the SPARQL queries (the order of the items is not relevant):
+* labels v1: the rdfs:label of a term, else its rdfs:description, else the term (entities) or the last part
+  of its URI (classes and properties)
+* labels v2: the literal objects of the predicates with name, description, label or title in their URI, else
+  the term (entities) or the last part of its URI (classes and properties), blank node entities are skipped
+  and every property is resolved once (SELECT DISTINCT)
+
+As in the results of the queries, a term with more labels is repeated for every label and an entity (or a
+class) is repeated for every label of its class (or of the entity).
+"""
+
+import re
+from collections import Counter
+from rdflib import Graph, Literal, BNode, URIRef
+from rdflib.namespace import RDF, RDFS
+
+#predicates of the labels v2 parsing: every predicate with one of these words in its URI
+LABEL_PREDICATE_PATTERN = re.compile("(name|description|label|title)", re.IGNORECASE)
+
+#description predicate of the labels v1 parsing (not defined by the RDFS vocabulary of rdflib)
+RDFS_DESCRIPTION = URIRef("http://www.w3.org/2000/01/rdf-schema#description")
+
+"""
+@param: uri,, string with the uri
+@return last part of the uri, that contains the name
+"""
+def getNameFromUri(uri:str) -> str:
+    split = re.split("[/#]", uri)
+    return split[-1]
+
+
+class LabelIndex:
+
+    """
+    @param: graph, parsed rdflib Graph
+    @param: version, version of the parsing (1: labels v1, 2: labels v2)
+    """
+    def __init__(self, graph: Graph, version: int):
+        self.graph = graph
+        self.version = version
+
+        #number of triples of every predicate, with a single scan of the graph
+        self.predicate_counts = Counter(graph.predicates())
+
+        if version == 1:
+            self.labels = self.indexPredicates([RDFS.label], False)
+            self.descriptions = self.indexPredicates([RDFS_DESCRIPTION], False)
+        else:
+            label_predicates = [p for p in self.predicate_counts if LABEL_PREDICATE_PATTERN.search(str(p))]
+            self.labels = self.indexPredicates(label_predicates, True)
+            self.descriptions = dict()
+
+    """
+    @param: predicates, label predicates
+    @param: literals_only, True if only the literal objects are labels
+    @return dictionary subject -> list of labels of the subject (a label is repeated for every predicate)
+    """
+    def indexPredicates(self, predicates: list, literals_only: bool) -> dict:
+        index = dict()
+
+        for predicate in predicates:
+            for s, o in self.graph.subject_objects(predicate):
+                if literals_only and not isinstance(o, Literal):
+                    continue
+
+                if s not in index:
+                    index[s] = list()
+                index[s].append(o)
+
+        return index
+
+    """
+    @param: term, term to be resolved
+    @param: default, name used if the term has no labels
+    @return list with the names of the term, one for every result row of the original queries
+    """
+    def resolve(self, term, default) -> list:
+        labels = self.labels.get(term)
+        descriptions = self.descriptions.get(term)
+
+        if labels:
+            #every label is combined with every description (or with no description)
+            return labels * (len(descriptions) if descriptions else 1)
+        if descriptions:
+            return list(descriptions)
+        return [default]
+
+    """
+    @return classes and entities lists
+    """
+    def getClassesAndEntities(self) -> tuple:
+        classes = list()
+        entities = list()
+
+        for s, c in self.graph.subject_objects(RDF.type):
+            if self.version == 2 and isinstance(s, BNode):
+                continue
+
+            entity_names = self.resolve(s, s)
+            class_names = self.resolve(c, getNameFromUri(c))
+
+            #a result row for every combination of the names of the entity and of the class
+            entities.extend(entity_names * len(class_names))
+            classes.extend(class_names * len(entity_names))
+
+        return classes, entities
+
+    """
+    @return properties list
+    """
+    def getProperties(self) -> list:
+        properties = list()
+
+        for p, count in self.predicate_counts.items():
+            names = self.resolve(p, getNameFromUri(p))
+
+            if self.version == 2:
+                #a row for every distinct (property, label) pair
+                properties.extend(dict.fromkeys(names))
+            else:
+                #a row for every triple of the property
+                properties.extend(names * count)
+
+        return properties
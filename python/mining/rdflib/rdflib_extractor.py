@@ -2,120 +2,124 @@
 This script extracts the ACORDAR baseline needed data from all the datasets files 
 with valid RDF suffixes that are not mined from JENA. The file to be parsed must have a 
 limit size of 100MB due to the big RAM usage of RDFLib and for the RAM limitations of my computing system.
+The RDF/XML files bigger than the limit are parsed in streaming (stream_parser.py), without building the
+Graph, so they are mined completely. The N-Triples and N-Quads files of any size are scanned line by line
+(common/ntriples_scanner.py), without the rdflib parser.
 """
 
 import pathlib
 import rdflib
 from rdflib import Graph
-from rdflib.namespace import RDF
 import json
 import os
 import logging
 import argparse
+import sys
+import time
+
+#the common modules are shared by all the phases
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../.."))
+from common.manifest import Manifest, getDefaultManifestPath, getDatasetId, STATUS_MINED, STATUS_FAILED, ERROR_FILE_TOO_BIG, STATUS_COMPLETED
+from common.extraction_cache import ExtractionCache, getDefaultCachePath
+from triple_scanner import TripleScanner
+from stream_parser import streamFile, isStreamable
+from common.ntriples_scanner import isLineBased
+from common.parallel_miner import mineParallel, getDatasetSize, exitOnFailures
+from common.metadata_store import getMetadataValue, appendRecord
+from common.file_supervisor import runFile, configureSupervisor
+from common.term_dictionary import DatasetContent
+
+#stage name of the miner in the crawl manifest
+STAGE = "rdflib"
+
+#version of the extraction results stored in the extraction cache, it must be increased when the extraction
+#changes so the results of the previous versions are not reused
+EXTRACTOR_VERSION = 2
+
+#stage of the extraction cache
+CACHE_STAGE = f"{STAGE}-v{EXTRACTOR_VERSION}"
 
 RDF_SUFFIXES = [".rdf", ".rdfs", ".ttl", ".owl", ".n3", ".nt", ".jsonld", ".xml", ".ntriples", ".nq", ".trig", ".trix"]
 
 FILE_LIMIT_SIZE = 100
 
 
-def getLiterals(graph) -> list:
-    q = """
-    SELECT ?literal { 
-        ?s ?p ?literal 
-        FILTER isLiteral(?literal)
-    }
-    """
-    match = graph.query(q)
-
-    literals = list()
-
-    for item in match:
-        literals.append(str(item[0]))
-
-    return literals
-
-
-def getClassesAndEntities(graph) -> dict:
-    q = """
-    SELECT ?class ?s
-    WHERE {
-        ?s a ?class .
-    }
-    """
-    match = graph.query(q)
-
-    classes = list()
-    entities = list()
-
-    for item in match:
-        classes.append(item[0])
-        entities.append(item[1])
-
-    return classes, entities
-    
-
-def getProperties(graph) -> list:
-    q = """
-    SELECT ?p
-    WHERE {
-        ?s ?p ?o .
-    }
-    """
-    match = graph.query(q)
+'''
+@param file_path path to the file that must be mined
+@param small_file True if the file can be loaded in a Graph, False if it must be parsed in streaming
+@return dictionary with the classes, entities, literals and properties of the file
+'''
+def extractFile(file_path:str, small_file:bool) -> dict:
+    scanner = TripleScanner()
 
-    properties = list()
+    if isLineBased(file_path):
+        #the N-Triples and N-Quads files are scanned without building the rdflib terms (the triples
+        #repeated in a small file are extracted once, as in the Graph)
+        scanner.scanLines(file_path, deduplicate=small_file)
+    elif small_file:
+        g = Graph()
+        g.parse(file_path)
 
-    for item in match:
-        properties.append(item[0])
+        #extract all the info with a single scan of the graph
+        scanner.scan(g)
+    else:
+        #too big for the Graph: the triples are extracted while they are parsed
+        streamFile(file_path, scanner)
 
-    return properties
+    return scanner.getResult()
 
 '''
 @param dataset_path path to the dataset folder
 @param dataset name of the dataset
 @param file name of the file that must be mined
-@param dataset_content dictionary with the dataset content already mined
+@param dataset_content content of the dataset already mined
 @param f_log miner error log file
 @return True if the file is mined, else False
 '''
-def mineFile(dataset_path:str, dataset:str, file:str, dataset_content:dict) -> bool: 
-    g = Graph()
-
+def mineFile(dataset_path:str, dataset:str, file:str, dataset_content:DatasetContent) -> bool: 
     file_path = dataset_path+"/"+file
+    file_size = os.path.getsize(file_path)
 
-    if (os.path.getsize(file_path) / (1024 ** 2)) < FILE_LIMIT_SIZE: 
-        try: 
-            g.parse(file_path)
+    started_at = time.time()
 
-            #extract all the info
+    small_file = (file_size / (1024 ** 2)) < FILE_LIMIT_SIZE
 
-            classes, entities = getClassesAndEntities(g)
-            literals = getLiterals(g)
-            properties = getProperties(g)
+    if small_file or isLineBased(file_path) or isStreamable(file_path): 
+        try: 
+            #the same bytes may have already been mined (in this or in another dataset), the hash recorded
+            #by the downloader is used (None if the content of the file cannot be shared)
+            digest = extraction_cache.findDigest(file_path, manifest.getFileDigest(dataset, file))
+            result = extraction_cache.get(digest) if digest is not None else None
 
-            dataset_content["classes"].extend(classes)
-            dataset_content["entities"].extend(entities)
-            dataset_content["literals"].extend(literals)
-            dataset_content["properties"].extend(properties)
+            if result is None:
+                #the file is parsed in the supervised worker if the supervision is enabled
+                result = runFile(extractFile, file_path, small_file)
+                if digest is not None:
+                    extraction_cache.put(digest, result)
 
-            #free memory
-            del(g)
-            del(classes)
-            del(entities)
-            del(literals)
-            del(properties)
+            dataset_content.update(result)
+
+            del(result)
 
         except rdflib.exceptions.ParserError as e:  
             error = str(e).strip("\n")
             log.warning(f"Dataset: {dataset}\nFile: {file}\nError: {error}\n")
+            manifest.record(STAGE, dataset, STATUS_FAILED, file_name=file, size=file_size, started_at=started_at,
+                            finished_at=time.time(), error_class="ParserError", detail=error)
             return False
         except Exception as e :
             error = str(e).strip("\n")
             log.warning(f"Dataset: {dataset}\nFile: {file}\nError: {error}\n")
+            manifest.record(STAGE, dataset, STATUS_FAILED, file_name=file, size=file_size, started_at=started_at,
+                            finished_at=time.time(), error_class=type(e).__name__, detail=error)
             return False
     else :
         log.warning(f"Dataset: {dataset}\nFile: {file}\nError: Bigger than {str(FILE_LIMIT_SIZE)}\n")
+        manifest.record(STAGE, dataset, STATUS_FAILED, file_name=file, size=file_size, started_at=started_at,
+                        finished_at=time.time(), error_class=ERROR_FILE_TOO_BIG, detail=f"Bigger than {str(FILE_LIMIT_SIZE)}")
         return False
+
+    manifest.record(STAGE, dataset, STATUS_MINED, file_name=file, size=file_size, started_at=started_at, finished_at=time.time())
     
     return True
 
@@ -125,29 +129,22 @@ def mineFile(dataset_path:str, dataset:str, file:str, dataset_content:dict) -> b
 @param errors list of problem files for jena in the dataset
 @param f_log error log file
 @param resume boolean used for resume mechanism
+@param output_format layout of the dataset content file ("json", "terms", "jsonl" or "jsonl.gz")
 '''
-def mineDataset(datasets_directory_path:str, dataset:str, errors:list, resume:bool):
+def mineDataset(datasets_directory_path:str, dataset:str, errors:list, resume:bool, output_format:str = "json"):
 
     print("Mining")
 
     dataset_path = datasets_directory_path+"/"+dataset 
 
-    #open the dataset metadata file
-    dataset_metadata_file = open(dataset_path+"/dataset_metadata.json", "r", encoding="utf-8")
-    dataset_metadata = json.load(dataset_metadata_file, strict = False)
-    dataset_metadata_file.close()
-
-    #checking for the resume mechanism
-    if "mined_rdflib" in dataset_metadata.keys():
-        if dataset_metadata["mined_rdflib"] and resume:
-            return 
-
-    dataset_content = dict()
+    #checking for the resume mechanism (the datasets in the completion index of the manifest are
+    #not even scheduled, the metadata key is read for the datasets mined before the index)
+    if resume and getMetadataValue(dataset_path, "mined_rdflib", False):
+        manifest.record(STAGE, dataset, STATUS_COMPLETED, finished_at=time.time())
+        return
 
-    dataset_content["classes"] = list()
-    dataset_content["entities"] = list()
-    dataset_content["literals"] = list()
-    dataset_content["properties"] = list()
+    #every distinct term is stored once, the fields keep the ids of the terms
+    dataset_content = DatasetContent()
 
     #print("Mining dataset: "+folder.name)
 
@@ -158,29 +155,56 @@ def mineDataset(datasets_directory_path:str, dataset:str, errors:list, resume:bo
         if mineFile(dataset_path, dataset, file, dataset_content):
             mined_files.append(file) 
 
-    json_serial = json.dumps(dataset_content, indent=4, ensure_ascii=False)
+    #writing the file of the content
+    dataset_content.write(dataset_path+"/dataset_content_rdflib", output_format)
 
-    #writing the json file of the content
-    with open(dataset_path+"/dataset_content_rdflib.json", "w", encoding="utf-8") as dataset_content_file:
-        dataset_content_file.write(json_serial)
+    #update the dataset metadata with the mining information (append-only record, the metadata file is not rewritten)
+    appendRecord(dataset_path, {"mined_rdflib": True, "mined_files_rdflib": mined_files})
 
-    dataset_content_file.close()
-    del json_serial
-    del dataset_content
+    #stage completion index used by the resume mechanism
+    manifest.record(STAGE, dataset, STATUS_COMPLETED, files=len(mined_files), finished_at=time.time())
 
-    #update the dataset_metadata json file with the mining information
-    dataset_metadata["mined_rdflib"] = True
-    dataset_metadata["mined_files_rdflib"] = mined_files
+    #the term frequencies of the dataset are added to the global term index (if it is built) after the dataset is
+    #recorded as completed: an error of the index (e.g. a lock timeout) is logged and the dataset is not mined again
+    if term_index is not None:
+        try:
+            term_index.addDataset(STAGE, dataset, dataset_content)
+        except Exception as e:
+            log.warning(f"Dataset: {dataset}\nTerm index error: {e}\n")
 
-    json_serial = json.dumps(dataset_metadata, indent=4, ensure_ascii=False)
+'''
+Opening of the global term frequency index, that is built only on request (the index module and numpy are
+imported only when the index is built)
 
-    #writing the json file of the content
-    with open(dataset_path+"/dataset_metadata.json", "w", encoding="utf-8") as dataset_metadata_file:
-        dataset_metadata_file.write(json_serial)
-    
-    dataset_metadata_file.close()
-    del json_serial
-    del dataset_metadata
+@param: term_index_path, path to the global term frequency index, None if the index is not built
+@return the term index, None if the index is not built
+'''
+def openTermIndex(term_index_path:str):
+    if term_index_path is None:
+        return None
+
+    from common.term_index import TermIndex
+    return TermIndex(term_index_path)
+
+'''
+Initialization of the worker processes of the parallel mining
+
+@param manifest_path path to the crawl manifest
+@param term_index_path path to the global term frequency index (None if the index is not built)
+@param cache_path path to the extraction cache directory
+@param: supervision, settings of the file supervision (timeout, memory limit, recycle after)
+'''
+def initWorker(manifest_path:str, term_index_path:str, cache_path:str, supervision:tuple):
+    global log, manifest, term_index, extraction_cache
+
+    logging.getLogger("rdflib").setLevel(logging.ERROR)
+    log = logging.getLogger("rdflib_miner")
+
+    manifest = Manifest(manifest_path)
+    term_index = openTermIndex(term_index_path)
+    extraction_cache = ExtractionCache(cache_path, CACHE_STAGE, manifest.getSharedContents())
+
+    configureSupervisor(*supervision)
 
 
 if __name__ == "__main__":
@@ -198,6 +222,55 @@ if __name__ == "__main__":
         action="store_true",
 		help="Add if you want to resume the parsing process"
     )
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        help="Path to the crawl manifest (default: acordar_manifest.sqlite next to the datasets folder)",
+    )
+    parser.add_argument(
+        "--term-index",
+        type=str,
+        help="Path to the global term frequency index where the term counts of every mined dataset are added (default: no index, the dataset content files can be indexed later with the build command of term_index.py)",
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        help="Path to the extraction cache directory (default: acordar_extraction_cache next to the datasets folder)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes that mine the datasets in parallel (default 1)",
+    )
+    parser.add_argument(
+        "--memory-limit",
+        type=int,
+        help="Maximum memory in MB of every mining process (default: no limit)",
+    )
+    parser.add_argument(
+        "--file-timeout",
+        type=float,
+        help="Maximum time in seconds for the parsing of a file, every file is parsed in a supervised process (default: no limit)",
+    )
+    parser.add_argument(
+        "--file-memory-limit",
+        type=int,
+        help="Maximum RSS in MB of the process that parses a file, every file is parsed in a supervised process (default: no limit)",
+    )
+    parser.add_argument(
+        "--recycle-after",
+        type=int,
+        default=100,
+        help="Number of files after which the supervised parsing process is restarted (default 100)",
+    )
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        choices=["json", "terms", "jsonl", "jsonl.gz"],
+        default="json",
+        help="Layout of the dataset content file: \"json\" (lists of strings), \"terms\" (term dictionary with the term counts, dataset_content_*.terms.json) or \"jsonl\" / \"jsonl.gz\" (a line for every term, dataset_content_*.jsonl[.gz])",
+    )
     args = parser.parse_args()
 
     #path to the error log file of the jena miner
@@ -213,6 +286,23 @@ if __name__ == "__main__":
     )
     log = logging.getLogger("rdflib_miner")
 
+    #supervision of the parsing of every file
+    supervision = (args.file_timeout, args.file_memory_limit, args.recycle_after)
+    configureSupervisor(*supervision)
+
+    manifest_path = args.manifest or getDefaultManifestPath(args.datasets_folder)
+    term_index_path = args.term_index
+    cache_path = args.cache or getDefaultCachePath(args.datasets_folder)
+
+    global manifest
+    manifest = Manifest(manifest_path)
+
+    global term_index
+    term_index = openTermIndex(term_index_path)
+
+    global extraction_cache
+    extraction_cache = ExtractionCache(cache_path, CACHE_STAGE, manifest.getSharedContents())
+
     #open the error log file of the jena miner
     f_log_jena=open(jena_error_log_file_path, "r")
 
@@ -241,14 +331,28 @@ if __name__ == "__main__":
                 
     print("Find: "+str(n_dataset)+" datasets with errors, starts mining ...")
 
-    i = 0 
-    for dataset, errors in datasets_files_errors.items():
-        mineDataset(args.datasets_folder, dataset, errors, args.resume)
-        i+=1
-        print("Mined: "+str(i)+" datasets over: "+str(n_dataset))
+    if args.resume:
+        #the datasets already mined are skipped with the completion index of the manifest, without reading their metadata
+        completed_datasets = manifest.getCompleted(STAGE)
+        datasets_files_errors = {dataset: errors for dataset, errors in datasets_files_errors.items() 
+                                 if getDatasetId(dataset) not in completed_datasets}
+        n_dataset = len(datasets_files_errors)
+        print("Resume: "+str(n_dataset)+" datasets to be mined")
 
+    tasks = [(args.datasets_folder, dataset, errors, args.resume, args.output_format) for dataset, errors in datasets_files_errors.items()]
+    sizes = [getDatasetSize(args.datasets_folder+"/"+dataset, errors) for dataset, errors in datasets_files_errors.items()]
 
+    progress = iter(range(1, n_dataset + 1))
 
+    def printProgress(task):
+        print("Mined: "+str(next(progress))+" datasets over: "+str(n_dataset))
 
+    failed_tasks = mineParallel(mineDataset, tasks, args.workers, initWorker, (manifest_path, term_index_path, cache_path, supervision), args.memory_limit, sizes, printProgress)
 
-    
+    manifest.close()
+    if term_index is not None:
+        term_index.close()
+    extraction_cache.close()
+
+    #the datasets that raised an error or crashed their worker are in the log file
+    exitOnFailures(failed_tasks)
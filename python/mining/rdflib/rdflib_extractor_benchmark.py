@@ -0,0 +1,181 @@
+"""
+This script compares the extraction engines of the rdflib_extractor.py miner on the same parsed graphs:
+* the original engine, with three SPARQL queries (classes and entities, literals, properties)
+* the single pass TripleScanner
+
+For every file it checks that the two engines produce the same lists (the order of the items is not
+relevant for the dataset content) and it prints the extraction times and the speedup.
+If no file is given, a synthetic N-Triples file that mimics an ACORDAR dataset file is generated.
+
+python3 rdflib_extractor_benchmark.py path_to_file1.ttl path_to_file2.rdf ...
+python3 rdflib_extractor_benchmark.py --triples 200000
+"""
+
+import os
+import time
+import random
+import argparse
+import tempfile
+from collections import Counter
+from rdflib import Graph
+
+from triple_scanner import TripleScanner
+
+
+def getLiterals(graph) -> list:
+    q = """
+    SELECT ?literal {
+        ?s ?p ?literal
+        FILTER isLiteral(?literal)
+    }
+    """
+    match = graph.query(q)
+
+    literals = list()
+
+    for item in match:
+        literals.append(str(item[0]))
+
+    return literals
+
+
+def getClassesAndEntities(graph) -> dict:
+    q = """
+    SELECT ?class ?s
+    WHERE {
+        ?s a ?class .
+    }
+    """
+    match = graph.query(q)
+
+    classes = list()
+    entities = list()
+
+    for item in match:
+        classes.append(item[0])
+        entities.append(item[1])
+
+    return classes, entities
+
+
+def getProperties(graph) -> list:
+    q = """
+    SELECT ?p
+    WHERE {
+        ?s ?p ?o .
+    }
+    """
+    match = graph.query(q)
+
+    properties = list()
+
+    for item in match:
+        properties.append(item[0])
+
+    return properties
+
+"""
+@param: graph, parsed rdflib Graph
+@return extraction result of the original SPARQL engine
+"""
+def sparqlExtraction(graph: Graph) -> dict:
+    classes, entities = getClassesAndEntities(graph)
+
+    return {
+        "classes": classes,
+        "entities": entities,
+        "literals": getLiterals(graph),
+        "properties": getProperties(graph)
+    }
+
+"""
+@param: graph, parsed rdflib Graph
+@return extraction result of the single pass scanner
+"""
+def scannerExtraction(graph: Graph) -> dict:
+    scanner = TripleScanner()
+    scanner.scan(graph)
+    return scanner.getResult()
+
+"""
+Generate a N-Triples file with typed entities, labels, descriptions and links between the entities
+
+@param: file_path, path of the generated file
+@param: n_triples, number of triples of the file
+"""
+def generateFile(file_path: str, n_triples: int):
+    random.seed(0)
+
+    n_classes = 50
+    n_properties = 200
+
+    with open(file_path, "w", encoding="utf-8") as file:
+        i = 0
+        entity = 0
+        while i < n_triples:
+            subject = f"<http://example.org/resource/{entity}>"
+
+            file.write(f"{subject} <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <http://example.org/ontology/Class{random.randrange(n_classes)}> .\n")
+            file.write(f'{subject} <http://www.w3.org/2000/01/rdf-schema#label> "Resource {entity}"@en .\n')
+            file.write(f"{subject} <http://example.org/ontology/p{random.randrange(n_properties)}> <http://example.org/resource/{random.randrange(entity + 1)}> .\n")
+            file.write(f'{subject} <http://example.org/ontology/p{random.randrange(n_properties)}> "{random.random()}"^^<http://www.w3.org/2001/XMLSchema#double> .\n')
+
+            i += 4
+            entity += 1
+
+"""
+@param: result, extraction result
+@return the extraction result with the lists converted to multisets of strings
+"""
+def normalize(result: dict) -> dict:
+    return {key: Counter(str(item) for item in items) for key, items in result.items()}
+
+"""
+@param: file_path, path to the RDF file
+"""
+def benchmarkFile(file_path: str):
+    graph = Graph()
+    start = time.perf_counter()
+    graph.parse(file_path)
+    parse_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sparql_result = sparqlExtraction(graph)
+    sparql_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    scanner_result = scannerExtraction(graph)
+    scanner_time = time.perf_counter() - start
+
+    same = normalize(sparql_result) == normalize(scanner_result)
+
+    print(f"{os.path.basename(file_path)}: {len(graph)} triples, parse {parse_time:.2f} s")
+    print(f"    SPARQL queries: {sparql_time:.2f} s")
+    print(f"    TripleScanner:  {scanner_time:.2f} s ({sparql_time / scanner_time:.1f}x), same lists: {same}")
+
+
+if __name__ == "__main__":
+    # read the command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "files",
+        type=str,
+        nargs="*",
+        help="Paths to the RDF files used for the benchmark (default: a synthetic N-Triples file)",
+    )
+    parser.add_argument(
+        "--triples",
+        type=int,
+        default=200000,
+        help="Number of triples of the synthetic file (default 200000)",
+    )
+    args = parser.parse_args()
+
+    if args.files:
+        for file_path in args.files:
+            benchmarkFile(file_path)
+    else:
+        with tempfile.TemporaryDirectory(prefix="rdflib_benchmark_") as directory:
+            file_path = os.path.join(directory, "synthetic.nt")
+            generateFile(file_path, args.triples)
+            benchmarkFile(file_path)
@@ -0,0 +1,304 @@
+"""
+This script compares the label resolution engines of the rdflib_labels_extracor.py miner on the same parsed graphs:
+* the original engine, with the SPARQL queries with an OPTIONAL pattern for every label predicate
+* the LabelIndex, that indexes the labels of the graph once and resolves the terms with lookups
+
+For every file and for both the versions of the parsing it checks that the two engines produce the same lists 
+(the order of the items is not relevant for the dataset content) and it prints the extraction times and the speedup.
+If no file is given, a synthetic N-Triples file that mimics an ACORDAR dataset file is generated, with labels,
+descriptions and titles also for the classes and the properties.
+
+python3 rdflib_labels_benchmark.py path_to_file1.ttl path_to_file2.rdf ...
+python3 rdflib_labels_benchmark.py --triples 50000 --version 2
+"""
+
+import os
+import time
+import argparse
+import tempfile
+from rdflib import Graph, Literal
+
+from label_index import LabelIndex, getNameFromUri
+from rdflib_extractor_benchmark import generateFile, normalize
+
+
+def getLiterals(graph) -> list:
+    q = """
+    SELECT ?literal { 
+        ?s ?p ?literal 
+        FILTER isLiteral(?literal)
+    }
+    """
+    match = graph.query(q)
+
+    literals = list()
+
+    for item in match:
+        literals.append(str(item[0]))
+
+    return literals
+
+def getClassesAndEntitiesv2(graph) -> dict:
+    q = """
+    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+    SELECT ?s ?hds ?c ?hdc
+    WHERE {
+        ?s a ?c .
+
+        FILTER(!isBlank(?s)) .
+        
+        OPTIONAL { 
+            ?s ?p ?hds .
+            FILTER isLiteral(?hds) .
+            FILTER(REGEX(str(?p), "(name|description|label|title)", "i"))
+        }
+        
+        OPTIONAL {
+            ?c ?pc ?hdc .
+            FILTER isLiteral(?hdc) .
+            FILTER(REGEX(str(?pc), "(name|description|label|title)", "i"))
+        }
+    }
+    """
+    match = graph.query(q)
+
+    classes = list()
+    entities = list()
+
+    #check the availability of labels and descriptions
+    for item in match:
+        if item[1] is not None:
+            entities.append(item[1])
+        else: 
+            entities.append(item[0])
+
+    
+        if item[3] is not None:
+            classes.append(item[3])
+        else:
+            classes.append(getNameFromUri(item[2]))
+        
+    return classes, entities    
+
+def getPropertiesv2(graph) -> list:
+    q = """
+    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+    SELECT DISTINCT ?p ?hdp  
+    WHERE { 
+        ?s ?p ?o .
+        
+        OPTIONAL {
+            ?p ?lp ?hdp .
+            FILTER isLiteral(?hdp) .
+            FILTER(REGEX(str(?lp), "(name|description|label|title)", "i"))
+        }
+            
+    }
+    """
+    match = graph.query(q)
+
+    properties = list()
+
+    #check the availability of labels and descriptions
+    for item in match:
+        if item[1] is not None:
+            properties.append(item[1])
+        else:
+            properties.append(getNameFromUri(item[0]))
+
+    return properties
+
+def getClassesAndEntitiesv1(graph) -> dict:
+    q = """
+    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+    SELECT ?s ?ls ?ds ?c ?lc ?dc
+    WHERE {
+        ?s a ?c
+        
+        #retrieve a possible label or description
+        #for the class or the entity
+        OPTIONAL{
+            ?c rdfs:label ?lc 
+        }
+        OPTIONAL{
+            ?c rdfs:description ?dc
+        }
+        
+        OPTIONAL{
+            ?s rdfs:label ?ls . 
+        }
+        OPTIONAL{
+            ?s rdfs:description ?ds
+        }
+    }
+    """
+    match = graph.query(q)
+
+    classes = list()
+    entities = list()
+
+    for item in match:
+        if item[1] is not None:
+            entities.append(item[1])
+        elif item[2] is not None:
+            entities.append(item[2])
+        else:
+            entities.append(item[0])
+
+
+        if item[4] is not None:
+            classes.append(item[4])
+        elif item[5] is not None:
+            classes.append(item[5])
+        else:
+            classes.append(getNameFromUri(item[3]))
+
+
+    return classes, entities    
+
+def getPropertiesv1(graph) -> list:
+    q = """
+    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+    SELECT ?p ?l ?d  
+    WHERE { 
+        ?s ?p ?o .
+        OPTIONAL {
+            ?p rdfs:label ?l
+        }
+        OPTIONAL {
+            ?p rdfs:description ?d
+        }
+    }
+    """
+    match = graph.query(q)
+
+    properties = list()
+
+    for item in match:
+        if item[1] is not None:
+            properties.append(item[1])
+        elif item[2] is not None:
+            properties.append(item[2])
+        else:
+            properties.append(getNameFromUri(item[0]))
+
+    return properties
+
+"""
+@param: graph, parsed rdflib Graph
+@param: version, version of the parsing (1: labels v1, 2: labels v2)
+@return extraction result of the original SPARQL engine
+"""
+def sparqlExtraction(graph: Graph, version: int) -> dict:
+    if version == 1:
+        classes, entities = getClassesAndEntitiesv1(graph)
+        properties = getPropertiesv1(graph)
+    else:
+        classes, entities = getClassesAndEntitiesv2(graph)
+        properties = getPropertiesv2(graph)
+
+    return {
+        "classes": classes,
+        "entities": entities,
+        "literals": getLiterals(graph),
+        "properties": properties
+    }
+
+"""
+@param: graph, parsed rdflib Graph
+@param: version, version of the parsing (1: labels v1, 2: labels v2)
+@return extraction result of the label index
+"""
+def indexExtraction(graph: Graph, version: int) -> dict:
+    label_index = LabelIndex(graph, version)
+    classes, entities = label_index.getClassesAndEntities()
+
+    return {
+        "classes": classes,
+        "entities": entities,
+        "literals": [str(o) for o in graph.objects() if isinstance(o, Literal)],
+        "properties": label_index.getProperties()
+    }
+
+"""
+Add to a N-Triples file the labels, descriptions and titles of its classes and properties
+
+@param: file_path, path of the generated file
+"""
+def addVocabularyLabels(file_path: str):
+    with open(file_path, "a", encoding="utf-8") as file:
+        for i in range(50):
+            term = f"<http://example.org/ontology/Class{i}>"
+            file.write(f'{term} <http://www.w3.org/2000/01/rdf-schema#label> "Class {i}"@en .\n')
+            if i % 2 == 0:
+                file.write(f'{term} <http://www.w3.org/2000/01/rdf-schema#label> "Classe {i}"@it .\n')
+            if i % 3 == 0:
+                file.write(f'{term} <http://www.w3.org/2000/01/rdf-schema#description> "Description of the class {i}" .\n')
+
+        for i in range(0, 200, 2):
+            term = f"<http://example.org/ontology/p{i}>"
+            file.write(f'{term} <http://purl.org/dc/terms/title> "Property {i}" .\n')
+            if i % 4 == 0:
+                file.write(f'{term} <http://www.w3.org/2000/01/rdf-schema#description> "Description of the property {i}" .\n')
+
+"""
+@param: file_path, path to the RDF file
+@param: versions, versions of the parsing to be compared
+"""
+def benchmarkFile(file_path: str, versions: list):
+    graph = Graph()
+    start = time.perf_counter()
+    graph.parse(file_path)
+    parse_time = time.perf_counter() - start
+
+    print(f"{os.path.basename(file_path)}: {len(graph)} triples, parse {parse_time:.2f} s")
+
+    for version in versions:
+        start = time.perf_counter()
+        sparql_result = sparqlExtraction(graph, version)
+        sparql_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index_result = indexExtraction(graph, version)
+        index_time = time.perf_counter() - start
+
+        same = normalize(sparql_result) == normalize(index_result)
+
+        print(f"    v{version} SPARQL queries: {sparql_time:.2f} s")
+        print(f"    v{version} LabelIndex:     {index_time:.2f} s ({sparql_time / index_time:.1f}x), same lists: {same}")
+
+
+if __name__ == "__main__":
+    # read the command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "files",
+        type=str,
+        nargs="*",
+        help="Paths to the RDF files used for the benchmark (default: a synthetic N-Triples file)",
+    )
+    parser.add_argument(
+        "--triples",
+        type=int,
+        default=50000,
+        help="Number of triples of the synthetic file (default 50000)",
+    )
+    parser.add_argument(
+        "--version",
+        type=int,
+        choices=[1, 2],
+        help="Version of the parsing to be compared (default: both)",
+    )
+    args = parser.parse_args()
+
+    versions = [args.version] if args.version is not None else [1, 2]
+
+    if args.files:
+        for file_path in args.files:
+            benchmarkFile(file_path, versions)
+    else:
+        with tempfile.TemporaryDirectory(prefix="rdflib_labels_benchmark_") as directory:
+            file_path = os.path.join(directory, "synthetic.nt")
+            generateFile(file_path, args.triples)
+            addVocabularyLabels(file_path)
+            benchmarkFile(file_path, versions)
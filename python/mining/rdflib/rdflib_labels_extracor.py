@@ -6,272 +6,136 @@ by using the rdfs:label, rdfs:comment properties and other related properties
 
 import pathlib
 import rdflib
-from rdflib import Graph
-from rdflib.namespace import RDF
+from rdflib import Graph, Literal
 import json
 import os
 import logging
 import re 
 import argparse
 import logging
+import sys
+import time
 from tqdm import tqdm
 
+#the common modules are shared by all the phases
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../.."))
+from common.manifest import Manifest, getDefaultManifestPath, getDatasetId, STATUS_MINED, STATUS_FAILED, ERROR_FILE_TOO_BIG, STATUS_COMPLETED
+from common.extraction_cache import ExtractionCache, getDefaultCachePath
+from common.parallel_miner import mineParallel, getDatasetSize, exitOnFailures
+from common.metadata_store import getMetadataValue, appendRecord
+from common.file_supervisor import runFile, configureSupervisor
+from common.term_dictionary import DatasetContent
+from label_index import LabelIndex
+
+#stage name of the miner in the crawl manifest
+STAGE = "rdflibhr"
+
+#version of the extraction results stored in the extraction cache, it must be increased when the extraction
+#changes so the results of the previous versions are not reused
+EXTRACTOR_VERSION = 2
+
 
 RDF_SUFFIXES = [".rdf", ".rdfs", ".ttl", ".owl", ".n3", ".nt", ".jsonld", ".xml", ".ntriples", ".nq", ".trig", ".trix"]
 
 #limit size of 100MB for parsing a file with RDFLib
 FILE_LIMIT_SIZE = 100
 
-"""
-@param: uri,, string with the uri
-@return last part of the uri, that contains the name
-"""
-def getNameFromUri(uri:str) -> str:
-    split = re.split("[/#]", uri)
-    return split[-1]
-
-def getLiterals(graph) -> list:
-    q = """
-    SELECT ?literal { 
-        ?s ?p ?literal 
-        FILTER isLiteral(?literal)
-    }
-    """
-    match = graph.query(q)
+'''
+@param: file_path, path to the file that must be mined
+@param: version, version of the parsing (1: labels v1, 2: labels v2)
+@return dictionary with the classes, entities, literals and properties of the file
+'''
+def extractFile(file_path:str, version:int) -> dict:
+    g = Graph()
+    g.parse(file_path)
 
-    literals = list()
+    #extract all the info: the labels of the graph are indexed once and resolved with lookups
 
-    for item in match:
-        literals.append(str(item[0]))
+    label_index = LabelIndex(g, version)
 
-    return literals
+    classes, entities = label_index.getClassesAndEntities()
+    properties = label_index.getProperties()
 
-def getClassesAndEntitiesv2(graph) -> dict:
-    q = """
-    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-    SELECT ?s ?hds ?c ?hdc
-    WHERE {
-        ?s a ?c .
+    literals = [str(o) for o in g.objects() if isinstance(o, Literal)]
 
-        FILTER(!isBlank(?s)) .
-        
-        OPTIONAL { 
-            ?s ?p ?hds .
-            FILTER isLiteral(?hds) .
-            FILTER(REGEX(str(?p), "(name|description|label|title)", "i"))
-        }
-        
-        OPTIONAL {
-            ?c ?pc ?hdc .
-            FILTER isLiteral(?hdc) .
-            FILTER(REGEX(str(?pc), "(name|description|label|title)", "i"))
-        }
+    return {
+        "classes": classes,
+        "entities": entities,
+        "literals": literals,
+        "properties": properties
     }
-    """
-    match = graph.query(q)
-
-    classes = list()
-    entities = list()
-
-    #check the availability of labels and descriptions
-    for item in match:
-        if item[1] is not None:
-            entities.append(item[1])
-        else: 
-            entities.append(item[0])
-
-    
-        if item[3] is not None:
-            classes.append(item[3])
-        else:
-            classes.append(getNameFromUri(item[2]))
-        
-    return classes, entities    
-
-def getPropertiesv2(graph) -> list:
-    q = """
-    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-    SELECT DISTINCT ?p ?hdp  
-    WHERE { 
-        ?s ?p ?o .
-        
-        OPTIONAL {
-            ?p ?lp ?hdp .
-            FILTER isLiteral(?hdp) .
-            FILTER(REGEX(str(?lp), "(name|description|label|title)", "i"))
-        }
-            
-    }
-    """
-    match = graph.query(q)
-
-    properties = list()
-
-    #check the availability of labels and descriptions
-    for item in match:
-        if item[1] is not None:
-            properties.append(item[1])
-        else:
-            properties.append(getNameFromUri(item[0]))
-
-    return properties
-
-def getClassesAndEntitiesv1(graph) -> dict:
-    q = """
-    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-    SELECT ?s ?ls ?ds ?c ?lc ?dc
-    WHERE {
-        ?s a ?c
-        
-        #retrieve a possible label or description
-        #for the class or the entity
-        OPTIONAL{
-            ?c rdfs:label ?lc 
-        }
-        OPTIONAL{
-            ?c rdfs:description ?dc
-        }
-        
-        OPTIONAL{
-            ?s rdfs:label ?ls . 
-        }
-        OPTIONAL{
-            ?s rdfs:description ?ds
-        }
-    }
-    """
-    match = graph.query(q)
-
-    classes = list()
-    entities = list()
-
-    for item in match:
-        if item[1] is not None:
-            entities.append(item[1])
-        elif item[2] is not None:
-            entities.append(item[2])
-        else:
-            entities.append(item[0])
-
-
-        if item[4] is not None:
-            classes.append(item[4])
-        elif item[5] is not None:
-            classes.append(item[5])
-        else:
-            classes.append(getNameFromUri(item[3]))
-
-
-    return classes, entities    
-
-def getPropertiesv1(graph) -> list:
-    q = """
-    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-    SELECT ?p ?l ?d  
-    WHERE { 
-        ?s ?p ?o .
-        OPTIONAL {
-            ?p rdfs:label ?l
-        }
-        OPTIONAL {
-            ?p rdfs:description ?d
-        }
-    }
-    """
-    match = graph.query(q)
-
-    properties = list()
-
-    for item in match:
-        if item[1] is not None:
-            properties.append(item[1])
-        elif item[2] is not None:
-            properties.append(item[2])
-        else:
-            properties.append(getNameFromUri(item[0]))
-
-    return properties
 
 '''
 @param: dataset, name of the dataset
 @param: file, object of type DirEntry
-@param: dataset_content, dictionary with the dataset content already mined
-@param: f_log, miner error log file
+@param: dataset_content, content of the dataset already mined
+@param: version, version of the parsing (1: labels v1, 2: labels v2)
 @return True if the file is mined, else False
 '''
-def mineFile(dataset:str, file:object, dataset_content:dict, f_log:object, version:int) -> bool: 
-    g = Graph()
+def mineFile(dataset:str, file:object, dataset_content:DatasetContent, version:int) -> bool: 
+    file_size = os.path.getsize(file.path)
 
-    if (os.path.getsize(file.path) / (1024 ** 2)) < FILE_LIMIT_SIZE: 
-        try: 
-            g.parse(file.path)
-
-            #extract all the info
-
-            classes, entities, properties = None
+    started_at = time.time()
 
-            if version == 1:
-                classes, entities = getClassesAndEntitiesv1(g)
-                properties = getPropertiesv1(g)
-            
-            if version == 2:
-                classes, entities = getClassesAndEntitiesv2(g)
-                properties = getPropertiesv2(g)
+    if (file_size / (1024 ** 2)) < FILE_LIMIT_SIZE: 
+        try: 
+            #the same bytes may have already been mined (in this or in another dataset), the hash recorded
+            #by the downloader is used (None if the content of the file cannot be shared)
+            digest = extraction_cache.findDigest(file.path, manifest.getFileDigest(dataset, file.name))
+            result = extraction_cache.get(digest) if digest is not None else None
 
-            literals = getLiterals(g)
+            if result is None:
+                #the file is parsed in the supervised worker if the supervision is enabled
+                result = runFile(extractFile, file.path, version)
+                if digest is not None:
+                    extraction_cache.put(digest, result)
 
-            dataset_content["classes"].extend(classes)
-            dataset_content["entities"].extend(entities)
-            dataset_content["literals"].extend(literals)
-            dataset_content["properties"].extend(properties)
+            dataset_content.update(result)
 
-            #free memory
-            del(g)
-            del(classes)
-            del(entities)
-            del(literals)
-            del(properties)
+            del(result)
 
         except rdflib.exceptions.ParserError as e:  
             error = str(e).strip("\n")
-            f_log.write("Dataset: "+dataset+"\nFile: "+file.name+"\nError: "+error+"\n")
+            log.warning(f"Dataset: {dataset}\nFile: {file.name}\nError: {error}\n")
+            manifest.record(STAGE, dataset, STATUS_FAILED, file_name=file.name, size=file_size, started_at=started_at,
+                            finished_at=time.time(), error_class="ParserError", detail=error)
             return False
         except Exception as e :
             error = str(e).strip("\n")
-            f_log.write("Dataset: "+dataset+"\nFile: "+file.name+"\nError: "+error+"\n")
+            log.warning(f"Dataset: {dataset}\nFile: {file.name}\nError: {error}\n")
+            manifest.record(STAGE, dataset, STATUS_FAILED, file_name=file.name, size=file_size, started_at=started_at,
+                            finished_at=time.time(), error_class=type(e).__name__, detail=error)
             return False
     else :
-        f_log.write("Dataset: "+dataset+"\nFile: "+file.name+"\nError: Bigger than "+str(FILE_LIMIT_SIZE)+"\n")
+        log.warning(f"Dataset: {dataset}\nFile: {file.name}\nError: Bigger than {str(FILE_LIMIT_SIZE)}\n")
+        manifest.record(STAGE, dataset, STATUS_FAILED, file_name=file.name, size=file_size, started_at=started_at,
+                        finished_at=time.time(), error_class=ERROR_FILE_TOO_BIG, detail=f"Bigger than {str(FILE_LIMIT_SIZE)}")
         return False
+
+    manifest.record(STAGE, dataset, STATUS_MINED, file_name=file.name, size=file_size, started_at=started_at, finished_at=time.time())
     
     return True
 
 '''
-@param: dataset, object of type DirEntry   
-@param: f_log, error log file
+@param: dataset_path, path to the dataset folder
 @param: resume, boolean used for resume mechanism
 @param: version, version of the parsing (1: labels v1, 2: labels v2)
+@param: output_format, layout of the dataset content file ("json", "terms", "jsonl" or "jsonl.gz")
 '''
-def mineDataset(dataset:object, f_log:object, resume:bool, version:int):
+def mineDataset(dataset_path:str, resume:bool, version:int, output_format:str = "json"):
 
-    #open the dataset metadata file
-    dataset_metadata_file = open(dataset.path+"/dataset_metadata.json", "r", encoding="utf-8")
-    dataset_metadata = json.load(dataset_metadata_file, strict = False)
-    dataset_metadata_file.close()
+    dataset = os.path.basename(dataset_path)
 
-    #checking for the resume mechanism
-    if "mined_rdflibhr" in dataset_metadata.keys():
-        if dataset_metadata["mined_rdflibhr"] and resume:
-            return 
+    #checking for the resume mechanism (the datasets in the completion index of the manifest are
+    #not even scheduled, the metadata key is read for the datasets mined before the index)
+    if resume and getMetadataValue(dataset_path, "mined_rdflibhr", False):
+        manifest.record(STAGE, dataset, STATUS_COMPLETED, finished_at=time.time())
+        return
 
-    dataset_content = dict()
+    #every distinct term is stored once, the fields keep the ids of the terms
+    dataset_content = DatasetContent()
 
-    dataset_content["classes"] = list()
-    dataset_content["entities"] = list()
-    dataset_content["literals"] = list()
-    dataset_content["properties"] = list()
-
-    #print("Mining dataset: "+dataset.name)
+    #print("Mining dataset: "+dataset)
 
     mined_files = list()
 
@@ -280,7 +144,7 @@ def mineDataset(dataset:object, f_log:object, resume:bool, version:int):
     #versions but with different extensions of the same file
 
     files_group = dict()
-    for file in os.scandir(dataset.path):
+    for file in os.scandir(dataset_path):
         file_extension = pathlib.Path(file.path).suffix
         
         if file_extension in RDF_SUFFIXES:
@@ -297,33 +161,61 @@ def mineDataset(dataset:object, f_log:object, resume:bool, version:int):
     #in the list
     for file_name in files_group.keys():
         for file in files_group[file_name]:
-            if mineFile(dataset.name, file, dataset_content, f_log, version):
+            if mineFile(dataset, file, dataset_content, version):
                 mined_files.append(file.name) 
                 break
 
-    json_serial = json.dumps(dataset_content, indent=4, ensure_ascii=False)
+    #writing the file of the content
+    dataset_content.write(dataset_path+"/dataset_content_rdflibhr", output_format)
 
-    #writing the json file of the content
-    with open(dataset.path+"/dataset_content_rdflibhr.json", "w", encoding="utf-8") as dataset_content_file:
-        dataset_content_file.write(json_serial)
+    #update the dataset metadata with the mining information (append-only record, the metadata file is not rewritten)
+    appendRecord(dataset_path, {"mined_rdflibhr": True, "mined_files_rdflibhr": mined_files})
 
-    dataset_content_file.close()
-    del json_serial
-    del dataset_content
+    #stage completion index used by the resume mechanism
+    manifest.record(STAGE, dataset, STATUS_COMPLETED, files=len(mined_files), finished_at=time.time())
 
-    #update the dataset_metadata json file with the mining information
-    dataset_metadata["mined_rdflibhr"] = True
-    dataset_metadata["mined_files_rdflibhr"] = mined_files
+    #the term frequencies of the dataset are added to the global term index (if it is built) after the dataset is
+    #recorded as completed: an error of the index (e.g. a lock timeout) is logged and the dataset is not mined again
+    if term_index is not None:
+        try:
+            term_index.addDataset(STAGE, dataset, dataset_content)
+        except Exception as e:
+            log.warning(f"Dataset: {dataset}\nTerm index error: {e}\n")
 
-    json_serial = json.dumps(dataset_metadata, indent=4, ensure_ascii=False)
+'''
+Opening of the global term frequency index, that is built only on request (the index module and numpy are
+imported only when the index is built)
 
-    #writing the json file of the content
-    with open(dataset.path+"/dataset_metadata.json", "w", encoding="utf-8") as dataset_metadata_file:
-        dataset_metadata_file.write(json_serial)
-    
-    dataset_metadata_file.close()
-    del json_serial
-    del dataset_metadata
+@param: term_index_path, path to the global term frequency index, None if the index is not built
+@return the term index, None if the index is not built
+'''
+def openTermIndex(term_index_path:str):
+    if term_index_path is None:
+        return None
+
+    from common.term_index import TermIndex
+    return TermIndex(term_index_path)
+
+'''
+Initialization of the worker processes of the parallel mining
+
+@param: manifest_path, path to the crawl manifest
+@param: term_index_path, path to the global term frequency index (None if the index is not built)
+@param: cache_path, path to the extraction cache directory
+@param: cache_stage, name of the extraction cache stage of the parsing version
+@param: supervision, settings of the file supervision (timeout, memory limit, recycle after)
+'''
+def initWorker(manifest_path:str, term_index_path:str, cache_path:str, cache_stage:str, supervision:tuple):
+    global log, manifest, term_index, extraction_cache
+
+    logging.getLogger("rdflib").setLevel(logging.ERROR)
+    log = logging.getLogger("rdflib_miner")
+
+    manifest = Manifest(manifest_path)
+    term_index = openTermIndex(term_index_path)
+    extraction_cache = ExtractionCache(cache_path, cache_stage, manifest.getSharedContents())
+
+    configureSupervisor(*supervision)
 
 #3 ore e 40 + 5 ore e 48 min + 4 ore 45 min + 4 ore
 
@@ -346,7 +238,56 @@ if __name__ == "__main__":
         action="store_true",
 		help="Add if you want to resume the parsing process"
     )
-    args = parser.parse_args()                                                                            
+    parser.add_argument(
+        "--manifest",
+        type=str,
+        help="Path to the crawl manifest (default: acordar_manifest.sqlite next to the datasets folder)",
+    )
+    parser.add_argument(
+        "--term-index",
+        type=str,
+        help="Path to the global term frequency index where the term counts of every mined dataset are added (default: no index, the dataset content files can be indexed later with the build command of term_index.py)",
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        help="Path to the extraction cache directory (default: acordar_extraction_cache next to the datasets folder)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes that mine the datasets in parallel (default 1)",
+    )
+    parser.add_argument(
+        "--memory-limit",
+        type=int,
+        help="Maximum memory in MB of every mining process (default: no limit)",
+    )
+    parser.add_argument(
+        "--file-timeout",
+        type=float,
+        help="Maximum time in seconds for the parsing of a file, every file is parsed in a supervised process (default: no limit)",
+    )
+    parser.add_argument(
+        "--file-memory-limit",
+        type=int,
+        help="Maximum RSS in MB of the process that parses a file, every file is parsed in a supervised process (default: no limit)",
+    )
+    parser.add_argument(
+        "--recycle-after",
+        type=int,
+        default=100,
+        help="Number of files after which the supervised parsing process is restarted (default 100)",
+    )
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        choices=["json", "terms", "jsonl", "jsonl.gz"],
+        default="json",
+        help="Layout of the dataset content file: \"json\" (lists of strings), \"terms\" (term dictionary with the term counts, dataset_content_*.terms.json) or \"jsonl\" / \"jsonl.gz\" (a line for every term, dataset_content_*.jsonl[.gz])",
+    )
+    args = parser.parse_args()
 
     logging.getLogger("rdflib").setLevel(logging.ERROR)
 
@@ -358,13 +299,44 @@ if __name__ == "__main__":
     )
     log = logging.getLogger("rdflib_miner")
 
-    bar = tqdm(total = len(os.listdir(args.datasets_folder)))
-    for dataset in os.scandir(args.datasets_folder):
-        
-        mineDataset(dataset, args.resume, args.version)
-        bar.update(1)
+    #supervision of the parsing of every file
+    supervision = (args.file_timeout, args.file_memory_limit, args.recycle_after)
+    configureSupervisor(*supervision)
 
+    manifest_path = args.manifest or getDefaultManifestPath(args.datasets_folder)
+    term_index_path = args.term_index
+    cache_path = args.cache or getDefaultCachePath(args.datasets_folder)
 
+    #the results of the two versions of the parsing are cached separately
+    cache_stage = f"{STAGE}-v{EXTRACTOR_VERSION}-labels{args.version}"
 
+    global manifest
+    manifest = Manifest(manifest_path)
 
-    
+    global term_index
+    term_index = openTermIndex(term_index_path)
+
+    global extraction_cache
+    extraction_cache = ExtractionCache(cache_path, cache_stage, manifest.getSharedContents())
+
+    dataset_paths = [dataset.path for dataset in os.scandir(args.datasets_folder)]
+
+    if args.resume:
+        #the datasets already mined are skipped with the completion index of the manifest, without reading their metadata
+        completed_datasets = manifest.getCompleted(STAGE)
+        dataset_paths = [dataset_path for dataset_path in dataset_paths if getDatasetId(os.path.basename(dataset_path)) not in completed_datasets]
+
+    tasks = [(dataset_path, args.resume, args.version, args.output_format) for dataset_path in dataset_paths]
+    sizes = [getDatasetSize(dataset_path) for dataset_path in dataset_paths]
+
+    bar = tqdm(total = len(tasks))
+    failed_tasks = mineParallel(mineDataset, tasks, args.workers, initWorker, (manifest_path, term_index_path, cache_path, cache_stage, supervision), args.memory_limit, 
+                 sizes, lambda task: bar.update(1))
+
+    manifest.close()
+    if term_index is not None:
+        term_index.close()
+    extraction_cache.close()
+
+    #the datasets that raised an error or crashed their worker are in the log file
+    exitOnFailures(failed_tasks)
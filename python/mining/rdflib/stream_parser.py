@@ -0,0 +1,69 @@
+"""
+Streaming parsing of the RDF/XML files, without building an in-memory rdflib Graph.
+
+The rdflib SAX handler of the XML syntax is driven directly, with the sink (e.g. a TripleScanner) in place of
+the Graph store, and every parsed triple is sent to the sink as soon as it is parsed. The memory used by the
+parser does not depend on the file size (only the blank node identifiers are kept), so these files can be
+mined completely also when they are bigger than the size limit of the Graph parsing.
+
+The N-Triples and N-Quads files are not parsed here: they are scanned line by line by the TripleScanner
+(scanLines), at any size.
+
+Differently from the Graph parsing, a triple that is repeated in the file is sent to the sink every time.
+"""
+
+from rdflib.util import guess_format
+from rdflib.parser import create_input_source
+from rdflib.plugins.parsers.rdfxml import create_parser
+
+#formats that can be parsed in streaming
+STREAMING_FORMATS = ["xml"]
+
+"""
+@param: file_path, path to the RDF file
+@return rdflib name of the format of the file (guessed from the file suffix), None if unknown
+"""
+def getFormat(file_path: str) -> str:
+    return guess_format(file_path)
+
+"""
+@param: file_path, path to the RDF file
+@return True if the file can be parsed in streaming
+"""
+def isStreamable(file_path: str) -> bool:
+    return getFormat(file_path) in STREAMING_FORMATS
+
+
+'''
+Store used by the rdflib RDF/XML SAX handler, that forwards the triples to the sink
+'''
+class XMLStreamStore:
+
+    """
+    @param: sink, object with an add((s, p, o)) method
+    """
+    def __init__(self, sink):
+        self.sink = sink
+
+    def add(self, triple: tuple):
+        self.sink.add(triple)
+
+    #the namespace prefixes are not needed for the extraction
+    def bind(self, prefix, namespace, override=True, replace=False):
+        pass
+
+"""
+@param: file_path, path to the RDF file
+@param: sink, object with an add((s, p, o)) method (e.g. a TripleScanner)
+"""
+def streamFile(file_path: str, sink):
+    rdf_format = getFormat(file_path)
+
+    if rdf_format == "xml":
+        source = create_input_source(location=file_path, format="xml")
+        try:
+            create_parser(source, XMLStreamStore(sink)).parse(source)
+        finally:
+            source.close()
+    else:
+        raise ValueError(f"The format {rdf_format} cannot be parsed in streaming")
@@ -0,0 +1,123 @@
+"""
+Single pass extraction of the classes, entities, literals and properties of a RDF file.
+
+The TripleScanner classifies every triple as soon as it sees it, so the extraction needs only one scan
+of the graph (instead of one SPARQL query for every list) and the results are never materialized as
+SPARQL result rows. The scanner can consume:
+* all the triples of a parsed rdflib Graph, with scan()
+* the triples produced by a rdflib parser, used directly as the parser sink with add()
+* the lines of a N-Triples or N-Quads file, with scanLines(), without building the rdflib terms (the terms
+  are the strings of the scanner of common/ntriples_scanner.py, the literals with a datatype are
+  normalized by rdflib as in the parsed graphs, the blank nodes keep their label in the file)
+
+The produced lists are the same of the SPARQL queries used by the original extractor:
+* classes and entities: object and subject of every (?s rdf:type ?class) triple
+* literals: lexical form of every literal object
+* properties: predicate of every triple
+"""
+
+import os
+import sys
+from rdflib import Graph, Literal, URIRef
+from rdflib.namespace import RDF, XSD
+
+#the common modules are shared by all the phases
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "../.."))
+from common.ntriples_scanner import scanTriples, splitLiteral, getIRI, RDF_TYPE, IRI, BNODE, LITERAL
+
+"""
+@param: literal, literal term of a N-Triples line
+@return string of the rdflib Literal of the term
+"""
+def getLiteralString(literal: str) -> str:
+    if "\\" not in literal and literal.endswith('"'):
+        return literal[1:-1]
+
+    lexical_form, language, datatype = splitLiteral(literal)
+
+    if datatype is None or datatype == str(XSD.string):
+        return lexical_form
+
+    #the lexical form of the typed literals is normalized by rdflib (e.g. "05"^^xsd:int is "5")
+    return str(Literal(lexical_form, datatype=URIRef(datatype)))
+
+"""
+@param: term, subject or object term of a N-Triples line
+@return string of the rdflib term
+"""
+def getNodeString(term: str) -> str:
+    if term[0] == IRI:
+        return getIRI(term)
+    if term[0] == BNODE:
+        return term[2:]
+    return getLiteralString(term)
+
+
+class TripleScanner:
+
+    def __init__(self):
+        self.classes = list()
+        self.entities = list()
+        self.literals = list()
+        self.properties = list()
+
+    """
+    @param: s, subject of the triple
+    @param: p, predicate of the triple
+    @param: o, object of the triple
+    """
+    def triple(self, s, p, o):
+        if p == RDF.type:
+            self.classes.append(o)
+            self.entities.append(s)
+
+        if isinstance(o, Literal):
+            self.literals.append(str(o))
+
+        self.properties.append(p)
+
+    """
+    @param: triple, (subject, predicate, object) tuple
+    """
+    def add(self, triple: tuple):
+        self.triple(*triple[:3])
+
+    """
+    @param: graph, parsed rdflib Graph
+    """
+    def scan(self, graph: Graph):
+        for s, p, o in graph.triples((None, None, None)):
+            self.triple(s, p, o)
+
+    """
+    @param: file_path, path to the N-Triples or N-Quads file
+    @param: deduplicate, True if a triple repeated in the file is extracted only once (as in a Graph)
+    @param: start, byte offset of the first line to be scanned
+    @param: end, byte offset of the end of the last line to be scanned (None for the end of the file)
+    """
+    def scanLines(self, file_path: str, deduplicate: bool = False, start: int = 0, end: int = None):
+        triples = scanTriples(file_path, start, end)
+
+        if deduplicate:
+            triples = dict.fromkeys(triples)
+
+        for s, p, o in triples:
+            if p == RDF_TYPE:
+                self.classes.append(getNodeString(o))
+                self.entities.append(getNodeString(s))
+
+            if o[0] == LITERAL:
+                self.literals.append(getLiteralString(o))
+
+            self.properties.append(getIRI(p))
+
+    """
+    @return dictionary with the classes, entities, literals and properties lists
+    """
+    def getResult(self) -> dict:
+        return {
+            "classes": self.classes,
+            "entities": self.entities,
+            "literals": self.literals,
+            "properties": self.properties
+        }